@@ -0,0 +1,41 @@
+"""add unique index on payment_links.link_code
+
+Revision ID: 063c6e60eadc
+Revises: 8f17caa4c917
+Create Date: 2026-10-17 14:37:12.201455
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '063c6e60eadc'
+down_revision: Union[str, None] = '8f17caa4c917'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Codes were never checked for collisions (and rows from cf489df4019b all got
+    # 'default_value'), so keep the oldest holder of each code and suffix the rest
+    op.execute("""
+        UPDATE payment_links AS pl
+        SET link_code = pl.link_code || '-' || pl.id,
+            link_url = regexp_replace(pl.link_url, '/pay/[^/]*$', '/pay/' || pl.link_code || '-' || pl.id)
+        FROM (
+            SELECT id, row_number() OVER (PARTITION BY link_code ORDER BY id) AS n
+            FROM payment_links
+        ) AS dup
+        WHERE pl.id = dup.id AND dup.n > 1
+    """)
+    # Build the index without blocking writes on the hottest table
+    with op.get_context().autocommit_block():
+        op.create_index('ix_payment_links_link_code', 'payment_links', ['link_code'], unique=True, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_payment_links_link_code', table_name='payment_links', postgresql_concurrently=True)
@@ -0,0 +1,32 @@
+"""create dashboard_versions table
+
+Revision ID: 2dc44fd27cd9
+Revises: a87583f08084
+Create Date: 2026-10-18 01:16:03.406703
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2dc44fd27cd9'
+down_revision: Union[str, None] = 'a87583f08084'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Users without a row are at version 0; the first write creates it
+    op.create_table(
+        'dashboard_versions',
+        sa.Column('user_id', sa.Integer, sa.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('version', sa.BigInteger, nullable=False, server_default=sa.text('0')),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('now()')),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('dashboard_versions')
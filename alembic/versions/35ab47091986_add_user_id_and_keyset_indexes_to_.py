@@ -0,0 +1,39 @@
+"""add user_id and keyset indexes to transactions
+
+Revision ID: 35ab47091986
+Revises: 063c6e60eadc
+Create Date: 2026-10-17 23:58:46.337944
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '35ab47091986'
+down_revision: Union[str, None] = '063c6e60eadc'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('transactions', sa.Column('user_id', sa.Integer, sa.ForeignKey('users.id', name='transactions_user_id_fkey'), nullable=True))
+    # Transactions whose link was deleted have no owner left and stay NULL
+    op.execute("""
+        UPDATE transactions AS t
+        SET user_id = pl.user_id
+        FROM payment_links AS pl
+        WHERE pl.id = t.payment_link_id AND t.user_id IS NULL
+    """)
+    with op.get_context().autocommit_block():
+        op.create_index('ix_transactions_user_id_created_at_id', 'transactions', ['user_id', 'created_at', 'id'], postgresql_concurrently=True)
+        op.create_index('ix_transactions_payment_link_id_created_at_id', 'transactions', ['payment_link_id', 'created_at', 'id'], postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_transactions_payment_link_id_created_at_id', table_name='transactions', postgresql_concurrently=True)
+        op.drop_index('ix_transactions_user_id_created_at_id', table_name='transactions', postgresql_concurrently=True)
+    op.drop_column('transactions', 'user_id')
@@ -0,0 +1,36 @@
+"""create stripe_events table
+
+Revision ID: 635fa77e3170
+Revises: 35ab47091986
+Create Date: 2026-10-18 00:16:43.206940
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '635fa77e3170'
+down_revision: Union[str, None] = '35ab47091986'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'stripe_events',
+        sa.Column('id', sa.String, primary_key=True),
+        sa.Column('type', sa.String, nullable=False),
+        sa.Column('payload', postgresql.JSONB, nullable=False),
+        sa.Column('received_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('now()')),
+        sa.Column('processed_at', sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index('ix_stripe_events_pending', 'stripe_events', ['received_at'], postgresql_where=sa.text('processed_at IS NULL'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_stripe_events_pending', table_name='stripe_events')
+    op.drop_table('stripe_events')
@@ -0,0 +1,61 @@
+"""create base tables
+
+Revision ID: 711f323af5be
+Revises: 
+Create Date: 2026-10-18 01:04:59.812887
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '711f323af5be'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # The tables as the app used to create them at startup, before the first migration ran.
+    # Databases created that way already have them and count this revision as applied,
+    # since it sits below e5d9dde5c061; it only runs on fresh databases.
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer, primary_key=True, nullable=False),
+        sa.Column('email', sa.String, nullable=False, unique=True),
+        sa.Column('password', sa.String, nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=True), nullable=True, server_default=sa.text('now()')),
+    )
+    op.create_table(
+        'payment_links',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('user_id', sa.Integer, sa.ForeignKey('users.id'), nullable=False),
+        sa.Column('amount', sa.Float, nullable=False),
+        sa.Column('currency', sa.String(3), nullable=False),
+        sa.Column('description', sa.Text, nullable=True),
+        sa.Column('expiration_date', sa.DateTime, nullable=True),
+        sa.Column('link_url', sa.String, nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=True, server_default=sa.text('now()')),
+    )
+    op.create_index('ix_payment_links_id', 'payment_links', ['id'])
+    op.create_table(
+        'transactions',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('payment_link_id', sa.Integer, sa.ForeignKey('payment_links.id')),
+        sa.Column('transaction_id', sa.String),
+        sa.Column('status', sa.String),
+        sa.Column('payment_method', sa.String),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('now()')),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('now()')),
+    )
+    op.create_index('ix_transactions_id', 'transactions', ['id'])
+    op.create_index('ix_transactions_transaction_id', 'transactions', ['transaction_id'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_table('transactions')
+    op.drop_table('payment_links')
+    op.drop_table('users')
@@ -0,0 +1,38 @@
+"""add indexes for hot filters
+
+Revision ID: 7291d8dec2e2
+Revises: 2dc44fd27cd9
+Create Date: 2026-10-18 01:24:44.431878
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7291d8dec2e2'
+down_revision: Union[str, None] = '2dc44fd27cd9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Built without blocking writes; (user_id, currency) also serves lookups on user_id alone
+    with op.get_context().autocommit_block():
+        op.create_index('ix_payment_links_user_id_currency', 'payment_links', ['user_id', 'currency'], postgresql_concurrently=True)
+        op.drop_index('ix_payment_links_user_id', table_name='payment_links', postgresql_concurrently=True)
+        op.create_index('ix_transactions_user_id_status_created_at_id', 'transactions', ['user_id', 'status', 'created_at', 'id'], postgresql_concurrently=True)
+        op.create_index(
+            'ix_transactions_success_payment_link_id', 'transactions', ['payment_link_id'],
+            postgresql_where=sa.text("status = 'success'"), postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_transactions_success_payment_link_id', table_name='transactions', postgresql_concurrently=True)
+        op.drop_index('ix_transactions_user_id_status_created_at_id', table_name='transactions', postgresql_concurrently=True)
+        op.create_index('ix_payment_links_user_id', 'payment_links', ['user_id'], postgresql_concurrently=True)
+        op.drop_index('ix_payment_links_user_id_currency', table_name='payment_links', postgresql_concurrently=True)
@@ -0,0 +1,27 @@
+"""add payment_link_code_seq
+
+Revision ID: 7f6d09817147
+Revises: feb4ccf59ecf
+Create Date: 2026-10-18 00:43:01.802494
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7f6d09817147'
+down_revision: Union[str, None] = 'feb4ccf59ecf'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Link codes are generated from this sequence by services.ids.encode_link_code
+    op.execute(sa.schema.CreateSequence(sa.Sequence('payment_link_code_seq')))
+
+
+def downgrade() -> None:
+    op.execute(sa.schema.DropSequence(sa.Sequence('payment_link_code_seq')))
@@ -0,0 +1,49 @@
+"""create link_stats table
+
+Revision ID: 8f17caa4c917
+Revises: cf489df4019b
+Create Date: 2026-10-17 10:02:41.512307
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f17caa4c917'
+down_revision: Union[str, None] = 'cf489df4019b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'link_stats',
+        sa.Column('payment_link_id', sa.Integer, sa.ForeignKey('payment_links.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('total_transactions', sa.Integer, nullable=False, server_default=sa.text('0')),
+        sa.Column('successful_transactions', sa.Integer, nullable=False, server_default=sa.text('0')),
+        sa.Column('failed_transactions', sa.Integer, nullable=False, server_default=sa.text('0')),
+        sa.Column('success_amount', sa.Float, nullable=False, server_default=sa.text('0')),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('now()')),
+    )
+    op.create_index('ix_payment_links_user_id', 'payment_links', ['user_id'])
+
+    # Backfill from existing transactions; `python -m scripts.reconcile_rollups` repeats this at any time
+    op.execute("""
+        INSERT INTO link_stats (payment_link_id, total_transactions, successful_transactions, failed_transactions, success_amount)
+        SELECT pl.id,
+               count(t.id),
+               count(t.id) FILTER (WHERE t.status = 'success'),
+               count(t.id) FILTER (WHERE t.status = 'failure'),
+               coalesce(sum(pl.amount) FILTER (WHERE t.status = 'success'), 0)
+        FROM payment_links pl
+        LEFT JOIN transactions t ON t.payment_link_id = pl.id
+        GROUP BY pl.id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_payment_links_user_id', table_name='payment_links')
+    op.drop_table('link_stats')
@@ -0,0 +1,48 @@
+"""create daily_earnings table
+
+Revision ID: a87583f08084
+Revises: 7f6d09817147
+Create Date: 2026-10-18 01:12:09.339784
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a87583f08084'
+down_revision: Union[str, None] = '7f6d09817147'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'daily_earnings',
+        sa.Column('user_id', sa.Integer, sa.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('day', sa.Date, primary_key=True),
+        sa.Column('currency', sa.String(3), primary_key=True),
+        sa.Column('amount', sa.Float, nullable=False, server_default=sa.text('0')),
+        sa.Column('transactions', sa.Integer, nullable=False, server_default=sa.text('0')),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('now()')),
+    )
+
+    # Backfill from existing transactions; `python -m scripts.reconcile_rollups` repeats this at any time
+    op.execute("""
+        INSERT INTO daily_earnings (user_id, day, currency, amount, transactions)
+        SELECT pl.user_id,
+               (t.created_at AT TIME ZONE 'UTC')::date,
+               pl.currency,
+               sum(pl.amount),
+               count(t.id)
+        FROM transactions t
+        JOIN payment_links pl ON pl.id = t.payment_link_id
+        WHERE t.status = 'success'
+        GROUP BY 1, 2, 3
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('daily_earnings')
@@ -19,12 +19,12 @@ depends_on: Union[str, Sequence[str], None] = None
 
 
 def upgrade() -> None:
-    # ### commands auto generated by Alembic - please adjust! ###
-    op.add_column('payment_links', sa.Column('link_code', sa.String, nullable=False, server_default='default_value'))
-    # ### end Alembic commands ###
+    # 0a277c807c27 already adds link_code; only databases that missed it need it here
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('payment_links')}
+    if 'link_code' not in columns:
+        op.add_column('payment_links', sa.Column('link_code', sa.String, nullable=False, server_default='default_value'))
 
 
 def downgrade() -> None:
-    # ### commands auto generated by Alembic - please adjust! ###
-    op.drop_column('payment_links', 'link_code')
-    # ### end Alembic commands ###
+    # link_code is dropped by 0a277c807c27, which added it first
+    pass
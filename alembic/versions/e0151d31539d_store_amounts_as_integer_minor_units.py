@@ -0,0 +1,85 @@
+"""store amounts as integer minor units
+
+Revision ID: e0151d31539d
+Revises: 7291d8dec2e2
+Create Date: 2026-10-18 01:30:22.184627
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e0151d31539d'
+down_revision: Union[str, None] = '7291d8dec2e2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Copied from app/money.py as it stood for this revision, so the migration never changes under it
+EXPONENTS = {
+    "BIF": 0, "CLP": 0, "DJF": 0, "GNF": 0, "ISK": 0, "JPY": 0, "KMF": 0, "KRW": 0,
+    "PYG": 0, "RWF": 0, "UGX": 0, "VND": 0, "VUV": 0, "XAF": 0, "XOF": 0, "XPF": 0,
+    "BHD": 3, "IQD": 3, "JOD": 3, "KWD": 3, "LYD": 3, "OMR": 3, "TND": 3,
+}
+
+
+def scale(currency_column: str) -> str:
+    """SQL for 10 ^ the currency's exponent, as numeric"""
+    whens = " ".join(f"WHEN '{code}' THEN {places}" for code, places in EXPONENTS.items())
+    return f"(10::numeric ^ CASE upper({currency_column}) {whens} ELSE 2 END)"
+
+
+def upgrade() -> None:
+    op.add_column('payment_links', sa.Column('amount_minor', sa.BigInteger, nullable=True))
+    # through numeric, so 19.99 stored as 19.989999... still becomes 1999
+    op.execute(f"UPDATE payment_links SET amount_minor = round(amount::numeric * {scale('currency')})")
+    op.alter_column('payment_links', 'amount_minor', nullable=False)
+    op.drop_column('payment_links', 'amount')
+
+    # The rollups only ever hold sums of link amounts, so recompute them exactly rather than rounding float sums
+    op.add_column('link_stats', sa.Column('success_amount_minor', sa.BigInteger, nullable=False, server_default=sa.text('0')))
+    op.execute("""
+        UPDATE link_stats AS ls
+        SET success_amount_minor = pl.amount_minor * ls.successful_transactions
+        FROM payment_links AS pl
+        WHERE pl.id = ls.payment_link_id
+    """)
+    op.drop_column('link_stats', 'success_amount')
+
+    op.add_column('daily_earnings', sa.Column('amount_minor', sa.BigInteger, nullable=False, server_default=sa.text('0')))
+    op.execute("""
+        UPDATE daily_earnings AS de
+        SET amount_minor = totals.amount_minor
+        FROM (
+            SELECT pl.user_id, (t.created_at AT TIME ZONE 'UTC')::date AS day, pl.currency, sum(pl.amount_minor) AS amount_minor
+            FROM transactions t
+            JOIN payment_links pl ON pl.id = t.payment_link_id
+            WHERE t.status = 'success'
+            GROUP BY 1, 2, 3
+        ) AS totals
+        WHERE (de.user_id, de.day, de.currency) = (totals.user_id, totals.day, totals.currency)
+    """)
+    op.drop_column('daily_earnings', 'amount')
+
+
+def downgrade() -> None:
+    op.add_column('daily_earnings', sa.Column('amount', sa.Float, nullable=False, server_default=sa.text('0')))
+    op.execute(f"UPDATE daily_earnings SET amount = amount_minor / {scale('currency')}")
+    op.drop_column('daily_earnings', 'amount_minor')
+
+    op.add_column('link_stats', sa.Column('success_amount', sa.Float, nullable=False, server_default=sa.text('0')))
+    op.execute(f"""
+        UPDATE link_stats AS ls
+        SET success_amount = ls.success_amount_minor / {scale('pl.currency')}
+        FROM payment_links AS pl
+        WHERE pl.id = ls.payment_link_id
+    """)
+    op.drop_column('link_stats', 'success_amount_minor')
+
+    op.add_column('payment_links', sa.Column('amount', sa.Float, nullable=True))
+    op.execute(f"UPDATE payment_links SET amount = amount_minor / {scale('currency')}")
+    op.alter_column('payment_links', 'amount', nullable=False)
+    op.drop_column('payment_links', 'amount_minor')
@@ -1,7 +1,7 @@
 """create payment_links table
 
 Revision ID: e5d9dde5c061
-Revises: 
+Revises: 711f323af5be
 Create Date: 2024-10-23 18:34:38.139484
 
 """
@@ -13,7 +13,7 @@ from sqlalchemy.dialects import postgresql
 
 # revision identifiers, used by Alembic.
 revision: str = 'e5d9dde5c061'
-down_revision: Union[str, None] = None
+down_revision: Union[str, None] = '711f323af5be'
 branch_labels: Union[str, Sequence[str], None] = None
 depends_on: Union[str, Sequence[str], None] = None
 
@@ -0,0 +1,26 @@
+"""add outcome to stripe_events
+
+Revision ID: feb4ccf59ecf
+Revises: 635fa77e3170
+Create Date: 2026-10-18 00:19:47.682333
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'feb4ccf59ecf'
+down_revision: Union[str, None] = '635fa77e3170'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('stripe_events', sa.Column('outcome', sa.String, nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('stripe_events', 'outcome')
@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -14,6 +15,100 @@ class Settings(BaseSettings):
     stripe_key: str
     stripe_webhook_secret: str
     env: str
+    # "memory" or "postgres" (fans out across gunicorn workers); gunicorn.conf.py defaults it to
+    # postgres when running more than one worker
+    pubsub_backend: str = "memory"
+
+    # connection pool, per worker process
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    # behind PgBouncer (transaction pooling): no app-side pool and no server-side prepared statements
+    db_pgbouncer: bool = False
+    # password hashing runs in its own process pool; requests beyond max_pending get a 503
+    bcrypt_rounds: int = 12
+    hash_workers: int = 2
+    hash_max_pending: int = 32
+
+    # verified JWT -> principal cache; entries never outlive the token's own expiry
+    token_cache_size: int = 10000
+    token_cache_ttl: int = 300
+
+    # shared cache (redis://...) used by cache backends set to "redis"
+    cache_url: Optional[str] = None
+    # public link_code -> payload cache; "redis" keeps gunicorn workers coherent
+    link_cache_backend: str = "memory"
+    link_cache_size: int = 10000
+    link_cache_ttl: int = 60
+    # per-user dashboard snapshots; each is served only while the user's dashboard version is unchanged
+    dashboard_cache_backend: str = "memory"
+    dashboard_cache_size: int = 10000
+    dashboard_cache_ttl: int = 300
+    # dashboard sections run concurrently, each on its own pooled connection; a section slower than
+    # the timeout is left out of the response rather than holding up the others
+    dashboard_parallel_sections: bool = True
+    dashboard_section_timeout: float = 2.0
+
+    # GET /api/payments/transactions page size and the most a client may ask for
+    transactions_page_size: int = 50
+    transactions_page_max: int = 200
+    # rows fetched per round trip by the streaming export's server-side cursor
+    export_batch_size: int = 1000
+
+    # webhook events are acked on receipt and applied by a background worker in batches
+    webhook_batch_size: int = 100
+    # once woken, the worker collects events for up to this long before applying them
+    webhook_batch_window_ms: float = 5
+    # how often the worker looks for events left behind, e.g. by a worker that died mid-batch
+    webhook_poll_interval: float = 5.0
+
+    # Stripe API: per-call timeout, and a circuit breaker that answers 503 while Stripe keeps failing
+    stripe_api_base: str = "https://api.stripe.com"
+    stripe_timeout: float = 10
+    stripe_breaker_failures: int = 5
+    stripe_breaker_reset: float = 30
+    # checkout sessions created ahead for each of the most recently opened links (0 disables)
+    stripe_session_prefetch: int = 0
+    stripe_session_prefetch_links: int = 1000
+    # lifetime of pre-created sessions; Stripe accepts 30 minutes to 24 hours
+    stripe_session_ttl: int = 3600
+
+    # link codes are a keyed permutation of a sequence: set the key once per deployment and never change it
+    link_code_key: str = "paylinker-link-codes"
+    # sequence values each worker reserves per round trip
+    link_code_block_size: int = 100
+    # POST /api/payment-links/bulk: most items per request, and items per multi-row INSERT;
+    # batches larger than one chunk are streamed back as NDJSON, committing chunk by chunk
+    payment_links_bulk_max: int = 10000
+    payment_links_bulk_chunk: int = 500
+
+    # root log level, and the fraction of records below WARNING that are kept
+    log_level: str = "INFO"
+    log_sample_rate: float = 1.0
+    # records are encoded and written by a background thread from a queue of this size, and
+    # dropped while it is full (0 writes synchronously); "orjson" needs the orjson package
+    log_queue_size: int = 10000
+    log_encoder: str = "json"
+
+    # Prometheus metrics at /metrics (see gunicorn.conf.py for aggregation across workers); when
+    # off, nothing is recorded and /metrics answers 404
+    metrics_enabled: bool = True
+
+    # per-request timing, SQL statement counts and a correlation id (X-Request-ID) in the access log
+    instrumentation_enabled: bool = True
+    # requests slower than this, or sending more statements, are logged as warnings
+    request_budget_ms: float = 500
+    request_query_budget: int = 20
+    # fraction of requests run under cProfile (0 disables); profiles of over-budget ones are kept
+    profile_sample_rate: float = 0.0
+    profile_dir: str = "profiles"
+    profile_keep: int = 50
+
+    # when set, /internal endpoints and /metrics require a matching X-Internal-Key header;
+    # when unset they answer 404, except with env "local" or "test"
+    internal_api_key: Optional[str] = None
 
     model_config = SettingsConfigDict(env_file=".env")
 
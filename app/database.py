@@ -1,23 +1,69 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from .config import Settings
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
+from uuid import uuid4
+from .config import settings
+from .services import instrumentation, metrics, pool_metrics
 from sqlalchemy.orm import declarative_base
 
-settings = Settings()
+DATABASE_ADDRESS = f"{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}"
 
 if settings.env == "local":
-    SQLALCHEMY_DATABASE_URL = f"postgresql://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}"
+    SQLALCHEMY_DATABASE_URL = f"postgresql://{DATABASE_ADDRESS}"
+    ASYNC_SQLALCHEMY_DATABASE_URL = f"postgresql+asyncpg://{DATABASE_ADDRESS}"
 else:
-    SQLALCHEMY_DATABASE_URL = f"postgresql://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}?sslmode=require"
+    SQLALCHEMY_DATABASE_URL = f"postgresql://{DATABASE_ADDRESS}?sslmode=require"
+    ASYNC_SQLALCHEMY_DATABASE_URL = f"postgresql+asyncpg://{DATABASE_ADDRESS}?ssl=require"
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+
+def pool_options():
+    if settings.db_pgbouncer:
+        # PgBouncer owns the pooling; holding idle connections here would only pin its server slots
+        return {"poolclass": NullPool}
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+
+
+def async_connect_args():
+    if not settings.db_pgbouncer:
+        return {}
+    # Transaction pooling may hand each statement a different server connection,
+    # so asyncpg must not cache prepared statements or reuse their names
+    return {
+        "statement_cache_size": 0,
+        "prepared_statement_cache_size": 0,
+        "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+    }
+
+
+# The sync engine serves Alembic, maintenance scripts and benchmarks; request handlers use the async one
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **pool_options())
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+async_pool_options = pool_options()
+if "poolclass" not in async_pool_options:
+    async_pool_options["poolclass"] = pool_metrics.InstrumentedAsyncQueuePool
+async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, connect_args=async_connect_args(), **async_pool_options)
+pool_metrics.instrument(async_engine.sync_engine)
+metrics.db_pool_size.set(0 if settings.db_pgbouncer else settings.db_pool_size)
+instrumentation.instrument(async_engine.sync_engine)
+# Objects stay usable after commit, so handlers never trigger implicit (blocking) refreshes
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+
+def get_session_factory():
+    """For handlers that need sessions outliving the dependency scope, e.g. while a StreamingResponse is still being sent"""
+    return AsyncSessionLocal
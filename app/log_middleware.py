@@ -1,12 +1,89 @@
-from starlette.middleware.base import BaseHTTPMiddleware
+import time
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import URL, Headers, MutableHeaders
+from .config import settings
 from .logger import logger
+from .services import metrics
+from .services.instrumentation import REQUEST_ID_HEADER, RequestStats, current_request, profiler, request_id_from
 
-class LogMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request, call_next):
-        response = await call_next(request)
-        logger.info("Incoming Request", extra={
-            "req": {"method": request.method, "url": str(request.url)},
-            "res": {"status_code": response.status_code}
-            },
-        )
-        return response
\ No newline at end of file
+class LogMiddleware:
+    """Access log as plain ASGI middleware: it wraps `send` to see the status instead of
+    running the app in a separate task and copying the body through a stream, as
+    BaseHTTPMiddleware does. Requests are timed until the last body chunk is sent."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if not settings.instrumentation_enabled:
+            await self.plain(scope, receive, send)
+            return
+
+        stats = RequestStats(request_id_from(Headers(scope=scope).get(REQUEST_ID_HEADER)))
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                MutableHeaders(scope=message).append(REQUEST_ID_HEADER, stats.request_id)
+            await send(message)
+
+        token = current_request.set(stats)
+        profile = profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = stats.elapsed()
+            if profile is not None:
+                profiler.stop(profile)
+            current_request.reset(token)
+            if settings.metrics_enabled:
+                metrics.observe_request(scope, status_code, elapsed)
+            await self.log(scope, status_code, stats, elapsed, profile)
+
+    async def plain(self, scope, receive, send):
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if settings.metrics_enabled:
+                metrics.observe_request(scope, status_code, time.perf_counter() - started)
+            logger.info("Incoming Request", extra={
+                "req": {"method": scope["method"], "url": str(URL(scope=scope))},
+                "res": {"status_code": status_code}
+                },
+            )
+
+    async def log(self, scope, status_code, stats, elapsed, profile):
+        exceeded = stats.over_budget(elapsed)
+        res = {
+            "status_code": status_code,
+            "duration_ms": round(elapsed * 1000, 2),
+            "sql_count": stats.sql_count,
+            "sql_ms": round(stats.sql_seconds * 1000, 2),
+        }
+        if exceeded:
+            res["over_budget"] = exceeded
+            if profile is not None:
+                res["profile"] = await run_in_threadpool(profiler.save, profile, f"{stats.request_id}-{scope['method']}-{scope['path']}")
+        extra = {
+            "request_id": stats.request_id,
+            "req": {"method": scope["method"], "url": str(URL(scope=scope))},
+            "res": res,
+        }
+        if exceeded:
+            logger.warning("Request over budget", extra=extra)
+        else:
+            logger.info("Incoming Request", extra=extra)
@@ -1,26 +1,106 @@
+import atexit
 import json
 import logging
+import queue
+import random
 from logging import Formatter
+from logging.handlers import QueueHandler, QueueListener
+from .config import settings
+from .services.instrumentation import RequestIdFilter
 
 class JsonFormatter(Formatter):
-    def __init__(self):
+    def __init__(self, encoder: str = "json"):
         super(JsonFormatter, self).__init__()
-    
+        self.dumps = json_encoder(encoder)
+
     def format(self, record):
         json_record = {}
         json_record["message"] = record.getMessage()
+        if "request_id" in record.__dict__:
+            json_record["request_id"] = record.__dict__["request_id"]
         if "req" in record.__dict__:
             json_record["req"] = record.__dict__["req"]
         if "res" in record.__dict__:
             json_record["res"] = record.__dict__["res"]
         if record.levelno == logging.ERROR and record.exc_info:
             json_record['err'] = self.formatException(record.exc_info)
-        return json.dumps(json_record)
+        return self.dumps(json_record)
+
+def json_encoder(name: str):
+    if name == "orjson":
+        try:
+            import orjson
+        except ImportError:
+            raise RuntimeError("The orjson log encoder requires the 'orjson' package (pip install orjson)")
+        return lambda obj: orjson.dumps(obj, default=str).decode()
+    if name != "json":
+        raise ValueError(f"Unknown log encoder {name!r}, expected 'json' or 'orjson'")
+    return json.dumps
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of records below WARNING; warnings and errors always pass"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Hands records to a bounded queue and drops them when it is full instead of blocking the caller.
+
+    Only the message is interpolated here, since the arguments may change once the caller moves
+    on; JSON encoding, tracebacks and the write to stderr happen on the listener's thread. The
+    queue never leaves the process, so unlike the stock QueueHandler the record is not copied
+    or stripped of exc_info.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._reported = 0
+
+    def prepare(self, record):
+        record.msg, record.args = record.getMessage(), None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self.dropped > self._reported:
+            # Tell the reader once there is room again; if this one is dropped too it is reported later
+            notice = logging.LogRecord("app.logger", logging.WARNING, __file__, 0, "Dropped %d log records, the log queue was full", (self.dropped - self._reported,), None)
+            try:
+                self.queue.put_nowait(self.prepare(notice))
+                self._reported = self.dropped
+            except queue.Full:
+                pass
+
+    def stats(self):
+        return {"queued": self.queue.qsize(), "capacity": self.queue.maxsize, "dropped": self.dropped}
+
 
 logger = logging.root
-handler = logging.StreamHandler()
-handler.setFormatter(JsonFormatter())
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(JsonFormatter(settings.log_encoder))
+handler = stream_handler
+listener = None
+if settings.log_queue_size:
+    # Formatting and writing happen on a background thread; the request path only enqueues
+    handler = DroppingQueueHandler(queue.Queue(settings.log_queue_size))
+    listener = QueueListener(handler.queue, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+handler.addFilter(RequestIdFilter())
+if settings.log_sample_rate < 1:
+    handler.addFilter(SamplingFilter(settings.log_sample_rate))
 logger.handlers = [handler]
-logger.setLevel(logging.DEBUG)
+logger.setLevel(settings.log_level.upper())
 
-logging.getLogger('uvicorn.access').disabled = True
\ No newline at end of file
+logging.getLogger('uvicorn.access').disabled = True
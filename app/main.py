@@ -1,19 +1,23 @@
 from fastapi import FastAPI, Body, status, HTTPException, Response, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse
 from pydantic import BaseModel
 from typing import Optional
+from contextlib import asynccontextmanager
+from functools import lru_cache
 from datetime import datetime, timedelta
 from random import randrange
 from . import models
-from .database import engine, get_db
-from .router import auth, payment_links, payments, dashboard
+from .database import get_db
+from .router import auth, payment_links, payments, dashboard, internal, metrics
 import os
-import stripe
 from .config import settings
 from .logger import logger
 from .log_middleware import LogMiddleware
+from .services.pubsub import earnings_hub
+from .services.hashing import hashing_pool, HashingOverloaded
+from .services.webhooks import webhook_worker
+from .services.stripe_checkout import stripe_checkout, StripeUnavailable
 
 
 
@@ -26,7 +30,19 @@ from .log_middleware import LogMiddleware
 #     origins = ["*"]
 origins = ['*']
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await earnings_hub.start()
+    await webhook_worker.start()
+    yield
+    await webhook_worker.stop()
+    await earnings_hub.stop()
+    await stripe_checkout.close()
+    hashing_pool.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -35,13 +51,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 app.add_middleware(LogMiddleware)
-templates = Jinja2Templates(directory="templates")
-stripe.api_key = settings.stripe_key
-models.Base.metadata.create_all(bind=engine)
+# The schema is managed by Alembic (`alembic upgrade head`); workers never run DDL
+
+
+@lru_cache
+def get_templates():
+    # jinja2 is only needed by the HTML pages, so it is not imported at worker boot
+    from fastapi.templating import Jinja2Templates
+    return Jinja2Templates(directory="templates")
+
+
+@app.exception_handler(HashingOverloaded)
+async def hashing_overloaded_handler(request: Request, exc: HashingOverloaded):
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"detail": "Too many authentication requests, try again shortly"}, headers={"Retry-After": "1"})
+
+
+@app.exception_handler(StripeUnavailable)
+async def stripe_unavailable_handler(request: Request, exc: StripeUnavailable):
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"detail": "Payment provider unavailable, try again shortly"}, headers={"Retry-After": str(int(settings.stripe_breaker_reset))})
+
+
 app.include_router(auth.router)
 app.include_router(dashboard.router)
 app.include_router(payment_links.router)
 app.include_router(payments.router)
+app.include_router(internal.router)
+app.include_router(metrics.router)
 
 
 @app.get('/')
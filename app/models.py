@@ -1,8 +1,10 @@
 from .database import Base
-from sqlalchemy import Column, Integer, String, Float, Text, Boolean, column, ForeignKey, DateTime
+from . import money
+from sqlalchemy import BigInteger, Column, Integer, String, Float, Text, Boolean, column, ForeignKey, Date, DateTime, Index, Sequence
 from sqlalchemy.sql.expression import text
 from sqlalchemy.sql.sqltypes import TIMESTAMP
 from sqlalchemy.orm import relationship
+from sqlalchemy.dialects.postgresql import JSONB
 from datetime import datetime
 
 
@@ -14,28 +16,107 @@ class User(Base):
     created_at = Column(TIMESTAMP(timezone=True), nullable=True, server_default=text('now()'))
 
 
+# Source of link codes; each value is turned into a code by services.ids.encode_link_code
+link_code_seq = Sequence('payment_link_code_seq', metadata=Base.metadata)
+
+
 class PaymentLink(Base):
     __tablename__ = "payment_links"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
-    amount = Column(Float, nullable=False)
+    # in the currency's minor unit, e.g. cents; see app/money.py
+    amount_minor = Column(BigInteger, nullable=False)
     currency = Column(String(3), nullable=False)
     description = Column(Text, nullable=True)
     expiration_date = Column(DateTime, nullable=True)
-    link_code = Column(String, nullable=False)
+    link_code = Column(String, nullable=False, unique=True, index=True)
     link_url = Column(String, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=text('now()'), nullable=False)
 
     transactions = relationship('Transaction', back_populates="payment_link")
 
+    # a merchant's links, optionally narrowed to one currency
+    __table_args__ = (
+        Index('ix_payment_links_user_id_currency', 'user_id', 'currency'),
+    )
+
+    def __init__(self, amount=None, **kwargs):
+        # amount needs the currency to convert, which may come later in kwargs
+        super().__init__(**kwargs)
+        if amount is not None:
+            self.amount = amount
+
+    @property
+    def amount(self) -> float:
+        """The amount in major units (e.g. dollars), as the API takes and returns it"""
+        return money.to_major(self.amount_minor, self.currency)
+
+    @amount.setter
+    def amount(self, value):
+        self.amount_minor = money.to_minor(value, self.currency)
+
 class Transaction(Base):
     __tablename__ = "transactions"
     id = Column(Integer, primary_key=True, index=True)
     payment_link_id = Column(Integer, ForeignKey("payment_links.id"))
+    # copied from the payment link so a merchant's history can be paged without joining through every link
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     transaction_id = Column(String, unique=True, index=True)
     status = Column(String) # e.g., success, pending, failure
     payment_method = Column(String) # e.g., credit card, paypal
     created_at = Column(DateTime(timezone=True), server_default=text('now()'), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=text('now()'), nullable=False, onupdate=text('now()'))
 
-    payment_link = relationship('PaymentLink', back_populates="transactions")
\ No newline at end of file
+    payment_link = relationship('PaymentLink', back_populates="transactions")
+
+    # keyset pagination walks these backwards: newest first, id breaking created_at ties
+    __table_args__ = (
+        Index('ix_transactions_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        Index('ix_transactions_payment_link_id_created_at_id', 'payment_link_id', 'created_at', 'id'),
+        # the same walk when the listing is filtered by status
+        Index('ix_transactions_user_id_status_created_at_id', 'user_id', 'status', 'created_at', 'id'),
+        # earnings only ever sum successful transactions, a link at a time
+        Index('ix_transactions_success_payment_link_id', 'payment_link_id', postgresql_where=text("status = 'success'")),
+    )
+
+class LinkStats(Base):
+    __tablename__ = "link_stats"
+    payment_link_id = Column(Integer, ForeignKey("payment_links.id", ondelete="CASCADE"), primary_key=True)
+    total_transactions = Column(Integer, nullable=False, server_default=text('0'))
+    successful_transactions = Column(Integer, nullable=False, server_default=text('0'))
+    failed_transactions = Column(Integer, nullable=False, server_default=text('0'))
+    success_amount_minor = Column(BigInteger, nullable=False, server_default=text('0'))
+    updated_at = Column(DateTime(timezone=True), server_default=text('now()'), nullable=False, onupdate=text('now()'))
+
+class DailyEarnings(Base):
+    """Successful transaction amounts per user, UTC day (of the transaction's created_at) and currency"""
+    __tablename__ = "daily_earnings"
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    currency = Column(String(3), primary_key=True)
+    amount_minor = Column(BigInteger, nullable=False, server_default=text('0'))
+    transactions = Column(Integer, nullable=False, server_default=text('0'))
+    updated_at = Column(DateTime(timezone=True), server_default=text('now()'), nullable=False, onupdate=text('now()'))
+
+class DashboardVersion(Base):
+    """Bumped in the same DB transaction as every write that changes what a user's dashboard shows"""
+    __tablename__ = "dashboard_versions"
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    version = Column(BigInteger, nullable=False, server_default=text('0'))
+    updated_at = Column(DateTime(timezone=True), server_default=text('now()'), nullable=False, onupdate=text('now()'))
+
+class StripeEvent(Base):
+    """Every webhook event accepted, keyed by Stripe's event id so redeliveries are dropped on insert"""
+    __tablename__ = "stripe_events"
+    id = Column(String, primary_key=True)
+    type = Column(String, nullable=False)
+    payload = Column(JSONB, nullable=False)
+    received_at = Column(DateTime(timezone=True), server_default=text('now()'), nullable=False)
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+    # applied, unchanged, not_found, superseded or ignored; set together with processed_at
+    outcome = Column(String, nullable=True)
+
+    # the worker's queue: only events still waiting to be applied are indexed
+    __table_args__ = (
+        Index('ix_stripe_events_pending', 'received_at', postgresql_where=text('processed_at IS NULL')),
+    )
@@ -0,0 +1,46 @@
+"""Exact money amounts.
+
+Amounts are stored and summed as integers in the currency's minor unit (cents for USD,
+yen for JPY, fils for KWD), the same unit Stripe's unit_amount uses. The API still takes
+and returns decimal major-unit numbers; to_minor and to_major convert at that boundary.
+"""
+from decimal import Decimal
+from sqlalchemy import Float, Numeric, case, cast, func, literal
+
+# ISO 4217 currencies whose minor unit is not a hundredth of the major one
+EXPONENTS = {
+    "BIF": 0, "CLP": 0, "DJF": 0, "GNF": 0, "ISK": 0, "JPY": 0, "KMF": 0, "KRW": 0,
+    "PYG": 0, "RWF": 0, "UGX": 0, "VND": 0, "VUV": 0, "XAF": 0, "XOF": 0, "XPF": 0,
+    "BHD": 3, "IQD": 3, "JOD": 3, "KWD": 3, "LYD": 3, "OMR": 3, "TND": 3,
+}
+DEFAULT_EXPONENT = 2
+
+
+def exponent(currency: str) -> int:
+    """Decimal places of the currency's major unit, e.g. 2 for USD and 0 for JPY"""
+    return EXPONENTS.get(currency.upper(), DEFAULT_EXPONENT)
+
+
+def to_minor(amount, currency: str) -> int:
+    """A major-unit amount (float, str or Decimal) in minor units.
+
+    Raises ValueError if the amount has more decimal places than the currency, e.g. JPY 12.5:
+    a price is never silently changed.
+    """
+    # str() first so a float like 19.99 converts as written rather than as 19.98999...
+    scaled = Decimal(str(amount)).scaleb(exponent(currency))
+    if scaled != scaled.to_integral_value():
+        places = exponent(currency)
+        raise ValueError(f"{currency} amounts take at most {places} decimal places" if places else f"{currency} amounts must be whole numbers")
+    return int(scaled)
+
+
+def to_major(minor: int, currency: str) -> float:
+    """The major-unit number the API returns for an amount in minor units"""
+    return float(Decimal(int(minor)).scaleb(-exponent(currency)))
+
+
+def to_major_sql(minor, currency):
+    """to_major as a SQL expression, for queries that hand rows straight to the client"""
+    places = case(EXPONENTS, value=func.upper(currency), else_=DEFAULT_EXPONENT)
+    return cast(cast(minor, Numeric) / func.power(literal(10, Numeric), places), Float)
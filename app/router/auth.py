@@ -1,8 +1,10 @@
 from fastapi import Body, Depends, FastAPI, Response, status, HTTPException, Depends, APIRouter
 from fastapi.security.oauth2 import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from .. import schemas, utils, models
 from ..database import get_db
+from ..services.hashing import hashing_pool
 from . import oauth2
 from ..logger import logger
 
@@ -10,46 +12,58 @@ router = APIRouter(prefix="/api/auth", tags=["Authentication"])
 
 
 @router.post("", status_code=status.HTTP_201_CREATED, response_model=schemas.UserResponse)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
     logger.info('Attempting to create a new user')
-    hashed_password = utils.hash(user.password)
+    hashed_password = await hashing_pool.hash(user.password)
     user.password = hashed_password
     new_user = models.User(**user.model_dump())
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    logger.info(f"User created successfully with ID: {new_user.id}")
+    await db.commit()
+    await db.refresh(new_user)
+    logger.info("User created successfully with ID: %s", new_user.id)
     return new_user
 
 @router.post('/login')
-def login(user_card: OAuth2PasswordRequestForm = Depends(), user_data: schemas.UserLogin = Body(None), db: Session = Depends(get_db)):
+async def login(user_card: OAuth2PasswordRequestForm = Depends(), user_data: schemas.UserLogin = Body(None), db: AsyncSession = Depends(get_db)):
     email = user_card.username if user_card else user_data.email
     password = user_card.password if user_card else user_data.password
-    logger.info(f"Login attempt for user: {email}")
+    logger.info("Login attempt for user: %s", email)
 
-    user = db.query(models.User).filter(models.User.email == email).first()
+    user = await db.scalar(select(models.User).where(models.User.email == email))
     if not user:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid credentials")
-    if not utils.verify(password, user.password):
+    valid, new_hash = await hashing_pool.verify_and_update(password, user.password)
+    if not valid:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid credentials")
+    await rehash_password(db, user, new_hash)
 
     access_token = oauth2.create_access_token(data={'user_id': user.id})
-    logger.info(f"User {email} logged in successfully.")
+    logger.info("User %s logged in successfully.", email)
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post('/login-json')
-def login_json(
+async def login_json(
     user_data: schemas.UserLogin = Body(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    logger.info(f"JSON login attempt for user: {user_data.email}")
-    user = db.query(models.User).filter(models.User.email == user_data.email).first()
+    logger.info("JSON login attempt for user: %s", user_data.email)
+    user = await db.scalar(select(models.User).where(models.User.email == user_data.email))
 
-    if not user or not utils.verify(user_data.password, user.password):
-        logger.warning(f"JSON login failed for {user_data.email}: invalid credentials.")
+    valid, new_hash = await hashing_pool.verify_and_update(user_data.password, user.password) if user else (False, None)
+    if not valid:
+        logger.warning("JSON login failed for %s: invalid credentials.", user_data.email)
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid credentials")
+    await rehash_password(db, user, new_hash)
 
     access_token = oauth2.create_access_token(data={'user_id': user.id})
-    logger.info(f"User {user_data.email} logged in successfully with JSON.")
+    logger.info("User %s logged in successfully with JSON.", user_data.email)
     return {"access_token": access_token, "token_type": "bearer", "user_id": user.id}
-    
\ No newline at end of file
+
+
+async def rehash_password(db: AsyncSession, user: models.User, new_hash):
+    """Store the password under the current bcrypt cost once it has been verified with the old one"""
+    if new_hash is None:
+        return
+    user.password = new_hash
+    await db.commit()
+    logger.info("Rehashed password for user ID %s with the current cost", user.id)
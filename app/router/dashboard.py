@@ -1,81 +1,134 @@
-from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Header, Query, Response, WebSocket, WebSocketDisconnect, status
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import contains_eager
 from datetime import datetime, timedelta
-from collections import defaultdict
-from ..database import get_db
+from ..config import settings
+from ..database import get_db, get_session_factory
+from ..logger import logger
 from .. import models, schemas
-from .oauth2 import get_current_user
+from ..money import to_major
+from ..services import dashboard_cache, earnings
+from ..services.pubsub import earnings_hub
+from .oauth2 import get_current_principal
 import asyncio
 import json
+import time
+from typing import Literal, Optional
 
 router = APIRouter(prefix='/api/dashboard', tags=["Dashboard"])
 
+# Days covered by each chart period, today (UTC) included
+PERIOD_DAYS = {
+    "last_day": 1,
+    "last_week": 7,
+    "last_year": 365,
+}
+Period = Literal["last_day", "last_week", "last_year"]
+
 @router.get("/")
-def get_dashboard_data(db:Session = Depends(get_db), current_user: int = Depends(get_current_user)):
-    total_earnings = calculate_total_earnings(db, current_user.id)
-    transactions = get_transactions(db, current_user.id)
-    latest_transactions = get_latest_transactions(db, current_user.id, limit=5)
-    performance = get_link_performance(db, current_user.id)
+async def get_dashboard_data(
+    period: Period = Query("last_week"),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+    session_factory: async_sessionmaker = Depends(get_session_factory),
+    current_user: schemas.Principal = Depends(get_current_principal),
+):
+    """The dashboard, rebuilt only when the user's data has changed since the cached snapshot.
 
-    return {
-        "total_earnings": total_earnings,
-        "transactions": transactions,
-        "latest_transactions": latest_transactions,
-        "performance": performance    
-    }
+    Clients that send back the ETag in If-None-Match get a 304 after a single version lookup.
+    Sections that time out or fail come back as null and are listed under "unavailable".
+    """
+    today = datetime.utcnow().date()
+    version = await dashboard_cache.version(db, current_user.id)
+    # hand the connection back before the sections check out their own
+    await db.close()
+    etag = dashboard_cache.etag(current_user.id, period, today, version)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if dashboard_cache.etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
 
+    body = await dashboard_cache.get(current_user.id, period, today, version)
+    if body is not None:
+        return Response(content=body, media_type="application/json", headers=headers)
 
-def calculate_total_earnings(db: Session, user_id: int):
-    earnings = defaultdict(float)
+    # Read after the version, so a write committing meanwhile can only make the snapshot newer than its stamp
+    started = time.perf_counter()
+    dashboard, timings = await build_dashboard(session_factory, current_user.id, period)
+    timings["total"] = time.perf_counter() - started
+    headers["Server-Timing"] = ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+    body = json.dumps(jsonable_encoder(dashboard))
+    if "unavailable" in dashboard:
+        # never cache or validate a partial dashboard; the next load tries the missing sections again
+        del headers["ETag"]
+        headers["Cache-Control"] = "no-store"
+    else:
+        await dashboard_cache.put(current_user.id, period, today, version, body)
+    return Response(content=body, media_type="application/json", headers=headers)
 
-    transactions = db.query(models.Transaction).join(models.PaymentLink).filter(models.PaymentLink.user_id == user_id).all()
-    for transaction in transactions:
-        if transaction.status == "success":
-            payment_link = db.query(models.PaymentLink).filter(models.PaymentLink.id == transaction.payment_link_id).first()
-            earnings[payment_link.currency] += payment_link.amount
-    return earnings
 
-def get_transactions(db: Session, user_id: int, period: str = "last_week"):
-    # Define a mapping of periods to their respective timedelta
-    period_mapping = {
-        "last_day": timedelta(days=1),
-        "last_week": timedelta(weeks=1),
-        "last_year": timedelta(days=365),
-    }
+# Each section only reads, and none depends on another's result
+SECTIONS = {
+    "total_earnings": lambda db, user_id, period: earnings.total_earnings(db, user_id),
+    "transactions": lambda db, user_id, period: get_transactions(db, user_id, period),
+    "latest_transactions": lambda db, user_id, period: get_latest_transactions(db, user_id, limit=5),
+    "performance": lambda db, user_id, period: get_link_performance(db, user_id),
+}
 
-    # Calculate the start date based on the provided period or default to last 30 days
-    start_date = datetime.utcnow() - period_mapping.get(period, timedelta(days=30))
 
-    # Query transactions
-    transactions = (
-        db.query(models.Transaction)
-        .join(models.PaymentLink)
-        .filter(models.PaymentLink.user_id == user_id)
-        .filter(models.Transaction.created_at >= start_date)
-        .all()
-    )
-    
-    return transform_transactions(transactions)
-    
-    # transactions = (db.query(models.Transaction).join(models.PaymentLink).filter(models.PaymentLink.user_id == user_id).filter(models.Transaction.created_at >= start_date).all())
-    # return [transaction_to_dict(transaction) for transaction in transactions]
-
-def transform_transactions(transactions):
-    # Transform the list of transaction objects into the desired format
+async def build_section(session_factory: async_sessionmaker, name: str, user_id: int, period: Period, timings):
+    """One section on its own session, or None if it times out or fails"""
+    started = time.perf_counter()
+    try:
+        async with session_factory() as db:
+            return await asyncio.wait_for(SECTIONS[name](db, user_id, period), settings.dashboard_section_timeout)
+    except asyncio.TimeoutError:
+        logger.warning("Dashboard section %s timed out after %.1f s", name, settings.dashboard_section_timeout)
+    except Exception:
+        # a bug in one section must not take the others (or the request) down with it
+        logger.exception("Dashboard section %s failed", name)
+    finally:
+        timings[name] = time.perf_counter() - started
+    return None
+
+
+async def build_dashboard(session_factory: async_sessionmaker, user_id: int, period: Period):
+    """Returns (dashboard, {section: seconds}); sections run concurrently unless dashboard_parallel_sections is off"""
+    timings = {}
+    if settings.dashboard_parallel_sections:
+        results = await asyncio.gather(*(build_section(session_factory, name, user_id, period, timings) for name in SECTIONS))
+    else:
+        results = [await build_section(session_factory, name, user_id, period, timings) for name in SECTIONS]
+    dashboard = dict(zip(SECTIONS, results))
+    unavailable = [name for name, result in dashboard.items() if result is None]
+    if unavailable:
+        dashboard["unavailable"] = unavailable
+    return dashboard, {name: timings[name] for name in SECTIONS}
+
+
+async def get_transactions(db: AsyncSession, user_id: int, period: Period = "last_week"):
+    # The chart reads the daily_earnings rollup: one row per day and currency, whatever the volume
+    start_day = datetime.utcnow().date() - timedelta(days=PERIOD_DAYS[period] - 1)
+    rows = await earnings.daily_earnings(db, user_id, start_day)
+    return transform_transactions(rows)
+
+def transform_transactions(rows):
+    # Turn (day, currency, amount_minor) rows into [{"date": ..., currency: amount, ...}] per day
     earnings = {}
-    
-    for transaction in transactions:
-        date_str = transaction.created_at.date().isoformat()  # Get the date as a string
-        currency = transaction.payment_link.currency
-        amount = transaction.payment_link.amount
-        
+
+    for day, currency, amount_minor in rows:
+        date_str = day.isoformat()
         if date_str not in earnings:
             earnings[date_str] = {"date": date_str}
-        
-        earnings[date_str][currency] = amount
 
-    # Convert the earnings dictionary to a list
-    return list(earnings.values())
+        earnings[date_str][currency] = earnings[date_str].get(currency, 0) + amount_minor
+
+    # Convert to major units only once every amount is summed
+    return [
+        {key: value if key == "date" else to_major(value, key) for key, value in point.items()}
+        for point in earnings.values()
+    ]
 
 def transaction_to_dict(transaction):
     return {
@@ -86,42 +139,96 @@ def transaction_to_dict(transaction):
         "created_at": transaction.created_at.isoformat()    
     }
 
-def get_link_performance(db: Session, user_id: int):
-    link_performance = db.query(models.PaymentLink).filter(models.PaymentLink.user_id == user_id).all()
-    performance_data = []
-    for link in link_performance:
-        performance_data.append({
-            "link_id": link.id, 
-            "description": link.description,
-            "total_transactions": db.query(models.Transaction).filter(models.Transaction.payment_link_id == link.id).count(),
-            "successful_transactions": db.query(models.Transaction).filter(models.Transaction.payment_link_id == link.id, models.Transaction.status == "success").count(),
-            "total_amount": sum(t.payment_link.amount for t in link.transactions if t.status == "success")
-        })
-    return performance_data
-
-def get_latest_transactions(db: Session, user_id: int, limit: int = 5):
-    transactions = (
-        db.query(models.Transaction)
+async def get_link_performance(db: AsyncSession, user_id: int):
+    stats = models.LinkStats
+    rows = (await db.execute(
+        select(
+            models.PaymentLink.id,
+            models.PaymentLink.description,
+            models.PaymentLink.currency,
+            func.coalesce(stats.total_transactions, 0),
+            func.coalesce(stats.successful_transactions, 0),
+            func.coalesce(stats.failed_transactions, 0),
+            func.coalesce(stats.success_amount_minor, 0),
+        )
+        .outerjoin(stats, stats.payment_link_id == models.PaymentLink.id)
+        .where(models.PaymentLink.user_id == user_id)
+    )).all()
+    return [
+        {
+            "link_id": link_id,
+            "description": description,
+            "total_transactions": total,
+            "successful_transactions": successful,
+            "failed_transactions": failed,
+            "total_amount": to_major(amount_minor, currency)
+        }
+        for link_id, description, currency, total, successful, failed, amount_minor in rows
+    ]
+
+async def get_latest_transactions(db: AsyncSession, user_id: int, limit: int = 5):
+    transactions = (await db.scalars(
+        select(models.Transaction)
         .join(models.PaymentLink)
-        .filter(models.PaymentLink.user_id == user_id)
-        .order_by(models.Transaction.created_at.desc())
+        .options(contains_eager(models.Transaction.payment_link))
+        .where(models.Transaction.user_id == user_id)
+        # walks ix_transactions_user_id_created_at_id backwards and stops after `limit` rows
+        .order_by(models.Transaction.created_at.desc(), models.Transaction.id.desc())
         .limit(limit)
-        .all()
-    )
+    )).all()
     return [transaction_to_dict(transaction) for transaction in transactions]
 
 @router.websocket("/ws/{user_id}")
-async def websocket_endpoint(websocket: WebSocket, user_id: int, db: Session = Depends(get_db)):
+async def websocket_endpoint(websocket: WebSocket, user_id: int, db: AsyncSession = Depends(get_db)):
     await websocket.accept()
+    queue = earnings_hub.subscribe(user_id)
+    # the client never sends anything, so this only completes once it goes away
+    receiver = asyncio.create_task(websocket.receive())
     try:
+        # Subscribed first so nothing committed after the snapshot is missed; deltas the
+        # snapshot already counts carry a version no newer than its own and are skipped
+        total_earnings, version = await load_total_earnings(db, user_id)
+        await send_earnings(websocket, total_earnings)
         while True:
-            # fetch the latest earnings data
-            total_earnings = calculate_total_earnings(db, user_id)
-            # send updated earnings data to the client
-            await websocket.send_text(json.dumps({
-                "total_earnings": total_earnings,
-                "timestamp": datetime.utcnow().isoformat()
-                }))
-            await asyncio.sleep(10)
+            getter = asyncio.create_task(queue.get())
+            done, _ = await asyncio.wait({receiver, getter}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                if receiver.result()["type"] == "websocket.disconnect":
+                    getter.cancel()
+                    raise WebSocketDisconnect()
+                receiver = asyncio.create_task(websocket.receive())
+            if getter not in done:
+                getter.cancel()
+                continue
+
+            message = getter.result()
+            if message.get("resync"):
+                total_earnings, version = await load_total_earnings(db, user_id)
+            elif message["version"] > version:
+                total_earnings[message["currency"]] = total_earnings.get(message["currency"], 0) + message["amount_minor"]
+            else:
+                continue
+            await send_earnings(websocket, total_earnings)
     except WebSocketDisconnect:
-        print(f"User {user_id} disconnected")
\ No newline at end of file
+        logger.info("Dashboard socket for user ID %s disconnected", user_id)
+    finally:
+        receiver.cancel()
+        earnings_hub.unsubscribe(user_id, queue)
+
+
+async def send_earnings(websocket: WebSocket, total_earnings):
+    await websocket.send_text(json.dumps({
+        "total_earnings": earnings.to_major_totals(total_earnings),
+        "timestamp": datetime.utcnow().isoformat()
+        }))
+
+
+async def load_total_earnings(db: AsyncSession, user_id: int):
+    """(totals in minor units, so the pushed deltas add up exactly; the dashboard version they are as of)"""
+    try:
+        # one snapshot for both, so the version says exactly which deltas the totals include
+        await db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        return await earnings.total_earnings_minor(db, user_id), await dashboard_cache.version(db, user_id)
+    finally:
+        # hand the connection back to the pool between pushes
+        await db.close()
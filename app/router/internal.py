@@ -0,0 +1,61 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from typing import Optional
+from ..config import settings
+from ..database import async_engine
+from ..logger import handler as log_handler
+from ..services import dashboard_cache, link_cache
+from ..services.pool_metrics import pool_metrics
+from ..services.stripe_checkout import stripe_checkout
+from .oauth2 import token_cache
+
+# Environments where the internal endpoints are open when no key is configured
+OPEN_ENVS = {"local", "test"}
+
+def require_internal_access(x_internal_key: Optional[str] = Header(None)):
+    if not settings.internal_api_key:
+        # closed by default: a deploy that never set a key does not expose its internals
+        if settings.env not in OPEN_ENVS:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+        return
+    if x_internal_key != settings.internal_api_key:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
+
+router = APIRouter(prefix="/internal", tags=["Internal"], include_in_schema=False, dependencies=[Depends(require_internal_access)])
+
+
+@router.get("/pool")
+def get_pool_stats():
+    """Connection pool occupancy and latency histograms for this worker process"""
+    return pool_metrics.snapshot(async_engine.pool)
+
+
+@router.get("/auth-cache")
+def get_auth_cache_stats():
+    """Hit/miss counters of the verified token cache for this worker process"""
+    return token_cache.stats()
+
+
+@router.get("/link-cache")
+def get_link_cache_stats():
+    """Hit/miss counters of the public link_code cache"""
+    return link_cache.backend.stats()
+
+
+@router.get("/dashboard-cache")
+def get_dashboard_cache_stats():
+    """Hit/miss counters of the dashboard snapshot cache"""
+    return dashboard_cache.backend.stats()
+
+
+@router.get("/stripe")
+def get_stripe_stats():
+    """Circuit breaker state and pre-created session counters for this worker process"""
+    return stripe_checkout.stats()
+
+
+@router.get("/logging")
+def get_logging_stats():
+    """Log queue depth and records dropped because it was full, for this worker process"""
+    if not hasattr(log_handler, "stats"):
+        return {"queued": 0, "capacity": 0, "dropped": 0}
+    return log_handler.stats()
@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from ..config import settings
+from ..services import metrics
+from .internal import require_internal_access
+
+router = APIRouter(tags=["Internal"], include_in_schema=False, dependencies=[Depends(require_internal_access)])
+
+
+@router.get("/metrics")
+def get_metrics():
+    """Prometheus exposition, summed over every gunicorn worker when PROMETHEUS_MULTIPROC_DIR is set"""
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    body, content_type = metrics.exposition()
+    return Response(content=body, media_type=content_type)
@@ -1,18 +1,21 @@
+import time
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from .. import schemas, database, models
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from ..config import Settings
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..config import settings
+from ..services.cache import TTLCache
 
-settings = Settings()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='api/auth/login')
 
 SECRET_KEY = settings.secret_key
 ALGORITHM = settings.algorithm
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
 
+token_cache = TTLCache(maxsize=settings.token_cache_size, ttl=settings.token_cache_ttl)
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.now() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -23,16 +26,29 @@ def create_access_token(data: dict):
 def verify_access_token(token: str, credentials_exception):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        id = str(payload.get("user_id"))
+        id = payload.get("user_id")
         if id is None:
             raise credentials_exception
-        token_data = schemas.TokenData(id=id)
+        token_data = schemas.TokenData(id=str(id))
     except JWTError:
         raise credentials_exception
-    return token_data
+    return token_data, payload.get("exp")
+
+async def get_current_principal(token: str = Depends(oauth2_scheme)):
+    """Resolve the bearer token to a principal, decoding each distinct token at most once per cache TTL"""
+    principal = token_cache.get(token)
+    if principal is not None:
+        return principal
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
     credentials_exception = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"Could not validate credentials", headers={"WWW-Authenticate": "Bearer"})
-    token = verify_access_token(token, credentials_exception)
-    user = db.query(models.User).filter(models.User.id == token.id).first()
+    token_data, expires_at = verify_access_token(token, credentials_exception)
+    principal = schemas.Principal(id=int(token_data.id))
+    ttl = settings.token_cache_ttl if expires_at is None else min(settings.token_cache_ttl, expires_at - time.time())
+    if ttl > 0:
+        token_cache.set(token, principal, ttl)
+    return principal
+
+async def get_current_user(principal: schemas.Principal = Depends(get_current_principal), db: AsyncSession = Depends(database.get_db)):
+    """Load the full user row; routes that only need the user's id should depend on get_current_principal"""
+    user = await db.get(models.User, principal.id)
     return user
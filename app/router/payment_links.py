@@ -1,54 +1,131 @@
 from fastapi import Body, Depends, FastAPI, Response, status, HTTPException, Depends, APIRouter, Query
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+import json
 from . import oauth2
 from .. import schemas
-from sqlalchemy.orm import Session
-from ..database import get_db
-import random
-import string
+from ..services import dashboard_cache, link_cache, rollups
+from ..money import to_minor
+from ..services.ids import link_codes
+from ..services.pubsub import earnings_hub
+from ..services.stripe_checkout import stripe_checkout
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_db, get_session_factory
 from ..config import settings
 from .. import models
-from typing import List
+from typing import Any, List
 from ..logger import logger
 
 router = APIRouter(prefix="/api/payment-links", tags=["Payment Links"])
 
-
-def generate_random_link(length=6):
-    characters = string.ascii_letters + string.digits
-    return ''.join(random.choice(characters) for _ in range(length))
-
 # This route retrieves and builds the form on the frontend!
 @router.get("/{link_code}")
-def get_link_by_code(link_code: str, db: Session = Depends(get_db)):
-    logger.info(f"Fetching link with code: {link_code}")
-    link = db.query(models.PaymentLink).filter(models.PaymentLink.link_code == link_code).first()
-    if not link:
-        logger.warning(f"Link with code {link_code} not found!")
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Link not found!")
-    return link
+async def get_link_by_code(link_code: str, db: AsyncSession = Depends(get_db)):
+    logger.info("Fetching link with code: %s", link_code)
+    payload = await link_cache.get(link_code)
+    if payload is None:
+        link = await db.scalar(select(models.PaymentLink).where(models.PaymentLink.link_code == link_code))
+        if not link:
+            logger.warning("Link with code %s not found!", link_code)
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Link not found!")
+        payload = await link_cache.put(link)
+    return Response(content=payload, media_type="application/json")
 
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model= schemas.PaymentLinkOut)
-def create_payment_link(link: schemas.PaymentLinkCreate, db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
+async def create_payment_link(link: schemas.PaymentLinkCreate, db: AsyncSession = Depends(get_db), current_user: schemas.Principal = Depends(oauth2.get_current_principal)):
     """Create a new link"""
-    generated_link_code = generate_random_link()
+    generated_link_code = await link_codes.next(db)
     generated_link_url = f"{settings.client_url}/pay/{generated_link_code}"
 
 
-    logger.info(f"Creating a new payment link for user ID {current_user.id}")
+    logger.info("Creating a new payment link for user ID %s", current_user.id)
     new_link = models.PaymentLink(user_id=current_user.id, link_url=generated_link_url, link_code=generated_link_code, **link.dict())
     db.add(new_link)
-    db.commit()
-    db.refresh(new_link)
-    logger.info(f"Payment link created successfully with ID: {new_link.id}")
+    await db.flush()
+    await dashboard_cache.bump(db, [current_user.id])
+    await db.commit()
+    await db.refresh(new_link)
+    logger.info("Payment link created successfully with ID: %s", new_link.id)
     return new_link
 
+def validate_bulk_links(items: List[Any]):
+    """Split a bulk request into (index, PaymentLinkCreate) pairs and per-item errors"""
+    valid, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, schemas.PaymentLinkCreate.model_validate(item)))
+        except ValidationError as e:
+            errors.append({"index": index, "errors": e.errors(include_url=False, include_context=False)})
+    return valid, errors
+
+async def insert_links(db: AsyncSession, user_id: int, links: List[schemas.PaymentLinkCreate]):
+    """Insert links with one multi-row INSERT ... RETURNING, in the order given"""
+    codes = await link_codes.take(db, len(links))
+    rows = [
+        {
+            "user_id": user_id, "link_code": code, "link_url": f"{settings.client_url}/pay/{code}",
+            "amount_minor": to_minor(link.amount, link.currency), **link.model_dump(exclude={"amount"}),
+        }
+        for code, link in zip(codes, links)
+    ]
+    result = (await db.scalars(insert(models.PaymentLink).returning(models.PaymentLink, sort_by_parameter_order=True), rows)).all()
+    await dashboard_cache.bump(db, [user_id])
+    return result
+
+def bulk_created(index: int, link: models.PaymentLink):
+    return schemas.PaymentLinkBulkCreated(index=index, link=schemas.PaymentLinkOut.model_validate(link, from_attributes=True))
+
+@router.post("/bulk", status_code=status.HTTP_201_CREATED, response_model=schemas.PaymentLinkBulkOut)
+async def create_payment_links_bulk(
+    items: List[Any] = Body(..., description="PaymentLinkCreate objects"),
+    db: AsyncSession = Depends(get_db),
+    session_factory = Depends(get_session_factory),
+    current_user: schemas.Principal = Depends(oauth2.get_current_principal),
+):
+    """Create many links at once. Invalid items are reported by index and the rest are still created.
+
+    Up to payment_links_bulk_chunk items are created in one transaction and answered as JSON. Larger
+    batches are streamed as NDJSON - the errors first, then one line per link as each chunk commits -
+    so an interrupted stream leaves exactly the links it reported.
+    """
+    if len(items) > settings.payment_links_bulk_max:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.payment_links_bulk_max} links per request",
+        )
+    valid, errors = validate_bulk_links(items)
+    if not valid:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=errors)
+    logger.info("Creating %d payment links in bulk for user ID %s (%d invalid)", len(valid), current_user.id, len(errors))
+
+    chunk = settings.payment_links_bulk_chunk
+    if len(valid) <= chunk:
+        links = await insert_links(db, current_user.id, [link for _, link in valid])
+        await db.commit()
+        return {"created": [bulk_created(index, link) for (index, _), link in zip(valid, links)], "errors": errors}
+
+    async def body():
+        for error in errors:
+            yield json.dumps(error) + "\n"
+        # The request's get_db session is closed before the body is sent, so the stream owns its own
+        async with session_factory() as db:
+            for start in range(0, len(valid), chunk):
+                part = valid[start:start + chunk]
+                links = await insert_links(db, current_user.id, [link for _, link in part])
+                await db.commit()
+                yield "".join(bulk_created(index, link).model_dump_json() + "\n" for (index, _), link in zip(part, links))
+        logger.info("Bulk created %d payment links for user ID %s", len(valid), current_user.id)
+
+    return StreamingResponse(body(), status_code=status.HTTP_201_CREATED, media_type="application/x-ndjson")
+
 @router.get("/get-by-id/{id}", response_model=schemas.PaymentLinkOut)
-def get_payment_link(id: int, db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user) ):
-    logger.info(f"Fetching payment link with ID: {id} for user ID {current_user.id}")
-    link = db.query(models.PaymentLink).filter(models.PaymentLink.id == id, models.PaymentLink.user_id == current_user.id).first()
+async def get_payment_link(id: int, db: AsyncSession = Depends(get_db), current_user: schemas.Principal = Depends(oauth2.get_current_principal) ):
+    logger.info("Fetching payment link with ID: %s for user ID %s", id, current_user.id)
+    link = await db.scalar(select(models.PaymentLink).where(models.PaymentLink.id == id, models.PaymentLink.user_id == current_user.id))
     
     if not link:
-        logger.warning(f"Payment link with ID {id} not found for user ID {current_user.id}")
+        logger.warning("Payment link with ID %s not found for user ID %s", id, current_user.id)
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Link not found!")
     return link
 
@@ -56,47 +133,68 @@ def get_payment_link(id: int, db: Session = Depends(get_db), current_user: int =
 
 
 @router.get("/", response_model=List[schemas.PaymentLinkOut])
-def get_payment_links(db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user), currency: str = Query(None, description="Filter By Currency e.g (USD)")):
-    logger.info(f"Fetching payment links for user ID {current_user.id} with currency filter: {currency}")    
-    query = db.query(models.PaymentLink).filter(models.PaymentLink.user_id == current_user.id)
+async def get_payment_links(db: AsyncSession = Depends(get_db), current_user: schemas.Principal = Depends(oauth2.get_current_principal), currency: str = Query(None, description="Filter By Currency e.g (USD)")):
+    logger.info("Fetching payment links for user ID %s with currency filter: %s", current_user.id, currency)    
+    query = select(models.PaymentLink).where(models.PaymentLink.user_id == current_user.id)
     if currency:
-        query = query.filter(models.PaymentLink.currency == currency)
+        query = query.where(models.PaymentLink.currency == currency)
     
-    links = query.all()
-    logger.info(f"Retrieved {len(links)} payment links for user ID {current_user.id}")
+    links = (await db.scalars(query)).all()
+    logger.info("Retrieved %d payment links for user ID %s", len(links), current_user.id)
     
     return links
 
 
 @router.put("/{id}", response_model=schemas.PaymentLinkOut)
-def update_payment_link(id: int, link_update: schemas.PaymentLinkUpdate, db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
-    logger.info(f"Updating payment link with ID {id} for user ID {current_user.id}")
-    link = db.query(models.PaymentLink).filter(models.PaymentLink.id == id, models.PaymentLink.user_id == current_user.id).first()
+async def update_payment_link(id: int, link_update: schemas.PaymentLinkUpdate, db: AsyncSession = Depends(get_db), current_user: schemas.Principal = Depends(oauth2.get_current_principal)):
+    logger.info("Updating payment link with ID %s for user ID %s", id, current_user.id)
+    # Locked before the old amount is read, so transactions recorded meanwhile cannot be repriced twice or missed
+    link = await db.scalar(
+        select(models.PaymentLink).where(models.PaymentLink.id == id, models.PaymentLink.user_id == current_user.id).with_for_update()
+    )
     if not link:
-        logger.warning(f"Payment link with ID {id} not found for user ID {current_user.id}")
+        logger.warning("Payment link with ID %s not found for user ID %s", id, current_user.id)
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail='Link not found!')
     
-    # update the fields
-    for field, value in link_update.model_dump(exclude_unset=True).items():
+    # update the fields; amount goes last since converting it depends on the (new) currency
+    changes = link_update.model_dump(exclude_unset=True)
+    old_amount_minor, old_currency = link.amount_minor, link.currency
+    for field, value in sorted(changes.items(), key=lambda item: item[0] == "amount"):
         setattr(link, field, value)
     
-    db.commit()
-    db.refresh(link)
-    logger.info(f"Payment link with ID {id} updated successfully for user ID {current_user.id}")
+    await db.flush()
+    await rollups.reprice_link(db, link, old_amount_minor, old_currency)
+    await dashboard_cache.bump(db, [current_user.id])
+    await db.commit()
+    await db.refresh(link)
+    await link_cache.invalidate(link.link_code)
+    stripe_checkout.discard(link.id)
+    if (link.amount_minor, link.currency) != (old_amount_minor, old_currency):
+        await earnings_hub.publish_resync(current_user.id)
+    logger.info("Payment link with ID %s updated successfully for user ID %s", id, current_user.id)
     return link
 
 @router.delete("/{id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_payment_link(id: int, db: Session = Depends(get_db), current_user: int = Depends(oauth2.get_current_user)):
-    logger.info(f"Attempting to delete payment link with ID {id} for user ID {current_user.id}")
-    link = db.query(models.PaymentLink).filter(models.PaymentLink.id == id, models.PaymentLink.user_id == current_user.id).first()
+async def delete_payment_link(id: int, db: AsyncSession = Depends(get_db), current_user: schemas.Principal = Depends(oauth2.get_current_principal)):
+    logger.info("Attempting to delete payment link with ID %s for user ID %s", id, current_user.id)
+    # Locked so no transition of the link is in flight while its earnings are taken out
+    link = await db.scalar(
+        select(models.PaymentLink).where(models.PaymentLink.id == id, models.PaymentLink.user_id == current_user.id).with_for_update()
+    )
     
     if not link:
-        logger.warning(f"Payment link with ID {id} not found for user ID {current_user.id}")
+        logger.warning("Payment link with ID %s not found for user ID %s", id, current_user.id)
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Payment link not found")
     
-    db.delete(link)
-    db.commit()
-    logger.info(f"Payment link with ID {id} deleted successfully for user ID {current_user.id}")
+    await rollups.remove_link(db, link)
+    await db.delete(link)
+    await db.flush()
+    await dashboard_cache.bump(db, [current_user.id])
+    await db.commit()
+    await link_cache.invalidate(link.link_code)
+    stripe_checkout.discard(link.id)
+    await earnings_hub.publish_resync(current_user.id)
+    logger.info("Payment link with ID %s deleted successfully for user ID %s", id, current_user.id)
     return {"message": "Link deleted successfully!"}
 
 
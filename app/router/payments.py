@@ -1,13 +1,25 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Header, Query
-from sqlalchemy.orm import Session
-import random
-from .. database import get_db
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, contains_eager
+import base64
+import binascii
+import csv
+import io
+from . import oauth2
+from .. database import get_db, get_session_factory
 from .. import models, schemas
-import stripe
+from ..money import to_major_sql
+from ..services import metrics, rollups, webhooks
+from ..services.webhooks import webhook_worker
+from ..services.pubsub import earnings_hub
+from ..services.stripe_checkout import stripe_checkout
+from ..services.ids import new_transaction_id
 from .. config import settings
 import logging
 import json
-from typing import List, Optional
+from typing import List, Literal, Optional
 from datetime import datetime, timedelta
 
 from ..logger import logger
@@ -30,124 +42,205 @@ def transaction_to_dict(transaction):
         "updated_at": transaction.updated_at.isoformat()   
     }
 
-@router.get('/transactions', status_code=status.HTTP_200_OK)
-def get_transactions(
-    db: Session = Depends(get_db), 
-    date: Optional[str] = Query(None, description="Filter By Date (YYYY-MM-DD)"),
-    currency: Optional[str] = Query(None, description = 'Filter by Currency'),
-    transaction_status: Optional[str] = Query(None, description="Filter by transaction status")
-):
-    # base query
-    logger.info("Fetching transactions with filters - Date: %s, Currency: %s, Status: %s", date, currency, transaction_status)
-    query = db.query(models.Transaction)
+def encode_cursor(transaction):
+    raw = f"{transaction.created_at.isoformat()}|{transaction.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str):
+    """Position after which the next page starts: (created_at, id) of the last row already returned"""
+    try:
+        created_at, transaction_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(transaction_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+def filter_transactions(query, date: Optional[str], currency: Optional[str], transaction_status: Optional[str]):
+    """Apply the listing filters to a query that already joins Transaction to its PaymentLink"""
     if date:
         try:
             parsed_date = datetime.strptime(date, "%Y-%m-%d").date()
             next_day = parsed_date + timedelta(days=1)
-            query = query.filter(models.Transaction.created_at >= parsed_date, models.Transaction.created_at < next_day)
+            query = query.where(models.Transaction.created_at >= parsed_date, models.Transaction.created_at < next_day)
         except ValueError:
              logger.error("Invalid date format: %s", date)
              raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid date format")
     
     if currency:
-        query = query.join(models.Transaction.payment_link).filter(models.PaymentLink.currency == currency)
+        query = query.where(models.PaymentLink.currency == currency)
     
     if transaction_status:
-        query = query.filter(models.Transaction.status == transaction_status)
-    transactions = query.all()
+        query = query.where(models.Transaction.status == transaction_status)
+    return query
+
+@router.get('/transactions', status_code=status.HTTP_200_OK)
+async def get_transactions(
+    db: AsyncSession = Depends(get_db), 
+    current_user: schemas.Principal = Depends(oauth2.get_current_principal),
+    date: Optional[str] = Query(None, description="Filter By Date (YYYY-MM-DD)"),
+    currency: Optional[str] = Query(None, description = 'Filter by Currency'),
+    transaction_status: Optional[str] = Query(None, description="Filter by transaction status"),
+    limit: int = Query(settings.transactions_page_size, ge=1, le=settings.transactions_page_max, description="Page size"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page")
+):
+    # base query: newest first, the link's amount and currency come back in the same row
+    logger.info("Fetching transactions with filters - Date: %s, Currency: %s, Status: %s", date, currency, transaction_status)
+    query = (
+        select(models.Transaction)
+        .join(models.Transaction.payment_link)
+        .options(contains_eager(models.Transaction.payment_link).load_only(models.PaymentLink.amount_minor, models.PaymentLink.currency))
+        .where(models.Transaction.user_id == current_user.id)
+        .order_by(models.Transaction.created_at.desc(), models.Transaction.id.desc())
+        .limit(limit + 1)
+    )
+    query = filter_transactions(query, date, currency, transaction_status)
+
+    if cursor:
+        # Seek past the last row instead of OFFSET so deep pages cost the same as the first
+        query = query.where(tuple_(models.Transaction.created_at, models.Transaction.id) < decode_cursor(cursor))
+
+    transactions = (await db.scalars(query)).all()
+    next_cursor = None
+    if len(transactions) > limit:
+        transactions = transactions[:limit]
+        next_cursor = encode_cursor(transactions[-1])
     logger.info("Retrieved %d transactions", len(transactions))
     return {
-        "transactions": [transaction_to_dict(transaction) for transaction in transactions]
+        "transactions": [transaction_to_dict(transaction) for transaction in transactions],
+        "next_cursor": next_cursor
     }
 
+EXPORT_COLUMNS = ("id", "transaction_id", "payment_method", "amount", "currency", "status", "created_at", "updated_at")
+
+def export_rows_ndjson(rows):
+    return "".join(json.dumps(row._asdict(), default=datetime.isoformat) + "\n" for row in rows)
+
+def export_rows_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows((*row[:-2], row.created_at.isoformat(), row.updated_at.isoformat()) for row in rows)
+    return buffer.getvalue()
+
+@router.get('/transactions/export')
+async def export_transactions(
+    session_factory = Depends(get_session_factory),
+    current_user: schemas.Principal = Depends(oauth2.get_current_principal),
+    date: Optional[str] = Query(None, description="Filter By Date (YYYY-MM-DD)"),
+    currency: Optional[str] = Query(None, description = 'Filter by Currency'),
+    transaction_status: Optional[str] = Query(None, description="Filter by transaction status"),
+    format: Literal["ndjson", "csv"] = Query("ndjson", description="Export format")
+):
+    """Stream the caller's full transaction history, oldest first, without holding it in memory"""
+    logger.info("Exporting transactions as %s - Date: %s, Currency: %s, Status: %s", format, date, currency, transaction_status)
+    query = (
+        select(
+            models.Transaction.id,
+            models.Transaction.transaction_id,
+            models.Transaction.payment_method,
+            to_major_sql(models.PaymentLink.amount_minor, models.PaymentLink.currency).label("amount"),
+            models.PaymentLink.currency,
+            models.Transaction.status,
+            models.Transaction.created_at,
+            models.Transaction.updated_at,
+        )
+        .join(models.Transaction.payment_link)
+        .where(models.Transaction.user_id == current_user.id)
+        .order_by(models.Transaction.created_at, models.Transaction.id)
+        .execution_options(yield_per=settings.export_batch_size)
+    )
+    # Filters are validated here so a bad request still gets a proper 400 before the body starts
+    query = filter_transactions(query, date, currency, transaction_status)
+    render = export_rows_csv if format == "csv" else export_rows_ndjson
+
+    async def body():
+        if format == "csv":
+            yield ",".join(EXPORT_COLUMNS) + "\r\n"
+        # The request's get_db session is closed before the body is sent, so the stream owns its own
+        async with session_factory() as db:
+            result = await db.stream(query)
+            async for rows in result.partitions():
+                yield render(rows)
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    headers = {"Content-Disposition": f'attachment; filename="transactions.{format}"'}
+    return StreamingResponse(body(), media_type=media_type, headers=headers)
+
 @router.post("/create-transaction/{link_id}", status_code=status.HTTP_201_CREATED)
-def create_transaction(link_id: int, db: Session = Depends(get_db)):
-    payment_link = db.query(models.PaymentLink).filter(models.PaymentLink.id == link_id).first()
+async def create_transaction(link_id: int, db: AsyncSession = Depends(get_db)):
+    payment_link = await db.get(models.PaymentLink, link_id)
     if not payment_link:
         logger.warning("Payment Link ID %d not found", link_id)
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Payment Link not found")
 
+    # A session created ahead of time already carries the id its transaction must use
+    spare = stripe_checkout.take_spare(payment_link)
+    transaction_id = spare.transaction_id if spare else new_transaction_id()
+
     # Create a new transaction with status 'pending'
-    transaction_id = "txn_" + str(random.randint(100000,9999999))
     new_transaction = models.Transaction(
         payment_link_id=link_id,
+        user_id=payment_link.user_id,
         transaction_id=transaction_id,
         status="pending"
     )
     db.add(new_transaction)
-    db.commit()
-    db.refresh(new_transaction)
+    await rollups.record_transition(db, payment_link, None, new_transaction.status)
+    await db.commit()
+    metrics.transactions_created.labels(new_transaction.status).inc()
 
     logger.info("Created new transaction with ID %s", transaction_id)
     # Create a Stripe Checkout session
-    session = stripe.checkout.Session.create(
-        payment_method_types=["card"],
-        line_items=[
-            {
-                "price_data": {
-                    "currency": payment_link.currency,
-                    "product_data": {
-                        "name": payment_link.description,
-                    },
-                    "unit_amount": int(payment_link.amount * 100),
-                },
-                "quantity": 1,
-            },
-        ],
-        mode="payment",
-        success_url=f"{settings.client_url}/success?session_id={{CHECKOUT_SESSION_ID}}",
-        cancel_url=f"{settings.client_url}/cancel",
-        metadata= {
-            "transaction_id": transaction_id
-        }
-    )
-    logger.info("Stripe session created for transaction ID %s", transaction_id)
-    return {"transaction_id": transaction_id, "url": session.url}
+    url = spare.url if spare else await stripe_checkout.create_session(payment_link, transaction_id)
+    stripe_checkout.refill(payment_link, new_transaction_id)
+    logger.info("Stripe session %s for transaction ID %s", "prefetched" if spare else "created", transaction_id)
+    return {"transaction_id": transaction_id, "url": url}
 
     
 
 @router.post("/{link_id}", status_code=status.HTTP_201_CREATED)
-def create_payment_transaction(link_id: int, payment_method: str, db: Session = Depends(get_db)):
-    # check that payment link exists
-    payment_link = db.query(models.PaymentLink).filter(models.PaymentLink.id == link_id).first()
+async def create_payment_transaction(link_id: int, payment_method: str, db: AsyncSession = Depends(get_db)):
+    # check that payment link exists; share-locked so an edit cannot reprice it before this success is recorded
+    payment_link = await db.get(models.PaymentLink, link_id, with_for_update={"read": True})
 
     if not payment_link:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Payment Link not found")
     
     # payment gateway
-    transaction_id = "txn_" + str(random.randint(100000,9999999))
+    transaction_id = new_transaction_id()
     status = "success"
 
-    new_transaction = models.Transaction(payment_link_id=link_id, transaction_id=transaction_id, status=status, payment_method=payment_method)
+    new_transaction = models.Transaction(payment_link_id=link_id, user_id=payment_link.user_id, transaction_id=transaction_id, status=status, payment_method=payment_method)
     db.add(new_transaction)
-    db.commit()
-    db.refresh(new_transaction)
+    versions = await rollups.record_transition(db, payment_link, None, status)
+    await db.commit()
+    metrics.transactions_created.labels(status).inc()
+    await db.refresh(new_transaction)
+    await earnings_hub.publish_transition(payment_link, None, status, versions[payment_link.user_id])
 
     return new_transaction
 
 @router.get('/status/{transaction_id}', response_model=schemas.TransactionOut)
-def get_transaction_status(transaction_id: str, db: Session = Depends(get_db)):
+async def get_transaction_status(transaction_id: str, db: AsyncSession = Depends(get_db)):
     """Retrieve the status of a specific transaction"""
     logger.info("Fetching status for transaction ID %s", transaction_id)
-    transaction = db.query(models.Transaction).filter(models.Transaction.transaction_id == transaction_id).first()
+    transaction = await db.scalar(select(models.Transaction).where(models.Transaction.transaction_id == transaction_id))
     if not transaction:
         logger.warning("Transaction ID %s not found", transaction_id)
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Transaction not found")
     return transaction
 
 @router.post("/webhook/")
-async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
-    """Stripe webhook endpoint to update transaction status based on Stripe events"""
+async def stripe_webhook(request: Request, db: AsyncSession = Depends(get_db)):
+    """Stripe webhook endpoint: verify, record and ack; the webhook worker applies the status change"""
+    import stripe  # loaded on first use, it is slow to import
     payload = await request.body()
     sig_header = request.headers.get("Stripe-Signature")
-    event = None
 
     # Verify the webhook signature
     try:
-        
-        event = stripe.Event.construct_from(json.loads(payload), settings.stripe_key)
-        
-    except ValueError as e:
+        stripe.WebhookSignature.verify_header(payload, sig_header, settings.stripe_webhook_secret)
+        event = json.loads(payload)
+        event_id, event_type = event["id"], event["type"]
+    except (ValueError, KeyError, TypeError) as e:
         # Invalid payload
         logger.error("Invalid payload for Stripe webhook")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid payload")
@@ -156,36 +249,12 @@ async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
         logger.error("Invalid signature for Stripe webhook")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid signature")
 
-    logger.info("Stripe event received: %s", event["type"])
-    # Handle the event
-    if event["type"] == "checkout.session.completed":
-        session = event["data"]["object"]  # Contains the checkout session object
-
-        # Retrieve the transaction based on session.id
-        transaction = db.query(models.Transaction).filter(models.Transaction.transaction_id == session["metadata"]["transaction_id"]).first()
-        if transaction:
-            transaction.status = "success"
-            transaction.payment_method = "credit_card"
-            db.commit()
-            logger.info("Transaction ID %s marked as success", transaction.transaction_id)
-        else:
-            # Handle the case where the transaction is not found
-            logger.warning("Transaction ID not found for session: %s", session["metadata"]["transaction_id"])
-            print("Transaction not found for session:", session["metadata"]["transaction_id"])
-    
-    elif event["type"] == "checkout.session.async_payment_failed":
-        session = event["data"]["object"]
-        
-        # Retrieve the transaction based on session.id
-        transaction = db.query(models.Transaction).filter(models.Transaction.transaction_id == session["metadata"]["transaction_id"]).first()
-        if transaction:
-            transaction.status = "failure"  # Update the status to failure
-            db.commit()
-            logger.info("Transaction ID %s marked as failure", transaction.transaction_id)
-        else:
-            # Handle the case where the transaction is not found
-           logger.warning("Transaction ID not found for session: %s", session["metadata"]["transaction_id"])
-    
-    # Other event types can be handled here
+    if await webhooks.ingest(db, event):
+        logger.info("Stripe event received: %s %s", event_type, event_id)
+        webhook_worker.wake()
+    else:
+        # Stripe redelivers until it sees a 2xx, so duplicates are acked too
+        logger.info("Duplicate Stripe event ignored: %s", event_id)
+        metrics.webhook_events.labels(event_type, "duplicate").inc()
 
     return {"status": "success"}
@@ -1,8 +1,9 @@
 from certifi import contents
-from pydantic import BaseModel, EmailStr, conint, ConfigDict, Field
+from pydantic import BaseModel, EmailStr, conint, ConfigDict, Field, StringConstraints, model_validator
 from pydantic.types import conint
-from typing import Optional
+from typing import Annotated, Any, Dict, List, Optional
 from datetime import datetime
+from . import money
 
 
 class UserCreate(BaseModel):
@@ -20,22 +21,42 @@ class UserLogin(BaseModel):
     email: EmailStr
     password: str
 
+# An ISO 4217 code such as USD; payment_links.currency is a VARCHAR(3)
+Currency = Annotated[str, StringConstraints(pattern=r"^[A-Za-z]{3}$")]
+Amount = Annotated[float, Field(gt=0, allow_inf_nan=False)]
+
+def check_amount_fits_currency(link):
+    # rejected with a 422 rather than rounded to the currency's minor unit
+    money.to_minor(link.amount, link.currency)
+    return link
+
 class PaymentLinkCreate(BaseModel):
-    amount: float
-    currency: str
+    amount: Amount
+    currency: Currency
     description: Optional[str] = Field(None, description="Description for the purpose of the payment link")
     expiration_date: Optional[datetime] = Field(None, description="Expiration date for the payment link")
 
+    @model_validator(mode="after")
+    def amount_fits_currency(self):
+        return check_amount_fits_currency(self)
+
 class PaymentLinkUpdate(BaseModel):
-    amount: Optional[float]
-    currency: Optional[str]
+    # not nullable, like the columns they set
+    amount: Amount
+    currency: Currency
     description: Optional[str]
     expiration_date: Optional[datetime]
 
+    @model_validator(mode="after")
+    def amount_fits_currency(self):
+        return check_amount_fits_currency(self)
+
 class PaymentLinkOut(BaseModel):
     id: int
     user_id: int
     amount: float
+    # the exact amount, in the currency's minor unit (e.g. cents)
+    amount_minor: int
     currency: str
     link_code: str
     description: Optional[str]
@@ -45,6 +66,18 @@ class PaymentLinkOut(BaseModel):
     class Config:
         orm_mode = True
 
+class PaymentLinkBulkCreated(BaseModel):
+    index: int
+    link: PaymentLinkOut
+
+class PaymentLinkBulkError(BaseModel):
+    index: int
+    errors: List[Dict[str, Any]]
+
+class PaymentLinkBulkOut(BaseModel):
+    created: List[PaymentLinkBulkCreated]
+    errors: List[PaymentLinkBulkError]
+
 class TransactionOut(BaseModel):
     id: int
     payment_link_id: int
@@ -63,4 +96,10 @@ class Token(BaseModel):
     token_type: str
 
 class TokenData(BaseModel):
-    id: Optional[str] = None
\ No newline at end of file
+    id: Optional[str] = None
+
+class Principal(BaseModel):
+    """The authenticated user as carried by a verified token, without loading the user row"""
+    id: int
+
+    model_config = ConfigDict(frozen=True)
\ No newline at end of file
@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Size-bounded LRU mapping whose entries also expire after a TTL"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl: float = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class MemoryBackend:
+    """Per-process cache backend; other workers only see changes once their own entries expire"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize, ttl)
+
+    async def get(self, key: str):
+        return self._cache.get(key)
+
+    async def set(self, key: str, value: str, ttl: float = None):
+        self._cache.set(key, value, ttl)
+
+    async def delete(self, key: str):
+        self._cache.delete(key)
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        return self._cache.stats()
+
+
+class RedisBackend:
+    """Cache backend shared by every worker; needs the optional `redis` package.
+
+    Size bounds are enforced by the Redis server's maxmemory policy (use allkeys-lru).
+    """
+
+    def __init__(self, url: str, ttl: float, namespace: str):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("The redis cache backend requires the 'redis' package (pip install redis)")
+        self._client = redis.from_url(url, decode_responses=True)
+        self.ttl = ttl
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str):
+        value = await self._client.get(f"{self.namespace}:{key}")
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str, value: str, ttl: float = None):
+        await self._client.set(f"{self.namespace}:{key}", value, px=int((self.ttl if ttl is None else ttl) * 1000))
+
+    async def delete(self, key: str):
+        await self._client.delete(f"{self.namespace}:{key}")
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def create_backend(backend: str, namespace: str, maxsize: int, ttl: float, url: str = None):
+    if backend == "memory":
+        return MemoryBackend(maxsize, ttl)
+    if backend == "redis":
+        if not url:
+            raise ValueError("cache_url must be set to use the redis cache backend")
+        return RedisBackend(url, ttl, namespace)
+    raise ValueError(f"Unknown cache backend: {backend}")
@@ -0,0 +1,76 @@
+"""Per-user dashboard snapshots, stamped with the user's dashboard version.
+
+Every write that changes what a dashboard shows bumps the version in dashboard_versions
+within the writer's DB transaction, so all workers see the new version as soon as it
+commits. A snapshot is served only while its version is current, which keeps the memory
+backend safe to use under several workers: a worker's copy goes stale, never wrong.
+"""
+from datetime import date
+from typing import Dict, Iterable, Optional
+from sqlalchemy import func, literal, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import models
+from ..config import settings
+from .cache import create_backend
+
+backend = create_backend(settings.dashboard_cache_backend, "dashboard", settings.dashboard_cache_size, settings.dashboard_cache_ttl, settings.cache_url)
+
+
+async def bump(db: AsyncSession, user_ids: Optional[Iterable[int]] = None) -> Dict[int, int]:
+    """Invalidate the users' snapshots (every user's with None) once the caller commits.
+
+    Call it after the caller's other writes: the version row is locked until commit.
+    Returns {user_id: new version} for the given users (nothing when bumping everyone).
+    """
+    versions = models.DashboardVersion
+    if user_ids is None:
+        stmt = insert(versions).from_select(["user_id", "version"], select(models.User.id, literal(1)))
+    else:
+        # Sorted so concurrent writers take the row locks in the same order
+        user_ids = sorted({user_id for user_id in user_ids if user_id is not None})
+        if not user_ids:
+            return {}
+        stmt = insert(versions).values([{"user_id": user_id, "version": 1} for user_id in user_ids])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[versions.user_id],
+        set_={"version": versions.version + 1, "updated_at": func.now()},
+    )
+    if user_ids is None:
+        await db.execute(stmt)
+        return {}
+    return dict((await db.execute(stmt.returning(versions.user_id, versions.version))).all())
+
+
+async def version(db: AsyncSession, user_id: int) -> int:
+    return await db.scalar(select(models.DashboardVersion.version).where(models.DashboardVersion.user_id == user_id)) or 0
+
+
+def etag(user_id: int, period: str, day: date, version: int) -> str:
+    # The period's window moves with the UTC day, so the day is part of the tag
+    return f'"{user_id}-{period}-{day.isoformat()}-{version}"'
+
+
+def etag_matches(if_none_match: Optional[str], current: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    # If-None-Match uses the weak comparison, so W/"x" matches "x"
+    return "*" in tags or current in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+def _key(user_id: int, period: str, day: date) -> str:
+    return f"{user_id}:{period}:{day.isoformat()}"
+
+
+async def get(user_id: int, period: str, day: date, version: int):
+    """The serialized dashboard if a snapshot at this version is cached, else None"""
+    cached = await backend.get(_key(user_id, period, day))
+    if cached is None:
+        return None
+    cached_version, body = cached.split(" ", 1)
+    return body if int(cached_version) == version else None
+
+
+async def put(user_id: int, period: str, day: date, version: int, body: str):
+    await backend.set(_key(user_id, period, day), f"{version} {body}")
@@ -0,0 +1,37 @@
+from datetime import date
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import models
+from ..money import to_major
+
+
+async def total_earnings_minor(db: AsyncSession, user_id: int):
+    """Sum the amounts of a user's successful transactions per currency, in minor units, in one grouped query"""
+    result = await db.execute(
+        select(models.PaymentLink.currency, func.sum(models.PaymentLink.amount_minor))
+        .join(models.Transaction, models.Transaction.payment_link_id == models.PaymentLink.id)
+        .where(models.PaymentLink.user_id == user_id, models.Transaction.status == "success")
+        .group_by(models.PaymentLink.currency)
+    )
+    # sum(bigint) comes back as numeric
+    return {currency: int(total) for currency, total in result.all()}
+
+
+async def total_earnings(db: AsyncSession, user_id: int):
+    """total_earnings_minor in major units, as the API returns them"""
+    return to_major_totals(await total_earnings_minor(db, user_id))
+
+
+def to_major_totals(totals_minor):
+    return {currency: to_major(total, currency) for currency, total in totals_minor.items()}
+
+
+async def daily_earnings(db: AsyncSession, user_id: int, since: date):
+    """A user's (day, currency, amount in minor units) rows from the daily_earnings rollup, oldest day first"""
+    earnings = models.DailyEarnings
+    result = await db.execute(
+        select(earnings.day, earnings.currency, earnings.amount_minor)
+        .where(earnings.user_id == user_id, earnings.day >= since, earnings.transactions > 0)
+        .order_by(earnings.day, earnings.currency)
+    )
+    return result.all()
@@ -0,0 +1,48 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from .. import utils
+from ..config import settings
+
+
+class HashingOverloaded(Exception):
+    """Raised instead of queueing when too many hash operations are already in flight"""
+
+
+class HashingPool:
+    """Runs bcrypt in a dedicated process pool so login storms cannot starve the event loop or threadpool"""
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            # spawn, not fork: the parent holds an event loop, DB connections and threads
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            raise HashingOverloaded()
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str):
+        return await self._run(utils.hash, password)
+
+    async def verify_and_update(self, password: str, hashed_password: str):
+        return await self._run(utils.verify_and_update, password, hashed_password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+
+hashing_pool = HashingPool(settings.hash_workers, settings.hash_max_pending)
@@ -0,0 +1,115 @@
+import asyncio
+import hashlib
+import secrets
+import string
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import models
+from ..config import settings
+
+CROCKFORD32 = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+BASE62 = string.digits + string.ascii_letters
+
+# Link codes are 7 base62 characters, so they never collide with the legacy
+# 6-character random codes (or their '-<id>' de-duplicated forms)
+LINK_CODE_LENGTH = 7
+HALF_BITS = 20
+HALF_MASK = (1 << HALF_BITS) - 1
+LINK_CODE_SPACE = 1 << (2 * HALF_BITS)  # 2**40 < 62**7
+FEISTEL_ROUNDS = 4
+
+
+class UlidGenerator:
+    """Time-ordered 128-bit ids: 48 bits of milliseconds, then 80 bits that start random each
+    millisecond and count up within it, so ids from one process are strictly increasing."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._sequence = 0
+
+    def new(self) -> str:
+        with self._lock:
+            now_ms = time.time_ns() // 1_000_000
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = secrets.randbits(80)
+            else:
+                # Same millisecond, or the clock stepped back: keep counting from the last id
+                self._sequence += 1
+                if self._sequence >> 80:
+                    self._last_ms += 1
+                    self._sequence = secrets.randbits(79)
+            value = (self._last_ms << 80) | self._sequence
+        return "".join(CROCKFORD32[(value >> shift) & 31] for shift in range(125, -1, -5))
+
+
+ulids = UlidGenerator()
+
+
+def new_transaction_id() -> str:
+    return "txn_" + ulids.new()
+
+
+@lru_cache(maxsize=None)
+def _round_key(key: str) -> bytes:
+    return hashlib.sha256(key.encode()).digest()
+
+
+def _round_function(key: bytes, round_number: int, half: int) -> int:
+    digest = hashlib.blake2b(bytes([round_number]) + half.to_bytes(3, "big"), key=key, digest_size=4).digest()
+    return int.from_bytes(digest, "big") & HALF_MASK
+
+
+def encode_link_code(number: int, key: str = settings.link_code_key) -> str:
+    """Map a sequence number to its link code with a keyed Feistel permutation of [0, 2**40).
+
+    A permutation never maps two numbers to the same code, so codes are unique for as long
+    as the sequence (and the key) are.
+    """
+    if not 0 <= number < LINK_CODE_SPACE:
+        raise ValueError(f"Link code sequence value {number} is outside the code space")
+    round_key = _round_key(key)
+    left, right = number >> HALF_BITS, number & HALF_MASK
+    for round_number in range(FEISTEL_ROUNDS):
+        left, right = right, left ^ _round_function(round_key, round_number, right)
+    permuted = (left << HALF_BITS) | right
+    code = []
+    for _ in range(LINK_CODE_LENGTH):
+        permuted, digit = divmod(permuted, 62)
+        code.append(BASE62[digit])
+    return "".join(reversed(code))
+
+
+class LinkCodeAllocator:
+    """Hands out link codes from blocks of payment_link_code_seq values reserved in one round trip"""
+
+    def __init__(self, block_size: int):
+        self.block_size = block_size
+        self._numbers = deque()
+        self._lock = asyncio.Lock()
+
+    async def take(self, db: AsyncSession, count: int = 1):
+        async with self._lock:
+            if len(self._numbers) < count:
+                needed = max(self.block_size, count - len(self._numbers))
+                # Sequence values are never rolled back, so a block is ours even if the caller's transaction fails
+                block = await db.scalars(
+                    select(models.link_code_seq.next_value()).select_from(func.generate_series(1, needed))
+                )
+                self._numbers.extend(block)
+            return [encode_link_code(self._numbers.popleft()) for _ in range(count)]
+
+    async def next(self, db: AsyncSession) -> str:
+        return (await self.take(db, 1))[0]
+
+    def reset(self):
+        """Forget the reserved block, e.g. after the database was recreated"""
+        self._numbers.clear()
+
+
+link_codes = LinkCodeAllocator(settings.link_code_block_size)
@@ -0,0 +1,131 @@
+import cProfile
+import logging
+import os
+import random
+import re
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+from ..config import settings
+
+REQUEST_ID_HEADER = "X-Request-ID"
+# caller-supplied ids are echoed into logs and file names, so only accept plain tokens
+VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+class RequestStats:
+    """Per-request timing and SQL counters, reachable from engine events through `current_request`"""
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def over_budget(self, elapsed: float):
+        """Names of the budgets this request exceeded"""
+        exceeded = []
+        if elapsed * 1000 > settings.request_budget_ms:
+            exceeded.append("latency")
+        if self.sql_count > settings.request_query_budget:
+            exceeded.append("queries")
+        return exceeded
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+def request_id_from(header: Optional[str]) -> str:
+    if header and VALID_REQUEST_ID.match(header):
+        return header
+    return uuid.uuid4().hex
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps every record logged while a request is in flight with its correlation id"""
+
+    def filter(self, record):
+        stats = current_request.get()
+        if stats is not None:
+            record.request_id = stats.request_id
+        return True
+
+
+def instrument(engine):
+    """Count the statements each request sends through the engine, and the time they take"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if current_request.get() is not None:
+            conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = current_request.get()
+        started = conn.info.get("query_started")
+        if stats is None or not started:
+            return
+        stats.sql_count += 1
+        stats.sql_seconds += time.perf_counter() - started.pop()
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        # failed statements count too; after_cursor_execute never fires for them
+        connection = exception_context.connection
+        if connection is not None:
+            after_cursor_execute(connection, None, None, None, None, False)
+
+
+class Profiler:
+    """Profiles a sample of requests with cProfile and keeps the slow ones in a rotating directory.
+
+    cProfile sees everything the event loop runs while it is enabled, other requests included,
+    and only one profile can be active per process, so at most one request is profiled at a time.
+    """
+
+    def __init__(self):
+        self._active = False
+
+    def start(self) -> Optional[cProfile.Profile]:
+        if self._active or not settings.profile_sample_rate or random.random() >= settings.profile_sample_rate:
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler (e.g. a debugger or an outer cProfile run) already owns the hook
+            return None
+        self._active = True
+        return profile
+
+    def stop(self, profile: cProfile.Profile):
+        profile.disable()
+        self._active = False
+
+    def save(self, profile: cProfile.Profile, name: str) -> str:
+        """Write the profile (readable with pstats or snakeviz) and drop the oldest beyond profile_keep"""
+        os.makedirs(settings.profile_dir, exist_ok=True)
+        name = re.sub(r"[^A-Za-z0-9.-]+", "_", name).strip("_")[:100]
+        path = os.path.join(settings.profile_dir, f"{time.strftime('%Y%m%dT%H%M%S')}-{name}.prof")
+        profile.dump_stats(path)
+        self.rotate()
+        return path
+
+    def rotate(self):
+        profiles = sorted(
+            (entry for entry in os.scandir(settings.profile_dir) if entry.name.endswith(".prof")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for entry in profiles[:max(0, len(profiles) - settings.profile_keep)]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+profiler = Profiler()
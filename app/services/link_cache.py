@@ -0,0 +1,29 @@
+import json
+from fastapi.encoders import jsonable_encoder
+from .. import models
+from ..config import settings
+from .cache import create_backend
+
+backend = create_backend(settings.link_cache_backend, "link", settings.link_cache_size, settings.link_cache_ttl, settings.cache_url)
+
+
+def serialize(link: models.PaymentLink) -> str:
+    payload = {column.name: getattr(link, column.name) for column in models.PaymentLink.__table__.columns}
+    # the form still gets the decimal amount it always did
+    payload["amount"] = link.amount
+    return json.dumps(jsonable_encoder(payload))
+
+
+async def get(link_code: str):
+    """The serialized public payload for link_code, or None on a miss"""
+    return await backend.get(link_code)
+
+
+async def put(link: models.PaymentLink) -> str:
+    payload = serialize(link)
+    await backend.set(link.link_code, payload)
+    return payload
+
+
+async def invalidate(link_code: str):
+    await backend.delete(link_code)
@@ -0,0 +1,119 @@
+"""Prometheus metrics.
+
+Under gunicorn, gunicorn.conf.py sets PROMETHEUS_MULTIPROC_DIR before the workers import the
+app. prometheus_client then keeps every worker's values in its own memory-mapped files, so
+updating them never crosses processes, and /metrics sums the files of all workers (live
+ones only, for the pool gauges).
+
+With metrics_enabled off, every collector below is a no-op stand-in and /metrics answers 404.
+"""
+import os
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import REGISTRY, multiprocess
+from ..config import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# requests that matched no route share one label value, so scanners cannot blow up the series count
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class DisabledCollector:
+    """Accepts the calls the app makes on a collector and records nothing"""
+
+    def labels(self, *values):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+
+def collector(kind, *args, **kwargs):
+    return kind(*args, **kwargs) if settings.metrics_enabled else DisabledCollector()
+
+
+http_request_duration = collector(
+    Histogram,
+    "paylinker_http_request_duration_seconds",
+    "Time to serve a request, until the last body byte",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+transactions_created = collector(
+    Counter,
+    "paylinker_transactions_created_total",
+    "Transactions created, by initial status",
+    ["status"],
+)
+webhook_events = collector(
+    Counter,
+    "paylinker_webhook_events_total",
+    "Stripe webhook events, by type and outcome (duplicate, or how the worker applied it)",
+    ["type", "outcome"],
+)
+stripe_request_duration = collector(
+    Histogram,
+    "paylinker_stripe_request_duration_seconds",
+    "Stripe API calls, by outcome (ok, invalid when Stripe refused the request, error, or rejected while the breaker is open)",
+    ["outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+db_pool_size = collector(
+    Gauge,
+    "paylinker_db_pool_size",
+    "Connections each worker's pool keeps open",
+    multiprocess_mode="livesum",
+)
+db_pool_checked_out = collector(
+    Gauge,
+    "paylinker_db_pool_checked_out",
+    "Connections currently checked out of the pools",
+    multiprocess_mode="livesum",
+)
+db_pool_timeouts = collector(
+    Counter,
+    "paylinker_db_pool_timeouts_total",
+    "Requests that gave up waiting for a pooled connection",
+)
+
+
+def route_template(scope) -> str:
+    """The matched route's path template, e.g. /api/payment-links/{link_code}"""
+    route = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+
+# labels() validates and locks on every call; the set of (method, route, status) is small, so keep the children
+_request_children = {}
+
+
+def observe_request(scope, status_code: int, elapsed: float):
+    key = (scope["method"], route_template(scope), status_code)
+    child = _request_children.get(key)
+    if child is None:
+        child = _request_children[key] = http_request_duration.labels(key[0], key[1], str(status_code))
+    child.observe(elapsed)
+
+
+def exposition():
+    """Returns (body, content type) for a scrape of every worker, or of this process alone"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int):
+    """Drop a dead worker's live gauges; its counters and histograms stay in the totals"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(pid)
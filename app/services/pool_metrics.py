@@ -0,0 +1,90 @@
+import time
+from bisect import bisect_left
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from . import metrics
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; buckets are upper bounds in seconds"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        return {"count": self.count, "sum": self.sum, "buckets": buckets}
+
+
+class PoolMetrics:
+    def __init__(self):
+        # time spent waiting for pool.connect() to hand out a connection
+        self.wait_seconds = Histogram()
+        # time a connection stayed checked out before being returned
+        self.checkout_seconds = Histogram()
+        self.timeouts = 0
+
+    def snapshot(self, pool):
+        stats = {"status": pool.status()}
+        if isinstance(pool, AsyncAdaptedQueuePool):
+            stats.update({
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                "overflow": pool.overflow(),
+            })
+        stats.update({
+            "timeouts": self.timeouts,
+            "wait_seconds": self.wait_seconds.snapshot(),
+            "checkout_seconds": self.checkout_seconds.snapshot(),
+        })
+        return stats
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that records how long callers wait for a connection"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.timeouts += 1
+            metrics.db_pool_timeouts.inc()
+            raise
+        finally:
+            pool_metrics.wait_seconds.observe(time.perf_counter() - started)
+
+
+def instrument(engine):
+    """Track how long each connection of the engine's pool is held"""
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["checked_out_at"] = time.perf_counter()
+        metrics.db_pool_checked_out.inc()
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        started = connection_record.info.pop("checked_out_at", None)
+        if started is not None:
+            metrics.db_pool_checked_out.dec()
+            pool_metrics.checkout_seconds.observe(time.perf_counter() - started)
@@ -0,0 +1,178 @@
+import asyncio
+import json
+from abc import ABC, abstractmethod
+from collections import defaultdict
+import asyncpg
+from sqlalchemy import text
+from ..config import settings
+from ..database import async_engine, SQLALCHEMY_DATABASE_URL
+from ..logger import logger
+
+EARNINGS_CHANNEL = "earnings"
+SUBSCRIBER_QUEUE_SIZE = 100
+RESYNC = {"resync": True}
+
+
+class Broker(ABC):
+    """Carries published messages to every hub that has been started with it.
+
+    deliver() is always invoked on the event loop that called start().
+    """
+
+    @abstractmethod
+    async def start(self, deliver):
+        ...
+
+    async def stop(self):
+        pass
+
+    @abstractmethod
+    async def publish(self, message: dict):
+        ...
+
+
+class InMemoryBroker(Broker):
+    """Delivers messages within the current process only"""
+
+    def __init__(self):
+        self._loop = None
+        self._deliver = None
+
+    async def start(self, deliver):
+        self._loop = asyncio.get_running_loop()
+        self._deliver = deliver
+
+    async def stop(self):
+        self._loop = None
+
+    async def publish(self, message: dict):
+        loop = self._loop
+        if loop is None:
+            return
+        loop.call_soon_threadsafe(self._deliver, message)
+
+
+class PostgresBroker(Broker):
+    """Fans messages out across processes with LISTEN/NOTIFY so every gunicorn worker sees them"""
+
+    reconnect_delay = 1.0
+
+    def __init__(self, dsn: str = SQLALCHEMY_DATABASE_URL, channel: str = EARNINGS_CHANNEL):
+        self.dsn = dsn
+        self.channel = channel
+        self._deliver = None
+        self._conn = None
+        self._reconnecting = None
+
+    async def start(self, deliver):
+        self._deliver = deliver
+        await self._listen()
+
+    async def stop(self):
+        self._deliver = None
+        if self._reconnecting is not None:
+            self._reconnecting.cancel()
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            await conn.close()
+
+    async def publish(self, message: dict):
+        async with async_engine.begin() as conn:
+            await conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": self.channel, "payload": json.dumps(message)})
+
+    async def _listen(self):
+        conn = await asyncpg.connect(self.dsn)
+        conn.add_termination_listener(self._on_terminated)
+        await conn.add_listener(self.channel, self._on_notify)
+        self._conn = conn
+
+    def _on_notify(self, conn, pid, channel, payload):
+        self._deliver(json.loads(payload))
+
+    def _on_terminated(self, conn):
+        if self._deliver is None or conn is not self._conn:
+            return
+        logger.error("Lost LISTEN connection on channel %s, reconnecting", self.channel)
+        self._conn = None
+        self._reconnecting = asyncio.get_running_loop().create_task(self._reconnect())
+
+    async def _reconnect(self):
+        while self._deliver is not None and self._conn is None:
+            await asyncio.sleep(self.reconnect_delay)
+            try:
+                await self._listen()
+            except (OSError, asyncpg.PostgresError):
+                logger.warning("Reconnecting LISTEN on channel %s failed", self.channel)
+            else:
+                # Deltas may have been missed while disconnected
+                self._deliver(RESYNC)
+
+
+class EarningsHub:
+    """Pushes per-user earnings deltas to subscribed dashboard sockets"""
+
+    def __init__(self, broker: Broker):
+        self.broker = broker
+        self._subscribers = defaultdict(set)
+
+    async def start(self):
+        await self.broker.start(self._dispatch)
+
+    async def stop(self):
+        await self.broker.stop()
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers[user_id].add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[user_id]
+
+    async def publish(self, user_id: int, currency: str, amount_minor: int, version: int):
+        """version is the user's dashboard version the change committed with; sockets skip deltas their snapshot already has"""
+        await self.broker.publish({"user_id": user_id, "currency": currency, "amount_minor": amount_minor, "version": version})
+
+    async def publish_transition(self, payment_link, old_status, new_status, version: int):
+        """Publish the earnings delta of a transaction status change, if it has one. Call after commit."""
+        amount_minor = 0
+        if new_status == "success":
+            amount_minor += payment_link.amount_minor
+        if old_status == "success":
+            amount_minor -= payment_link.amount_minor
+        if amount_minor:
+            await self.publish(payment_link.user_id, payment_link.currency, amount_minor, version)
+
+    async def publish_resync(self, user_id: int):
+        """Have the user's sockets reload their totals, after a change that is not a transaction delta. Call after commit."""
+        await self.broker.publish({"user_id": user_id, **RESYNC})
+
+    def _dispatch(self, message: dict):
+        if message.get("resync") and "user_id" not in message:
+            targets = [queue for queues in self._subscribers.values() for queue in queues]
+        else:
+            targets = self._subscribers.get(message["user_id"], ())
+        for queue in targets:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # A slow socket gets one resync instead of an unbounded backlog
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC)
+
+
+def create_broker(backend: str) -> Broker:
+    if backend == "memory":
+        return InMemoryBroker()
+    if backend == "postgres":
+        return PostgresBroker()
+    raise ValueError(f"Unknown pubsub backend: {backend}")
+
+
+earnings_hub = EarningsHub(create_broker(settings.pubsub_backend))
@@ -0,0 +1,275 @@
+from datetime import date
+from typing import NamedTuple, Optional
+from sqlalchemy import Date, cast, delete, func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import models
+from . import dashboard_cache
+
+
+class Transition(NamedTuple):
+    """A transaction moving from old_status to new_status (old_status is None for a new transaction).
+
+    user_id and currency feed daily_earnings. day is the UTC date of the transaction's
+    created_at; None means a transaction created in the current DB transaction.
+    """
+    payment_link_id: int
+    # the link's amount in minor units
+    amount_minor: int
+    old_status: Optional[str]
+    new_status: str
+    user_id: Optional[int] = None
+    currency: Optional[str] = None
+    day: Optional[date] = None
+
+
+def utc_day(timestamp):
+    """The UTC calendar date of a timestamptz column or expression"""
+    return cast(func.timezone("UTC", timestamp), Date)
+
+
+def _link_stats_deltas(transitions):
+    deltas = {}
+    for t in transitions:
+        if t.old_status == t.new_status:
+            continue
+        delta = deltas.setdefault(t.payment_link_id, {"total": 0, "success": 0, "failure": 0, "amount": 0})
+        if t.old_status is None:
+            delta["total"] += 1
+        if t.old_status in ("success", "failure"):
+            delta[t.old_status] -= 1
+        if t.new_status in ("success", "failure"):
+            delta[t.new_status] += 1
+        if t.old_status == "success":
+            delta["amount"] -= t.amount_minor
+        if t.new_status == "success":
+            delta["amount"] += t.amount_minor
+    return deltas
+
+
+def _daily_earnings_deltas(transitions):
+    deltas = {}
+    for t in transitions:
+        if t.old_status == t.new_status or t.user_id is None or "success" not in (t.old_status, t.new_status):
+            continue
+        delta = deltas.setdefault((t.user_id, t.day, t.currency), {"amount": 0, "transactions": 0})
+        sign = 1 if t.new_status == "success" else -1
+        delta["amount"] += sign * t.amount_minor
+        delta["transactions"] += sign
+    return deltas
+
+
+async def record_transitions(db: AsyncSession, transitions):
+    """Apply transaction status transitions to the rollup tables and bump the owners' dashboard versions.
+
+    Must be called before the caller commits so the rollups are written in the
+    same DB transaction as the transaction rows they summarize. Returns the
+    owners' new versions, {user_id: version}, to tag the earnings deltas with.
+    """
+    transitions = [t for t in transitions if t.old_status != t.new_status]
+    await _record_link_stats(db, _link_stats_deltas(transitions))
+    await _record_daily_earnings(db, _daily_earnings_deltas(transitions))
+    return await dashboard_cache.bump(db, (t.user_id for t in transitions))
+
+
+async def _record_link_stats(db: AsyncSession, deltas):
+    if not deltas:
+        return
+    # Sorted by link so concurrent writers take the row locks in the same order
+    stmt = insert(models.LinkStats).values([
+        {
+            "payment_link_id": link_id,
+            "total_transactions": delta["total"],
+            "successful_transactions": delta["success"],
+            "failed_transactions": delta["failure"],
+            "success_amount_minor": delta["amount"],
+        }
+        for link_id, delta in sorted(deltas.items())
+    ])
+    stats = models.LinkStats
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[stats.payment_link_id],
+        set_={
+            "total_transactions": stats.total_transactions + stmt.excluded.total_transactions,
+            "successful_transactions": stats.successful_transactions + stmt.excluded.successful_transactions,
+            "failed_transactions": stats.failed_transactions + stmt.excluded.failed_transactions,
+            "success_amount_minor": stats.success_amount_minor + stmt.excluded.success_amount_minor,
+            "updated_at": func.now(),
+        },
+    )
+    await db.execute(stmt)
+
+
+async def _record_daily_earnings(db: AsyncSession, deltas):
+    if not deltas:
+        return
+    # created_at defaults to now(), the start of the DB transaction, so this is the new row's day
+    today = utc_day(func.now())
+    # Same lock ordering as link_stats: by user, then day (today's sorts last), then currency
+    keys = sorted(deltas, key=lambda key: (key[0], key[1] or date.max, key[2]))
+    stmt = insert(models.DailyEarnings).values([
+        {
+            "user_id": user_id,
+            "day": today if day is None else day,
+            "currency": currency,
+            "amount_minor": deltas[user_id, day, currency]["amount"],
+            "transactions": deltas[user_id, day, currency]["transactions"],
+        }
+        for user_id, day, currency in keys
+    ])
+    earnings = models.DailyEarnings
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[earnings.user_id, earnings.day, earnings.currency],
+        set_={
+            "amount_minor": earnings.amount_minor + stmt.excluded.amount_minor,
+            "transactions": earnings.transactions + stmt.excluded.transactions,
+            "updated_at": func.now(),
+        },
+    )
+    await db.execute(stmt)
+
+
+async def record_transition(db: AsyncSession, payment_link: models.PaymentLink, old_status: Optional[str], new_status: str, day: Optional[date] = None):
+    return await record_transitions(db, [Transition(
+        payment_link.id, payment_link.amount_minor, old_status, new_status, payment_link.user_id, payment_link.currency, day,
+    )])
+
+
+async def _successes_by_day(db: AsyncSession, link_id: int):
+    """(UTC day, count) of a link's successful transactions"""
+    transaction = models.Transaction
+    day = utc_day(transaction.created_at)
+    return (await db.execute(
+        select(day, func.count())
+        .where(transaction.payment_link_id == link_id, transaction.status == "success")
+        .group_by(day)
+    )).all()
+
+
+async def reprice_link(db: AsyncSession, payment_link: models.PaymentLink, old_amount_minor: int, old_currency: str):
+    """Move a link's successful transactions in the rollups from its old amount and currency to its current ones.
+
+    Earnings are always the link's current amount, as total_earnings and the reconcile jobs
+    count them. Call it after the new values are flushed, with the link row locked
+    (SELECT ... FOR UPDATE) since before the old values were read: writers share-lock the
+    link before reading its amount, so none of its transitions is in flight. The caller bumps
+    the owner's dashboard version.
+    """
+    if (payment_link.amount_minor, payment_link.currency) == (old_amount_minor, old_currency):
+        return
+    counts = await _successes_by_day(db, payment_link.id)
+    if not counts:
+        return
+    successes = sum(count for _, count in counts)
+    await _record_link_stats(db, {payment_link.id: {
+        "total": 0, "success": 0, "failure": 0, "amount": successes * (payment_link.amount_minor - old_amount_minor),
+    }})
+    deltas = {}
+    for created_day, count in counts:
+        for currency, amount_minor, sign in ((old_currency, old_amount_minor, -1), (payment_link.currency, payment_link.amount_minor, 1)):
+            delta = deltas.setdefault((payment_link.user_id, created_day, currency), {"amount": 0, "transactions": 0})
+            delta["amount"] += sign * count * amount_minor
+            delta["transactions"] += sign * count
+    await _record_daily_earnings(db, deltas)
+
+
+async def remove_link(db: AsyncSession, payment_link: models.PaymentLink):
+    """Take a link's successful transactions out of daily_earnings before the link is deleted.
+
+    The transactions outlive the link with no payment_link_id, so total_earnings and the
+    reconcile job stop counting them; its link_stats row goes with it (ON DELETE CASCADE).
+    Call it with the link row locked, as for reprice_link. The caller bumps the owner's
+    dashboard version.
+    """
+    await _record_daily_earnings(db, {
+        (payment_link.user_id, created_day, payment_link.currency): {
+            "amount": -count * payment_link.amount_minor, "transactions": -count,
+        }
+        for created_day, count in await _successes_by_day(db, payment_link.id)
+    })
+
+
+async def _lock_for_rebuild(db: AsyncSession):
+    """Hold off rollup writers until the caller commits.
+
+    The rebuilds overwrite rows from what one statement sees, so a writer's delta committed
+    after that statement started would be lost. EXCLUSIVE mode still lets the dashboards read,
+    waits for writers that have already written, and makes new ones wait; a writer whose
+    transaction is not visible yet adds its delta on top of the rebuilt row once it gets in.
+    Both tables are taken in the writers' order, so calling both rebuilds in one transaction
+    cannot deadlock.
+    """
+    await db.execute(text("LOCK TABLE link_stats, daily_earnings IN EXCLUSIVE MODE"))
+
+
+async def reconcile_link_stats(db: AsyncSession, link_ids=None):
+    """Recompute link_stats from the transactions table, fixing any drift. Returns the number of rows written.
+
+    Rollup writers wait until the caller commits.
+    """
+    await _lock_for_rebuild(db)
+    transaction = models.Transaction
+    link = models.PaymentLink
+    is_success = transaction.status == "success"
+    source = (
+        select(
+            link.id,
+            func.count(transaction.id),
+            func.count(transaction.id).filter(is_success),
+            func.count(transaction.id).filter(transaction.status == "failure"),
+            func.coalesce(func.sum(link.amount_minor).filter(is_success), 0),
+        )
+        .outerjoin(transaction, transaction.payment_link_id == link.id)
+        .group_by(link.id)
+    )
+    if link_ids is not None:
+        source = source.where(link.id.in_(link_ids))
+
+    stmt = insert(models.LinkStats).from_select(
+        ["payment_link_id", "total_transactions", "successful_transactions", "failed_transactions", "success_amount_minor"],
+        source,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.LinkStats.payment_link_id],
+        set_={
+            "total_transactions": stmt.excluded.total_transactions,
+            "successful_transactions": stmt.excluded.successful_transactions,
+            "failed_transactions": stmt.excluded.failed_transactions,
+            "success_amount_minor": stmt.excluded.success_amount_minor,
+            "updated_at": func.now(),
+        },
+    )
+    count = (await db.execute(stmt)).rowcount
+    if link_ids is None:
+        await dashboard_cache.bump(db)
+    else:
+        await dashboard_cache.bump(db, await db.scalars(select(link.user_id).where(link.id.in_(link_ids))))
+    return count
+
+
+async def reconcile_daily_earnings(db: AsyncSession, user_ids=None):
+    """Rebuild daily_earnings from the successful transactions. Returns the number of rows written.
+
+    Rollup writers wait until the caller commits.
+    """
+    await _lock_for_rebuild(db)
+    transaction = models.Transaction
+    link = models.PaymentLink
+    day = utc_day(transaction.created_at)
+    source = (
+        select(link.user_id, day, link.currency, func.sum(link.amount_minor), func.count(transaction.id))
+        .join(link, link.id == transaction.payment_link_id)
+        .where(transaction.status == "success")
+        .group_by(link.user_id, day, link.currency)
+    )
+    clear = delete(models.DailyEarnings)
+    if user_ids is not None:
+        source = source.where(link.user_id.in_(user_ids))
+        clear = clear.where(models.DailyEarnings.user_id.in_(user_ids))
+
+    # Days whose transactions have all gone would survive an upsert, so start from empty
+    await db.execute(clear)
+    stmt = insert(models.DailyEarnings).from_select(["user_id", "day", "currency", "amount_minor", "transactions"], source)
+    count = (await db.execute(stmt)).rowcount
+    await dashboard_cache.bump(db, user_ids)
+    return count
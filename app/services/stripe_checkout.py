@@ -0,0 +1,255 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import NamedTuple
+from ..config import settings
+from ..logger import logger
+from . import metrics
+
+# A spare session is no longer handed out once it has less than this long to live
+SPARE_MIN_REMAINING = 600
+
+
+@lru_cache
+def unavailable_errors():
+    """Errors that say Stripe is unreachable or unhealthy, as opposed to rejecting our request.
+
+    The SDK takes a while to import, so it is loaded on the first Stripe call rather than at worker boot.
+    """
+    import stripe
+    return (stripe.APIConnectionError, stripe.APIError, stripe.RateLimitError)
+
+
+class StripeUnavailable(Exception):
+    """Stripe failed or timed out, or the circuit breaker is open; answered with a 503"""
+
+
+class CircuitBreaker:
+    """Fails fast after `failure_threshold` consecutive failures, then lets one trial call through every `reset_timeout` seconds"""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            return True
+        # open, or half-open with the trial call still in flight
+        return False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning("Stripe circuit breaker opened after %d failures", self.failures)
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def stats(self):
+        return {"state": self.state, "failures": self.failures}
+
+
+class Spare(NamedTuple):
+    """A checkout session created ahead of time for a transaction id not yet in the database"""
+    transaction_id: str
+    url: str
+    expires_at: int
+    # (amount_minor, currency, description) of the link when the session was created
+    fingerprint: tuple
+
+
+def fingerprint(payment_link):
+    return (payment_link.amount_minor, payment_link.currency, payment_link.description)
+
+
+class CheckoutClient:
+    """Creates Stripe Checkout sessions over a pooled keep-alive connection without blocking the event loop.
+
+    With `prefetch` > 0, up to that many sessions are kept ready for each of the
+    `prefetch_links` most recently opened links, so a repeat visit skips the round trip.
+    """
+
+    def __init__(
+        self,
+        api_key: str = settings.stripe_key,
+        api_base: str = settings.stripe_api_base,
+        timeout: float = settings.stripe_timeout,
+        breaker: CircuitBreaker = None,
+        prefetch: int = settings.stripe_session_prefetch,
+        prefetch_links: int = settings.stripe_session_prefetch_links,
+        session_ttl: int = settings.stripe_session_ttl,
+    ):
+        self.api_key = api_key
+        self.api_base = api_base
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker(settings.stripe_breaker_failures, settings.stripe_breaker_reset)
+        self.prefetch = prefetch
+        self.prefetch_links = prefetch_links
+        self.session_ttl = session_ttl
+        self._client = None
+        self._http_client = None
+        self._spares = OrderedDict()
+        self._refills = {}
+        # link id -> fingerprint Stripe refused to create sessions for; not refilled until it changes
+        self._refused = {}
+        self.spare_hits = 0
+        self.spare_misses = 0
+
+    def _stripe(self):
+        # Created lazily so the connection pool belongs to the serving event loop
+        if self._client is None:
+            import stripe
+            self._http_client = stripe.HTTPXClient(timeout=self.timeout)
+            self._client = stripe.StripeClient(
+                self.api_key,
+                http_client=self._http_client,
+                base_addresses={"api": self.api_base},
+                # retries would hold the request for several timeouts; the breaker handles outages
+                max_network_retries=0,
+            )
+        return self._client
+
+    async def _send(self, params: dict):
+        client = self._stripe()
+        # Services moved under StripeClient.v1 in later SDK releases; older ones only have them at the top level
+        return await getattr(client, "v1", client).checkout.sessions.create_async(params)
+
+    async def _create(self, payment_link, transaction_id: str, expires_at: int = None):
+        if not self.breaker.allow():
+            metrics.stripe_request_duration.labels("rejected").observe(0)
+            raise StripeUnavailable("Stripe circuit breaker is open")
+        params = {
+            "payment_method_types": ["card"],
+            "line_items": [
+                {
+                    "price_data": {
+                        "currency": payment_link.currency,
+                        "product_data": {
+                            "name": payment_link.description,
+                        },
+                        # Stripe takes the smallest currency unit too, so zero-decimal currencies pass through as-is
+                        "unit_amount": payment_link.amount_minor,
+                    },
+                    "quantity": 1,
+                },
+            ],
+            "mode": "payment",
+            "success_url": f"{settings.client_url}/success?session_id={{CHECKOUT_SESSION_ID}}",
+            "cancel_url": f"{settings.client_url}/cancel",
+            "metadata": {
+                "transaction_id": transaction_id
+            },
+        }
+        if expires_at is not None:
+            params["expires_at"] = expires_at
+        errors = unavailable_errors()
+        started = time.perf_counter()
+        # Settled on every way out, or a half-open breaker would wait for its trial call forever
+        outcome = "error"
+        try:
+            session = await self._send(params)
+            outcome = "ok"
+        except errors as e:
+            logger.error("Stripe session creation failed for transaction ID %s: %s", transaction_id, e)
+            raise StripeUnavailable(str(e)) from e
+        except asyncio.CancelledError:
+            # We gave up waiting, which says nothing good about Stripe
+            raise
+        except Exception:
+            # Stripe answered and refused the request, so it is up
+            outcome = "invalid"
+            raise
+        finally:
+            metrics.stripe_request_duration.labels(outcome).observe(time.perf_counter() - started)
+            if outcome == "error":
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+        return session
+
+    async def create_session(self, payment_link, transaction_id: str) -> str:
+        """Create a checkout session for the transaction and return its URL"""
+        session = await self._create(payment_link, transaction_id)
+        return session.url
+
+    def take_spare(self, payment_link):
+        """A ready session for the link in its current state, or None"""
+        if not self.prefetch:
+            return None
+        spares = self._spares.get(payment_link.id)
+        deadline = time.time() + SPARE_MIN_REMAINING
+        while spares:
+            spare = spares.popleft()
+            # Another worker may have edited the link since; never charge a stale amount
+            if spare.expires_at > deadline and spare.fingerprint == fingerprint(payment_link):
+                self.spare_hits += 1
+                return spare
+        self.spare_misses += 1
+        return None
+
+    def refill(self, payment_link, new_transaction_id):
+        """Top the link's spares back up in the background"""
+        if not self.prefetch or payment_link.id in self._refills:
+            return
+        if self._refused.get(payment_link.id) == fingerprint(payment_link):
+            return
+        self._spares.setdefault(payment_link.id, deque())
+        self._spares.move_to_end(payment_link.id)
+        while len(self._spares) > self.prefetch_links:
+            evicted, _ = self._spares.popitem(last=False)
+            self._refused.pop(evicted, None)
+        task = asyncio.get_running_loop().create_task(self._refill(payment_link, new_transaction_id))
+        self._refills[payment_link.id] = task
+        task.add_done_callback(lambda _: self._refills.pop(payment_link.id, None))
+
+    async def _refill(self, payment_link, new_transaction_id):
+        spares = self._spares.get(payment_link.id)
+        while spares is not None and len(spares) < self.prefetch and self._spares.get(payment_link.id) is spares:
+            transaction_id = new_transaction_id()
+            expires_at = int(time.time()) + self.session_ttl
+            try:
+                session = await self._create(payment_link, transaction_id, expires_at)
+            except StripeUnavailable:
+                return
+            except Exception:
+                # Nobody awaits this task; a request Stripe refuses once it will refuse again
+                logger.exception("Pre-creating a Stripe session for payment link ID %s failed", payment_link.id)
+                self._refused[payment_link.id] = fingerprint(payment_link)
+                return
+            spares.append(Spare(transaction_id, session.url, expires_at, fingerprint(payment_link)))
+
+    def discard(self, link_id: int):
+        """Drop the spares of a link that was edited or deleted"""
+        self._spares.pop(link_id, None)
+        self._refused.pop(link_id, None)
+
+    async def close(self):
+        for task in list(self._refills.values()):
+            task.cancel()
+        if self._http_client is not None:
+            http_client, self._client, self._http_client = self._http_client, None, None
+            await http_client.close_async()
+
+    def stats(self):
+        return {
+            "breaker": self.breaker.stats(),
+            "prefetch": self.prefetch,
+            "links": len(self._spares),
+            "spares": sum(len(spares) for spares in self._spares.values()),
+            "spare_hits": self.spare_hits,
+            "spare_misses": self.spare_misses,
+        }
+
+
+stripe_checkout = CheckoutClient()
@@ -0,0 +1,224 @@
+import asyncio
+from collections import Counter
+from typing import NamedTuple
+from sqlalchemy import String, case, column, func, select, update, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import models
+from ..config import settings
+from ..database import AsyncSessionLocal
+from ..logger import logger
+from . import metrics, rollups
+from .pubsub import earnings_hub
+
+# Stripe event type -> the transaction status it settles to
+STATUS_BY_EVENT = {
+    "checkout.session.completed": "success",
+    "checkout.session.async_payment_failed": "failure",
+}
+
+
+async def ingest(db: AsyncSession, event: dict) -> bool:
+    """Record a verified event for the worker. Returns False if Stripe already delivered it."""
+    stmt = (
+        insert(models.StripeEvent)
+        .values(id=event["id"], type=event["type"], payload=event)
+        .on_conflict_do_nothing(index_elements=[models.StripeEvent.id])
+        .returning(models.StripeEvent.id)
+    )
+    inserted = await db.scalar(stmt)
+    await db.commit()
+    return inserted is not None
+
+
+class LinkSnapshot(NamedTuple):
+    """The payment link columns rollups and earnings deltas need, as read while applying a batch"""
+    id: int
+    user_id: int
+    amount_minor: int
+    currency: str
+
+
+def _transitions(events):
+    """Map each event id to its outcome, for events that change nothing, and each transaction id to its latest event"""
+    outcomes, latest = {}, {}
+    for event in events:
+        new_status = STATUS_BY_EVENT.get(event["type"])
+        session = (event.get("data") or {}).get("object") or {}
+        transaction_id = (session.get("metadata") or {}).get("transaction_id")
+        if new_status is None or not transaction_id:
+            outcomes[event["id"]] = "ignored"
+            continue
+        if transaction_id in latest:
+            # A later event for the same transaction in the batch wins
+            outcomes[latest[transaction_id][0]] = "superseded"
+        latest[transaction_id] = (event["id"], new_status)
+    return outcomes, latest
+
+
+async def apply_events(db: AsyncSession, events):
+    """Apply the status changes carried by a batch of events in the caller's DB transaction.
+
+    Returns ({event_id: outcome}, changes). Outcomes are applied, unchanged, not_found,
+    superseded (a later event in the batch targets the same transaction) or ignored.
+    Changes are (payment_link, old_status, new_status, dashboard version) to publish once the caller has committed.
+    """
+    outcomes, latest = _transitions(events)
+    if not latest:
+        return outcomes, []
+
+    transaction, link = models.Transaction, models.PaymentLink
+    # Share-lock the links so an edit cannot reprice them between reading their amounts below and commit
+    await db.execute(
+        select(link.id)
+        .join(transaction, transaction.payment_link_id == link.id)
+        .where(transaction.transaction_id.in_(latest))
+        .order_by(link.id)
+        .with_for_update(of=link, read=True)
+    )
+    # Lock the rows first (in id order, so concurrent batches cannot deadlock) and read their
+    # current status; the UPDATE then joins against it to hand back old and new status together
+    old = (
+        select(
+            transaction.id, transaction.status, link.id.label("payment_link_id"), link.user_id, link.amount_minor, link.currency,
+            rollups.utc_day(transaction.created_at).label("day"),
+        )
+        .outerjoin(link, link.id == transaction.payment_link_id)
+        .where(transaction.transaction_id.in_(latest))
+        .order_by(transaction.id)
+        .with_for_update(of=transaction)
+        .cte("old")
+    )
+    new = values(column("transaction_id", String), column("status", String), name="new").data(
+        [(transaction_id, status) for transaction_id, (_, status) in latest.items()]
+    )
+    stmt = (
+        update(transaction)
+        .where(transaction.id == old.c.id, transaction.transaction_id == new.c.transaction_id)
+        .values(
+            status=new.c.status,
+            payment_method=case((new.c.status == "success", "credit_card"), else_=transaction.payment_method),
+            updated_at=func.now(),
+        )
+        .returning(transaction.transaction_id, old.c.status, new.c.status, old.c.payment_link_id, old.c.user_id, old.c.amount_minor, old.c.currency, old.c.day)
+        .execution_options(synchronize_session=False)
+    )
+    rows = (await db.execute(stmt)).all()
+
+    changes, transitions = [], []
+    for transaction_id, old_status, new_status, link_id, user_id, amount_minor, currency, day in rows:
+        event_id = latest.pop(transaction_id)[0]
+        outcomes[event_id] = "unchanged" if old_status == new_status else "applied"
+        if old_status != new_status and link_id is not None:
+            changes.append((LinkSnapshot(link_id, user_id, amount_minor, currency), old_status, new_status))
+            transitions.append(rollups.Transition(link_id, amount_minor, old_status, new_status, user_id, currency, day))
+    for transaction_id, (event_id, _) in latest.items():
+        logger.warning("Transaction ID not found for session: %s", transaction_id)
+        outcomes[event_id] = "not_found"
+
+    versions = await rollups.record_transitions(db, transitions)
+    return outcomes, [(link, old_status, new_status, versions[link.user_id]) for link, old_status, new_status in changes]
+
+
+async def process_pending(session_factory=AsyncSessionLocal, limit: int = settings.webhook_batch_size) -> int:
+    """Apply up to `limit` unprocessed events in one DB transaction. Returns how many were taken."""
+    async with session_factory() as db:
+        # SKIP LOCKED lets the worker in every gunicorn process drain the queue without double-applying
+        events = (await db.execute(
+            select(models.StripeEvent.payload)
+            .where(models.StripeEvent.processed_at.is_(None))
+            .order_by(models.StripeEvent.received_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )).scalars().all()
+        if not events:
+            return 0
+        outcomes, changes = await apply_events(db, events)
+        processed = values(column("id", String), column("outcome", String), name="processed").data(list(outcomes.items()))
+        await db.execute(
+            update(models.StripeEvent)
+            .where(models.StripeEvent.id == processed.c.id)
+            .values(processed_at=func.now(), outcome=processed.c.outcome)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+    for event in events:
+        metrics.webhook_events.labels(event["type"], outcomes[event["id"]]).inc()
+    for payment_link, old_status, new_status, version in changes:
+        await earnings_hub.publish_transition(payment_link, old_status, new_status, version)
+    counts = Counter(outcomes.values())
+    logger.info("Applied %d webhook events: %s", len(events), ", ".join(f"{count} {outcome}" for outcome, count in sorted(counts.items())))
+    return len(events)
+
+
+class WebhookWorker:
+    """Drains the stripe_events queue in the background; the webhook route only wakes it.
+
+    After a wake-up the worker waits up to batch_window seconds (or until batch_size
+    events have arrived) so a burst of events lands in one DB transaction.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        batch_size: int = settings.webhook_batch_size,
+        poll_interval: float = settings.webhook_poll_interval,
+        batch_window: float = settings.webhook_batch_window_ms / 1000,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.batch_window = batch_window
+        self._wakeup = None
+        self._batch_full = None
+        self._arrived = 0
+        self._task = None
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        # Anything left unprocessed by a previous run is picked up on the first pass
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        task, self._task = self._task, None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    def wake(self):
+        if self._wakeup is None:
+            return
+        self._arrived += 1
+        self._wakeup.set()
+        if self._arrived >= self.batch_size:
+            self._batch_full.set()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            self._batch_full.clear()
+            self._arrived = 0
+            try:
+                taken = await process_pending(self.session_factory, self.batch_size)
+            except Exception:
+                logger.exception("Applying webhook events failed")
+                taken = 0
+            if taken == self.batch_size:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                continue
+            try:
+                await asyncio.wait_for(self._batch_full.wait(), self.batch_window)
+            except asyncio.TimeoutError:
+                pass
+
+
+webhook_worker = WebhookWorker()
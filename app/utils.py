@@ -1,6 +1,7 @@
 from passlib.context import CryptContext
+from .config import settings
 
-pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto', bcrypt__rounds=settings.bcrypt_rounds)
 
 
 def hash(password: str):
@@ -9,3 +10,8 @@ def hash(password: str):
 
 def verify(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
+
+
+def verify_and_update(plain_password, hashed_password):
+    """Returns (valid, new_hash); new_hash is set when the stored hash uses a different bcrypt cost"""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
@@ -0,0 +1,101 @@
+"""Compare the sync (threadpool) and async database paths under concurrent load.
+
+Usage: DATABASE_NAME=paylinker_bench python -m bench.bench_async_db [--requests N] [--concurrency C]
+
+Seeds a user with payment links and transactions into the configured database
+(point DATABASE_NAME at a scratch database), then runs the same per-request
+query mix - the public link-by-code lookup followed by the dashboard earnings
+aggregate - two ways:
+
+  sync   psycopg2 Sessions on AnyIO's worker threads, the way FastAPI runs `def` routes
+  async  asyncpg AsyncSessions awaited on the event loop, the way the routers run now
+"""
+import argparse
+import asyncio
+import time
+import anyio
+from sqlalchemy import func, select
+from app import models
+from app.database import AsyncSessionLocal, SessionLocal, async_engine, engine
+from app.services import earnings
+from .common import report
+
+BENCH_EMAIL = "bench@paylinker.local"
+
+
+def seed(links=50, transactions_per_link=20):
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.email == BENCH_EMAIL).first()
+        if user is None:
+            user = models.User(email=BENCH_EMAIL, password="not-a-real-hash")
+            db.add(user)
+            db.flush()
+            for i in range(links):
+                link = models.PaymentLink(user_id=user.id, amount=10 + i, currency="USD", link_code=f"bench{i:04d}", link_url="http://bench")
+                db.add(link)
+                db.flush()
+                db.add_all(
+                    models.Transaction(payment_link_id=link.id, user_id=user.id, transaction_id=f"bench_{link.id}_{n}", status="success")
+                    for n in range(transactions_per_link)
+                )
+            db.commit()
+        codes = [code for (code,) in db.query(models.PaymentLink.link_code).filter(models.PaymentLink.user_id == user.id)]
+        return user.id, codes
+    finally:
+        db.close()
+
+
+def sync_request(user_id, code):
+    db = SessionLocal()
+    try:
+        db.query(models.PaymentLink).filter(models.PaymentLink.link_code == code).first()
+        db.query(models.PaymentLink.currency, func.sum(models.PaymentLink.amount_minor)).join(models.Transaction).filter(
+            models.PaymentLink.user_id == user_id, models.Transaction.status == "success"
+        ).group_by(models.PaymentLink.currency).all()
+    finally:
+        db.close()
+
+
+async def async_request(user_id, code):
+    async with AsyncSessionLocal() as db:
+        await db.scalar(select(models.PaymentLink).where(models.PaymentLink.link_code == code))
+        await earnings.total_earnings(db, user_id)
+
+
+async def run(name, handler, user_id, codes, requests, concurrency):
+    latencies = []
+    limiter = anyio.Semaphore(concurrency)
+
+    async def one(i):
+        async with limiter:
+            started = time.perf_counter()
+            await handler(user_id, codes[i % len(codes)])
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    async with anyio.create_task_group() as tg:
+        for i in range(requests):
+            tg.start_soon(one, i)
+    report(name, requests, time.perf_counter() - started, latencies)
+
+
+async def main(requests, concurrency):
+    user_id, codes = seed()
+
+    async def in_threadpool(user_id, code):
+        await anyio.to_thread.run_sync(sync_request, user_id, code)
+
+    print(f"{requests} requests, concurrency {concurrency}")
+    await run("sync (threadpool)", in_threadpool, user_id, codes, requests, concurrency)
+    await run("async (event loop)", async_request, user_id, codes, requests, concurrency)
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
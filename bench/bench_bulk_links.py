@@ -0,0 +1,96 @@
+"""Payment link creation: one POST per link vs POST /api/payment-links/bulk.
+
+Usage: DATABASE_NAME=paylinker_bench python -m bench.bench_bulk_links [--links N] [--concurrency C] [--chunks 100 500]
+
+Creates N links for a bench user three ways, driven in-process through httpx's
+ASGI transport: one POST /api/payment-links/ per link (C in flight at once),
+then a single bulk request with each chunk size (answered as JSON when N fits
+in one chunk, streamed as NDJSON otherwise). Reports links created per second.
+"""
+import argparse
+import asyncio
+import time
+import httpx
+from sqlalchemy import delete
+from app import models
+from app.config import settings
+from app.database import SessionLocal, async_engine
+from app.main import app
+from app.router.oauth2 import create_access_token
+from .common import report
+
+BENCH_EMAIL = "bench-links@paylinker.local"
+
+
+def seed():
+    db = SessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.email == BENCH_EMAIL).first()
+        if user is None:
+            user = models.User(email=BENCH_EMAIL, password="not-a-real-hash")
+            db.add(user)
+            db.commit()
+        return user.id
+    finally:
+        db.close()
+
+
+def clear(user_id):
+    db = SessionLocal()
+    try:
+        db.execute(delete(models.PaymentLink).where(models.PaymentLink.user_id == user_id))
+        db.commit()
+    finally:
+        db.close()
+
+
+def items(links):
+    return [{"amount": 10 + n % 90, "currency": "USD", "description": f"Catalog item {n}"} for n in range(links)]
+
+
+async def one_by_one(client, links, concurrency):
+    limiter = asyncio.Semaphore(concurrency)
+
+    async def create(item):
+        async with limiter:
+            res = await client.post("/api/payment-links/", json=item)
+            res.raise_for_status()
+
+    await asyncio.gather(*(create(item) for item in items(links)))
+
+
+async def bulk(client, links):
+    res = await client.post("/api/payment-links/bulk", json=items(links))
+    res.raise_for_status()
+    # the streamed form is only done once the whole body has arrived
+    await res.aread()
+
+
+async def main(links, concurrency, chunks):
+    user_id = seed()
+    headers = {"Authorization": f"Bearer {create_access_token({'user_id': user_id})}"}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers, timeout=300) as client:
+        print(f"{links} links")
+        clear(user_id)
+        started = time.perf_counter()
+        await one_by_one(client, links, concurrency)
+        report(f"one by one (c={concurrency})", links, time.perf_counter() - started)
+
+        for chunk in chunks:
+            settings.payment_links_bulk_chunk = chunk
+            clear(user_id)
+            started = time.perf_counter()
+            await bulk(client, links)
+            report(f"bulk, chunk {chunk}", links, time.perf_counter() - started)
+    clear(user_id)
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--links", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--chunks", type=int, nargs="+", default=[100, 500, 5000])
+    args = parser.parse_args()
+    asyncio.run(main(args.links, args.concurrency, args.chunks))
@@ -0,0 +1,151 @@
+"""Latency of POST /api/payments/create-transaction/{link_id} against a local Stripe stub.
+
+Usage: DATABASE_NAME=paylinker_bench python -m bench.bench_checkout [--requests N] [--rate R] [--links L] [--latency S]
+
+Compares the blocking stripe call on the threadpool (before) with the async
+client, with and without pre-created sessions. Requests arrive at a fixed
+rate, spread over L links, and are driven in-process through httpx's ASGI
+transport. The stub runs in its own process (so it does not compete for this
+one's GIL) and answers every Stripe call after --latency seconds.
+"""
+import argparse
+import asyncio
+import socket
+import subprocess
+import sys
+import time
+import httpx
+import stripe
+from starlette.concurrency import run_in_threadpool
+from app import models
+from app.database import SessionLocal, async_engine
+from app.main import app
+from app.router import payments
+from app.services.stripe_checkout import CheckoutClient
+from app.config import settings
+from .common import report
+
+BENCH_EMAIL = "bench-checkout@paylinker.local"
+
+
+class ThreadpoolCheckout:
+    """The previous behaviour: the blocking Stripe SDK call on Starlette's worker threads"""
+
+    def take_spare(self, payment_link):
+        return None
+
+    def refill(self, payment_link, new_transaction_id):
+        pass
+
+    async def create_session(self, payment_link, transaction_id):
+        session = await run_in_threadpool(
+            stripe.checkout.Session.create,
+            payment_method_types=["card"],
+            line_items=[
+                {
+                    "price_data": {
+                        "currency": payment_link.currency,
+                        "product_data": {
+                            "name": payment_link.description,
+                        },
+                        "unit_amount": int(payment_link.amount * 100),
+                    },
+                    "quantity": 1,
+                },
+            ],
+            mode="payment",
+            success_url=f"{settings.client_url}/success?session_id={{CHECKOUT_SESSION_ID}}",
+            cancel_url=f"{settings.client_url}/cancel",
+            metadata={
+                "transaction_id": transaction_id
+            }
+        )
+        return session.url
+
+    async def close(self):
+        pass
+
+
+def seed(links):
+    db = SessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.email == BENCH_EMAIL).first()
+        if user is None:
+            user = models.User(email=BENCH_EMAIL, password="not-a-real-hash")
+            db.add(user)
+            db.flush()
+        existing = db.query(models.PaymentLink).filter(models.PaymentLink.user_id == user.id).count()
+        db.add_all(
+            models.PaymentLink(user_id=user.id, amount=20, currency="USD", description="Bench checkout", link_code=f"benchcheckout{i}", link_url="http://bench")
+            for i in range(existing, links)
+        )
+        db.commit()
+        return [link_id for (link_id,) in db.query(models.PaymentLink.id).filter(models.PaymentLink.user_id == user.id).order_by(models.PaymentLink.id).limit(links)]
+    finally:
+        db.close()
+
+
+async def run(name, checkout, link_ids, requests, rate):
+    payments.stripe_checkout = checkout
+    # count errors as failed requests instead of aborting the run
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        # warm up connections (and, with prefetch, let each link's spares fill)
+        await asyncio.gather(*(client.post(f"/api/payments/create-transaction/{link_id}") for link_id in link_ids))
+        await asyncio.sleep(1)
+
+        latencies, errors = [], 0
+
+        async def create(n):
+            nonlocal errors
+            await asyncio.sleep(n / rate)
+            started = time.perf_counter()
+            res = await client.post(f"/api/payments/create-transaction/{link_ids[n % len(link_ids)]}")
+            if res.status_code == 201:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(create(n) for n in range(requests)))
+        elapsed = time.perf_counter() - started
+    report(name, len(latencies), elapsed, latencies)
+    if errors:
+        print(f"{'':<28} {errors} requests failed")
+    await checkout.close()
+
+
+def start_stub(port, latency):
+    stub = subprocess.Popen([sys.executable, "-m", "bench.stripe_stub", "--port", str(port), "--latency", str(latency)], stdout=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return stub
+        except OSError:
+            time.sleep(0.05)
+    stub.kill()
+    raise RuntimeError("Stripe stub did not start")
+
+
+async def main(requests, rate, links, latency, port):
+    stub = start_stub(port, latency)
+    stub_url = f"http://127.0.0.1:{port}"
+    stripe.api_base = stub_url
+    link_ids = seed(links)
+    print(f"{requests} requests at {rate}/s over {links} links, Stripe latency {latency * 1000:.0f} ms")
+    await run("threadpool (before)", ThreadpoolCheckout(), link_ids, requests, rate)
+    await run("async client", CheckoutClient(api_base=stub_url), link_ids, requests, rate)
+    await run("async + prefetch 3", CheckoutClient(api_base=stub_url, prefetch=3), link_ids, requests, rate)
+    await async_engine.dispose()
+    stub.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=100, help="requests started per second")
+    parser.add_argument("--links", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.08, help="seconds the stub takes per Stripe call")
+    parser.add_argument("--stub-port", type=int, default=12111)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.rate, args.links, args.latency, args.stub_port))
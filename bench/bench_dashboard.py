@@ -0,0 +1,92 @@
+"""Dashboard requests/s: rebuilt on every load, sections in turn or concurrently, vs a cached snapshot vs a 304.
+
+Usage: DATABASE_NAME=paylinker_bench python -m bench.bench_dashboard [--transactions 100000] [--requests 200]
+
+Seeds the bench user the same way as bench_dashboard_chart, then drives
+GET /api/dashboard/ straight through the ASGI app, one request at a time:
+
+  sequential   the snapshot cache is cleared before every request and the
+               four sections run one after another (the previous behaviour)
+  parallel     the same, with the sections running concurrently
+  snapshot     the version matches, so the cached body is served
+  304          the client sends the ETag back in If-None-Match
+"""
+import argparse
+import asyncio
+import time
+from app.config import settings
+from app.database import async_engine
+from app.main import app
+from app.router.oauth2 import create_access_token
+from app.services import dashboard_cache
+from .bench_dashboard_chart import rebuild, seed
+from .common import report
+
+
+async def call(token, etag=None):
+    headers = [(b"host", b"bench"), (b"authorization", f"Bearer {token}".encode())]
+    if etag:
+        headers.append((b"if-none-match", etag.encode()))
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/api/dashboard/", "raw_path": b"/api/dashboard/", "query_string": b"period=last_year", "root_path": "",
+        "client": ("127.0.0.1", 1), "server": ("bench", 80), "headers": headers,
+    }
+    response = {}
+    requested, finished = False, asyncio.Event()
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            headers = dict(message["headers"])
+            response["etag"] = headers.get(b"etag", b"").decode()
+            response["timing"] = headers.get(b"server-timing", b"").decode()
+        if message["type"] == "http.response.body" and not message.get("more_body"):
+            finished.set()
+
+    await app(scope, receive, send)
+    return response
+
+
+async def run(name, token, requests, etag=None, clear=False, parallel=True):
+    settings.dashboard_parallel_sections = parallel
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(requests):
+        if clear:
+            dashboard_cache.backend.clear()
+        begun = time.perf_counter()
+        response = await call(token, etag)
+        latencies.append(time.perf_counter() - begun)
+    report(f"{name} ({response['status']})", requests, time.perf_counter() - started, latencies)
+    if response["timing"]:
+        print(f"  last Server-Timing: {response['timing']}")
+
+
+async def main(transactions, requests):
+    user_id = seed(transactions)
+    await rebuild(user_id)
+    token = create_access_token({"user_id": user_id})
+    etag = (await call(token))["etag"]
+    print(f"GET /api/dashboard/?period=last_year, {transactions} transactions")
+    await run("sequential", token, requests, clear=True, parallel=False)
+    await run("parallel", token, requests, clear=True)
+    await run("snapshot", token, requests)
+    await run("304", token, requests, etag=etag)
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--transactions", type=int, default=100000)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.transactions, args.requests))
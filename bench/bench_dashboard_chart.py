@@ -0,0 +1,108 @@
+"""Dashboard chart latency: scanning a period's transactions (before) vs reading the daily_earnings rollup.
+
+Usage: DATABASE_NAME=paylinker_bench python -m bench.bench_dashboard_chart [--sizes 10000 100000] [--queries 50]
+
+Seeds the bench user with `size` successful transactions spread evenly over the
+last year across two currencies, rebuilds their daily_earnings rows, then times
+the last_week and last_year charts both ways. The previous query is kept here as
+the baseline: it loads every Transaction with its payment link and keeps only the
+last amount seen per day and currency.
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import select, text
+from sqlalchemy.orm import joinedload
+from app import models
+from app.database import AsyncSessionLocal, SessionLocal, async_engine
+from app.router.dashboard import PERIOD_DAYS, get_transactions
+from app.services import rollups
+from .common import report
+
+BENCH_EMAIL = "bench-dashboard-chart@paylinker.local"
+
+
+def seed(size):
+    """Give the bench user exactly `size` successful transactions over the last 365 days"""
+    db = SessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.email == BENCH_EMAIL).first()
+        if user is None:
+            user = models.User(email=BENCH_EMAIL, password="not-a-real-hash")
+            db.add(user)
+            db.flush()
+            for currency in ("USD", "EUR"):
+                db.add(models.PaymentLink(user_id=user.id, amount=25, currency=currency, link_code=f"benchchart{currency}", link_url="http://bench"))
+            db.flush()
+        link_ids = [link_id for link_id, in db.query(models.PaymentLink.id).filter(models.PaymentLink.user_id == user.id).order_by(models.PaymentLink.id)]
+        db.query(models.Transaction).filter(models.Transaction.user_id == user.id).delete()
+        db.execute(
+            text("""
+                INSERT INTO transactions (payment_link_id, user_id, transaction_id, status, payment_method, created_at)
+                SELECT (:link_ids)[1 + n % 2], :user_id, 'bench_chart_' || n, 'success', 'card',
+                       now() - (n % 365) * interval '1 day'
+                FROM generate_series(1, :size) AS n
+            """),
+            {"link_ids": link_ids, "user_id": user.id, "size": size},
+        )
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+
+async def rebuild(user_id):
+    async with AsyncSessionLocal() as db:
+        await rollups.reconcile_daily_earnings(db, [user_id])
+        await db.commit()
+
+
+async def scan_transactions(db, user_id, period):
+    start_date = datetime.utcnow() - timedelta(days=PERIOD_DAYS[period])
+    transactions = (await db.scalars(
+        select(models.Transaction)
+        .join(models.PaymentLink)
+        .options(joinedload(models.Transaction.payment_link))
+        .where(models.PaymentLink.user_id == user_id)
+        .where(models.Transaction.created_at >= start_date)
+    )).all()
+    earnings = {}
+    for transaction in transactions:
+        date_str = transaction.created_at.date().isoformat()
+        earnings.setdefault(date_str, {"date": date_str})[transaction.payment_link.currency] = transaction.payment_link.amount
+    return list(earnings.values())
+
+
+async def run(name, chart, user_id, period, queries):
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(queries):
+        begun = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            points = await chart(db, user_id, period)
+        latencies.append(time.perf_counter() - begun)
+    report(name, queries, time.perf_counter() - started, latencies)
+    return points
+
+
+async def main(sizes, queries):
+    for size in sizes:
+        user_id = seed(size)
+        await rebuild(user_id)
+        print(f"{size} transactions over a year")
+        for period in ("last_week", "last_year"):
+            before = await run(f"  {period} scan", scan_transactions, user_id, period, queries)
+            after = await run(f"  {period} daily_earnings", get_transactions, user_id, period, queries)
+            scanned = {point["date"]: point for point in before}
+            wrong = sum(point["date"] in scanned and scanned[point["date"]] != point for point in after)
+            print(f"  {len(after)} days charted; the scan's amounts differ on {wrong} of them")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(sorted(args.sizes), args.queries))
@@ -0,0 +1,104 @@
+"""Time to first byte and peak memory of the streaming transaction export as history grows.
+
+Usage: DATABASE_NAME=paylinker_bench python -m bench.bench_export [--sizes 10000 100000] [--format ndjson]
+
+Calls the ASGI app directly and discards body chunks as they arrive (httpx's ASGI
+transport would buffer the whole body), so peak memory is the app's own.
+Python heap usage is measured with tracemalloc in a separate, untimed run.
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+from sqlalchemy import text
+from app import models
+from app.database import SessionLocal, async_engine
+from app.main import app
+from app.router.oauth2 import create_access_token
+
+BENCH_EMAIL = "bench-export@paylinker.local"
+
+
+def seed(size):
+    """Give the bench user exactly `size` transactions"""
+    db = SessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.email == BENCH_EMAIL).first()
+        if user is None:
+            user = models.User(email=BENCH_EMAIL, password="not-a-real-hash")
+            db.add(user)
+            db.flush()
+            db.add(models.PaymentLink(user_id=user.id, amount=25, currency="USD", link_code="benchexport", link_url="http://bench"))
+            db.flush()
+        link_id = db.query(models.PaymentLink.id).filter(models.PaymentLink.user_id == user.id).scalar()
+        existing = db.query(models.Transaction).filter(models.Transaction.user_id == user.id).count()
+        if existing > size:
+            db.query(models.Transaction).filter(models.Transaction.user_id == user.id).delete()
+            existing = 0
+        db.execute(
+            text("""
+                INSERT INTO transactions (payment_link_id, user_id, transaction_id, status, payment_method)
+                SELECT :link_id, :user_id, 'bench_export_' || n, 'success', 'card'
+                FROM generate_series(:start, :stop) AS n
+            """),
+            {"link_id": link_id, "user_id": user.id, "start": existing + 1, "stop": size},
+        )
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+
+async def export(token, fmt):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/api/payments/transactions/export", "raw_path": b"/api/payments/transactions/export",
+        "query_string": f"format={fmt}".encode(), "root_path": "", "client": ("127.0.0.1", 1), "server": ("bench", 80),
+        "headers": [(b"host", b"bench"), (b"authorization", f"Bearer {token}".encode())],
+    }
+    stats = {"first_byte": None, "bytes": 0}
+    requested, finished = False, asyncio.Event()
+    started = time.perf_counter()
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # the client stays connected until the response is complete
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            if stats["first_byte"] is None:
+                stats["first_byte"] = time.perf_counter() - started
+            stats["bytes"] += len(message["body"])
+        if message["type"] == "http.response.body" and not message.get("more_body"):
+            finished.set()
+
+    await app(scope, receive, send)
+    return stats["first_byte"], time.perf_counter() - started, stats["bytes"]
+
+
+async def main(sizes, fmt):
+    print(f"{'rows':>10} {'first byte':>12} {'total':>10} {'body':>10} {'peak heap':>10}")
+    for size in sizes:
+        token = create_access_token({"user_id": seed(size)})
+        await export(token, fmt)  # warm up connections and caches
+        first_byte, elapsed, body = await export(token, fmt)
+        # tracing slows allocation down a lot, so memory gets its own run
+        tracemalloc.start()
+        await export(token, fmt)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{size:>10} {first_byte * 1000:>9.1f} ms {elapsed:>8.2f} s {body / 2**20:>7.1f} MB {peak / 2**20:>7.1f} MB")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    args = parser.parse_args()
+    asyncio.run(main(sorted(args.sizes), args.format))
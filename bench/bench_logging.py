@@ -0,0 +1,92 @@
+"""Logging cost per request on the request path, before and after the queued log pipeline.
+
+Usage: python -m bench.bench_logging [--requests N] [--io-wait S] [--output /dev/null]
+
+Each simulated request logs what a typical route does: a DEBUG line, two INFO
+lines with arguments and the access-log record with its req/res payload. The
+configurations are built here on a private logger rather than from Settings:
+
+  before        StreamHandler + json, level DEBUG, f-strings (the old app/logger.py)
+  queued        bounded queue + background listener, level INFO, %-style arguments
+  queued orjson the same with the orjson encoder
+  sampled 10%   queued, keeping one in ten records below WARNING
+
+Between requests the calling thread sleeps --io-wait seconds, standing in for
+the time a real request spends awaiting the database, which is when the
+listener thread gets to run. "request path" is the time spent in the logging
+calls themselves; "drained" is the wall time until everything is written out.
+"""
+import argparse
+import logging
+import queue
+import time
+from logging.handlers import QueueListener
+from app.logger import DroppingQueueHandler, JsonFormatter, SamplingFilter
+
+
+def request_fstrings(log, n):
+    log.debug(f"Resolving payment link {n} for user ID {n % 100}")
+    log.info(f"Fetching payment links for user ID {n % 100} with currency filter: {'USD'}")
+    log.info(f"Retrieved {n % 7} payment links for user ID {n % 100}")
+    access_log(log, n)
+
+
+def request_lazy(log, n):
+    log.debug("Resolving payment link %s for user ID %s", n, n % 100)
+    log.info("Fetching payment links for user ID %s with currency filter: %s", n % 100, "USD")
+    log.info("Retrieved %d payment links for user ID %s", n % 7, n % 100)
+    access_log(log, n)
+
+
+def access_log(log, n):
+    log.info("Incoming Request", extra={
+        "request_id": f"{n:032x}",
+        "req": {"method": "GET", "url": f"http://bench/api/payment-links/?currency=USD&page={n}"},
+        "res": {"status_code": 200, "duration_ms": 1.23, "sql_count": 1, "sql_ms": 0.45},
+    })
+
+
+def run(name, requests, io_wait, output, request, level, encoder="json", queued=False, sample_rate=1.0):
+    log = logging.getLogger(f"bench.{name}")
+    log.propagate = False
+    log.setLevel(level)
+    stream = logging.StreamHandler(output)
+    stream.setFormatter(JsonFormatter(encoder))
+    handler, listener = stream, None
+    if queued:
+        handler = DroppingQueueHandler(queue.Queue(requests * 4 + 1))
+        listener = QueueListener(handler.queue, stream)
+        listener.start()
+    if sample_rate < 1:
+        handler.addFilter(SamplingFilter(sample_rate))
+    log.handlers = [handler]
+
+    on_path = 0.0
+    started = time.perf_counter()
+    for n in range(requests):
+        begun = time.perf_counter()
+        request(log, n)
+        on_path += time.perf_counter() - begun
+        time.sleep(io_wait)
+    if listener is not None:
+        listener.stop()
+    drained = time.perf_counter() - started
+    print(f"{name:<16} {on_path / requests * 1e6:>8.1f} us/request on the request path   drained in {drained:5.2f} s")
+
+
+def main(requests, io_wait, output):
+    with open(output, "w") as out:
+        print(f"{requests} requests, 4 log calls each, {io_wait * 1000:.1f} ms of I/O wait each, writing to {output}")
+        run("before", requests, io_wait, out, request_fstrings, logging.DEBUG)
+        run("queued", requests, io_wait, out, request_lazy, logging.INFO, queued=True)
+        run("queued orjson", requests, io_wait, out, request_lazy, logging.INFO, encoder="orjson", queued=True)
+        run("sampled 10%", requests, io_wait, out, request_lazy, logging.INFO, encoder="orjson", queued=True, sample_rate=0.1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--io-wait", type=float, default=0.0005, help="seconds each request spends off the CPU")
+    parser.add_argument("--output", default="/dev/null", help="where the log lines go, e.g. a file or /dev/stderr")
+    args = parser.parse_args()
+    main(args.requests, args.io_wait, args.output)
@@ -0,0 +1,104 @@
+"""Login throughput of one worker with bcrypt on the threadpool (before) vs the hashing process pool (after).
+
+Usage: DATABASE_NAME=paylinker_bench python -m bench.bench_login [--logins N] [--concurrency C]
+
+Drives the app in-process through httpx's ASGI transport, so the numbers are
+for a single worker. While the login storm runs, a probe keeps requesting `/`
+to show how much latency the storm adds to unrelated requests.
+"""
+import argparse
+import asyncio
+import time
+import httpx
+from starlette.concurrency import run_in_threadpool
+from app import models, utils
+from app.database import SessionLocal, async_engine
+from app.main import app
+from app.router import auth
+from app.services.hashing import HashingPool
+from app.config import settings
+from .common import report
+
+BENCH_EMAIL = "bench-login@paylinker.local"
+BENCH_PASSWORD = "bench-password"
+
+
+class ThreadpoolHasher:
+    """The previous behaviour: bcrypt on Starlette's worker threads with no bound on queued work"""
+
+    async def hash(self, password):
+        return await run_in_threadpool(utils.hash, password)
+
+    async def verify_and_update(self, password, hashed_password):
+        return await run_in_threadpool(utils.verify_and_update, password, hashed_password)
+
+    def shutdown(self):
+        pass
+
+
+def seed():
+    db = SessionLocal()
+    try:
+        if db.query(models.User).filter(models.User.email == BENCH_EMAIL).first() is None:
+            db.add(models.User(email=BENCH_EMAIL, password=utils.hash(BENCH_PASSWORD)))
+            db.commit()
+    finally:
+        db.close()
+
+
+async def run(name, hasher, logins, concurrency):
+    auth.hashing_pool = hasher
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # warm up, which also starts the worker processes
+        await client.post("/api/auth/login", data={"username": BENCH_EMAIL, "password": BENCH_PASSWORD})
+
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, probe_latencies, shed = [], [], 0
+        done = asyncio.Event()
+
+        async def login():
+            nonlocal shed
+            async with semaphore:
+                started = time.perf_counter()
+                res = await client.post("/api/auth/login", data={"username": BENCH_EMAIL, "password": BENCH_PASSWORD})
+                if res.status_code == 503:
+                    shed += 1
+                else:
+                    latencies.append(time.perf_counter() - started)
+
+        async def probe():
+            while not done.is_set():
+                started = time.perf_counter()
+                await client.get("/")
+                probe_latencies.append(time.perf_counter() - started)
+                await asyncio.sleep(0.01)
+
+        prober = asyncio.create_task(probe())
+        started = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await prober
+
+    report(f"{name} logins", len(latencies), elapsed, latencies)
+    report(f"{name} GET / probe", len(probe_latencies), elapsed, probe_latencies)
+    if shed:
+        print(f"{'':<28} {shed} logins shed with 503")
+    hasher.shutdown()
+
+
+async def main(logins, concurrency):
+    seed()
+    print(f"{logins} logins, concurrency {concurrency}, bcrypt cost {settings.bcrypt_rounds}")
+    await run("threadpool", ThreadpoolHasher(), logins, concurrency)
+    await run("process pool", HashingPool(settings.hash_workers, settings.hash_max_pending), logins, concurrency)
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.concurrency))
@@ -0,0 +1,113 @@
+"""Requests/s through the access-log middleware: BaseHTTPMiddleware (before) vs plain ASGI.
+
+Usage: python -m bench.bench_middleware [--requests N] [--chunks C]
+
+Builds two small apps that differ only in the logging middleware: the previous
+BaseHTTPMiddleware version, kept here as the baseline, and app.log_middleware.
+Each serves the same `/` handler as app.main and a `/stream` route returning a
+StreamingResponse of C chunks. Requests are driven one at a time straight
+through the ASGI interface, so the numbers are the middleware's own overhead
+plus the route, with no network or HTTP client in between. Log records are
+formatted as usual and written to /dev/null.
+"""
+import argparse
+import asyncio
+import os
+import time
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+from app.log_middleware import LogMiddleware
+from app.logger import logger, stream_handler
+from app.main import root
+from app.services.instrumentation import REQUEST_ID_HEADER, RequestStats, current_request, request_id_from
+from .common import report
+
+
+class BaseHTTPLogMiddleware(BaseHTTPMiddleware):
+    """The previous implementation, with the same logging and instrumentation"""
+
+    async def dispatch(self, request, call_next):
+        stats = RequestStats(request_id_from(request.headers.get(REQUEST_ID_HEADER)))
+        token = current_request.set(stats)
+        status_code = 500
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+            response.headers[REQUEST_ID_HEADER] = stats.request_id
+            return response
+        finally:
+            elapsed = stats.elapsed()
+            current_request.reset(token)
+            logger.info("Incoming Request", extra={
+                "request_id": stats.request_id,
+                "req": {"method": request.method, "url": str(request.url)},
+                "res": {"status_code": status_code, "duration_ms": round(elapsed * 1000, 2), "sql_count": stats.sql_count, "sql_ms": 0.0},
+            })
+
+
+def build(middleware, chunks):
+    app = FastAPI()
+    app.add_middleware(middleware)
+    app.get("/")(root)
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse((b"x" * 1024 for _ in range(chunks)), media_type="application/octet-stream")
+
+    return app
+
+
+async def call(app, path):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "client": ("127.0.0.1", 1), "server": ("bench", 80), "headers": [(b"host", b"bench")],
+    }
+    requested, finished = False, asyncio.Event()
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # the client stays connected until the response is complete
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and not message.get("more_body"):
+            finished.set()
+
+    await app(scope, receive, send)
+
+
+async def run(name, app, path, requests):
+    for _ in range(100):
+        await call(app, path)
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(requests):
+        begun = time.perf_counter()
+        await call(app, path)
+        latencies.append(time.perf_counter() - begun)
+    report(name, requests, time.perf_counter() - started, latencies)
+
+
+async def main(requests, chunks):
+    apps = {"BaseHTTPMiddleware": build(BaseHTTPLogMiddleware, chunks), "plain ASGI": build(LogMiddleware, chunks)}
+    for path in ("/", "/stream"):
+        print(f"GET {path}" + (f" ({chunks} x 1 KiB chunks)" if path == "/stream" else ""))
+        for name, app in apps.items():
+            await run(f"  {name}", app, path, requests)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--chunks", type=int, default=100)
+    args = parser.parse_args()
+    # records are still formatted, just not printed
+    with open(os.devnull, "w") as devnull:
+        stream_handler.setStream(devnull)
+        asyncio.run(main(args.requests, args.chunks))
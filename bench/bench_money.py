@@ -0,0 +1,45 @@
+"""Summing amounts in Postgres: float8 (before) vs bigint minor units, for speed and drift.
+
+Usage: DATABASE_NAME=paylinker_bench python -m bench.bench_money [--rows 1000000 10000000] [--runs 5]
+
+Each run sums `rows` amounts of 19.99 generated on the fly, once as float8 the
+way payment_links.amount used to be stored and once as bigint cents, which is
+what amount_minor holds now. Nothing is written. The exact total is
+rows * 19.99, so drift is how far the float total is from it.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from decimal import Decimal
+from sqlalchemy import text
+from app.database import async_engine
+
+QUERIES = {
+    "float8": "SELECT sum(19.99::float8) FROM generate_series(1, :rows)",
+    "bigint minor": "SELECT sum(1999::bigint) FROM generate_series(1, :rows)",
+}
+
+
+async def main(sizes, runs):
+    async with async_engine.connect() as conn:
+        for rows in sizes:
+            exact = Decimal("19.99") * rows
+            print(f"{rows} amounts of 19.99, exact total {exact}")
+            for name, query in QUERIES.items():
+                timings = []
+                for _ in range(runs):
+                    started = time.perf_counter()
+                    total = (await conn.execute(text(query), {"rows": rows})).scalar()
+                    timings.append(time.perf_counter() - started)
+                total = Decimal(int(total)).scaleb(-2).quantize(Decimal("0.01")) if name == "bigint minor" else Decimal(repr(total))
+                print(f"  {name:<14} median {statistics.median(timings) * 1000:8.1f} ms   total {total}   drift {total - exact}")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000000, 10000000])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(sorted(args.rows), args.runs))
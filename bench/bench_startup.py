@@ -0,0 +1,79 @@
+"""Worker boot time: fresh interpreter to first served request.
+
+Usage: DATABASE_NAME=paylinker_bench python -m bench.bench_startup [--runs N]
+
+Starts N fresh Python processes, the way gunicorn boots (or, in a rolling
+restart, replaces) a worker, and in each one times:
+
+  import      `import app.main`, including everything it does at import time
+  startup     the app's lifespan startup
+  first GET   the first request to / through the ASGI interface
+
+plus the number of database connections opened before the first request. The
+median of each is reported.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+CHILD = """
+import asyncio, json, time
+started = time.perf_counter()
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+connects = 0
+def on_connect(*args):
+    global connects
+    connects += 1
+event.listen(Pool, "connect", on_connect)
+import app.main
+imported = time.perf_counter()
+
+async def boot():
+    sent = []
+    async def receive():
+        return {"type": "lifespan.startup"} if not sent else await asyncio.Event().wait()
+    async def send(message):
+        sent.append(message)
+    lifespan = asyncio.create_task(app.main.app({"type": "lifespan", "asgi": {"version": "3.0"}}, receive, send))
+    while not sent:
+        await asyncio.sleep(0)
+    ready = time.perf_counter()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/", "raw_path": b"/", "query_string": b"", "root_path": "", "client": ("127.0.0.1", 1),
+        "server": ("bench", 80), "headers": [(b"host", b"bench")],
+    }
+    async def http_receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+    async def http_send(message):
+        pass
+    await app.main.app(scope, http_receive, http_send)
+    lifespan.cancel()
+    return ready, time.perf_counter()
+
+ready, served = asyncio.run(boot())
+print(json.dumps({"import": imported - started, "startup": ready - imported, "first GET": served - ready, "connections": connects}))
+"""
+
+
+def main(runs):
+    results = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", CHILD], capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+    print(f"median of {runs} fresh processes")
+    for phase in ("import", "startup", "first GET"):
+        print(f"{phase:<12} {statistics.median(r[phase] for r in results) * 1000:8.1f} ms")
+    total = statistics.median(r["import"] + r["startup"] + r["first GET"] for r in results)
+    print(f"{'total':<12} {total * 1000:8.1f} ms")
+    print(f"{'DB connects':<12} {statistics.median(r['connections'] for r in results):8.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+    main(args.runs)
@@ -0,0 +1,104 @@
+"""Status-change throughput: one SELECT + commit per event (before) vs the batched UPDATE ... FROM (VALUES ...) applier.
+
+Usage: DATABASE_NAME=paylinker_bench python -m bench.bench_webhook_apply [--events N] [--concurrency C] [--batch-sizes 1 10 100]
+
+Both paths apply the same checkout.session.completed events to pending
+transactions and keep link_stats up to date. The per-event path is what the
+webhook route used to do inline, run at the given concurrency; the batched path
+drains the stripe_events queue the way the webhook worker does.
+"""
+import argparse
+import asyncio
+import time
+from sqlalchemy import select, text
+from sqlalchemy.orm import joinedload
+from app import models
+from app.database import AsyncSessionLocal, SessionLocal, async_engine
+from app.services import rollups, webhooks
+from .common import report
+
+BENCH_EMAIL = "bench-webhook-apply@paylinker.local"
+
+
+def event(n):
+    return {
+        "id": f"evt_apply_{n}",
+        "object": "event",
+        "type": "checkout.session.completed",
+        "data": {"object": {"object": "checkout.session", "metadata": {"transaction_id": f"txn_apply_{n}"}}},
+    }
+
+
+def reset(count, queue_events):
+    """Make the bench transactions pending again and (optionally) queue one event for each"""
+    db = SessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.email == BENCH_EMAIL).first()
+        if user is None:
+            user = models.User(email=BENCH_EMAIL, password="not-a-real-hash")
+            db.add(user)
+            db.flush()
+            db.add(models.PaymentLink(user_id=user.id, amount=10, currency="USD", link_code="benchapply", link_url="http://bench"))
+            db.flush()
+        link_id = db.query(models.PaymentLink.id).filter(models.PaymentLink.user_id == user.id).scalar()
+        db.execute(
+            text("""
+                INSERT INTO transactions (payment_link_id, user_id, transaction_id, status)
+                SELECT :link_id, :user_id, 'txn_apply_' || n, 'pending' FROM generate_series(0, :count - 1) AS n
+                ON CONFLICT (transaction_id) DO UPDATE SET status = 'pending', payment_method = NULL
+            """),
+            {"link_id": link_id, "user_id": user.id, "count": count},
+        )
+        db.execute(text("DELETE FROM stripe_events WHERE id LIKE 'evt_apply_%'"))
+        if queue_events:
+            db.add_all(models.StripeEvent(id=e["id"], type=e["type"], payload=e) for e in map(event, range(count)))
+        db.commit()
+    finally:
+        db.close()
+
+
+async def per_event(count, concurrency):
+    """The previous inline webhook handling"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def apply(n):
+        async with semaphore, AsyncSessionLocal() as db:
+            transaction = await db.scalar(
+                select(models.Transaction)
+                .options(joinedload(models.Transaction.payment_link))
+                .where(models.Transaction.transaction_id == event(n)["data"]["object"]["metadata"]["transaction_id"])
+            )
+            await rollups.record_transition(db, transaction.payment_link, transaction.status, "success")
+            transaction.status = "success"
+            transaction.payment_method = "credit_card"
+            await db.commit()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(apply(n) for n in range(count)))
+    return time.perf_counter() - started
+
+
+async def batched(batch_size):
+    started = time.perf_counter()
+    while await webhooks.process_pending(AsyncSessionLocal, batch_size):
+        pass
+    return time.perf_counter() - started
+
+
+async def main(count, concurrency, batch_sizes):
+    print(f"{count} events")
+    reset(count, queue_events=False)
+    report(f"per event (concurrency {concurrency})", count, await per_event(count, concurrency))
+    for batch_size in batch_sizes:
+        reset(count, queue_events=True)
+        report(f"batched ({batch_size} per UPDATE)", count, await batched(batch_size))
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 100])
+    args = parser.parse_args()
+    asyncio.run(main(args.events, args.concurrency, args.batch_sizes))
@@ -0,0 +1,21 @@
+"""Helpers shared by the benchmark scripts in this directory."""
+import statistics
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(name, count, elapsed, latencies=None):
+    line = f"{name:<28} {count / elapsed:>10.1f} ops/s"
+    if latencies:
+        line += (
+            f"   p50 {percentile(latencies, 50) * 1000:7.2f} ms"
+            f"   p99 {percentile(latencies, 99) * 1000:7.2f} ms"
+            f"   mean {statistics.fmean(latencies) * 1000:7.2f} ms"
+        )
+    print(line)
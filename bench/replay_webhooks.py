@@ -0,0 +1,130 @@
+"""Replay a fixture of Stripe webhook events through the app and report sustained events per second.
+
+Usage:
+    DATABASE_NAME=paylinker_bench python -m bench.replay_webhooks FIXTURE --generate 5000
+    DATABASE_NAME=paylinker_bench python -m bench.replay_webhooks FIXTURE [--concurrency C]
+
+FIXTURE is newline-delimited JSON, one Stripe event per line; --generate writes a
+fresh one first, with about 10% of events repeated the way Stripe retries them.
+Events are signed with STRIPE_WEBHOOK_SECRET at send time and posted through
+httpx's ASGI transport while the webhook worker runs. Every transaction the
+fixture refers to is reset to pending first, so a fixture can be replayed any
+number of times.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import httpx
+import stripe
+from sqlalchemy import func, select, text
+from app import models
+from app.config import settings
+from app.database import AsyncSessionLocal, SessionLocal, async_engine
+from app.main import app
+from app.services.webhooks import webhook_worker
+from .common import report
+
+BENCH_EMAIL = "bench-webhooks@paylinker.local"
+
+
+def generate(path, count):
+    with open(path, "w") as fixture:
+        for n in range(count):
+            event_type = "checkout.session.async_payment_failed" if random.random() < 0.1 else "checkout.session.completed"
+            event = {
+                "id": f"evt_bench_{n}",
+                "object": "event",
+                "type": event_type,
+                "data": {"object": {"object": "checkout.session", "metadata": {"transaction_id": f"txn_bench_{n}"}}},
+            }
+            line = json.dumps(event) + "\n"
+            fixture.write(line)
+            if random.random() < 0.1:
+                fixture.write(line)
+
+
+def load(path):
+    with open(path) as fixture:
+        return [line.strip() for line in fixture if line.strip()]
+
+
+def reset(events):
+    """Make every referenced transaction pending again and forget the fixture's events"""
+    transaction_ids = sorted({event["data"]["object"]["metadata"]["transaction_id"] for event in events})
+    db = SessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.email == BENCH_EMAIL).first()
+        if user is None:
+            user = models.User(email=BENCH_EMAIL, password="not-a-real-hash")
+            db.add(user)
+            db.flush()
+            db.add(models.PaymentLink(user_id=user.id, amount=10, currency="USD", link_code="benchwebhooks", link_url="http://bench"))
+            db.flush()
+        link_id = db.query(models.PaymentLink.id).filter(models.PaymentLink.user_id == user.id).scalar()
+        db.execute(
+            text("""
+                INSERT INTO transactions (payment_link_id, user_id, transaction_id, status)
+                SELECT :link_id, :user_id, unnest(CAST(:transaction_ids AS text[])), 'pending'
+                ON CONFLICT (transaction_id) DO UPDATE SET status = 'pending', payment_method = NULL
+            """),
+            {"link_id": link_id, "user_id": user.id, "transaction_ids": transaction_ids},
+        )
+        db.query(models.StripeEvent).filter(models.StripeEvent.id.in_({event["id"] for event in events})).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+async def pending_count():
+    async with AsyncSessionLocal() as db:
+        return await db.scalar(select(func.count()).where(models.StripeEvent.processed_at.is_(None)))
+
+
+async def replay(payloads, concurrency):
+    await webhook_worker.start()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def send(payload):
+            async with semaphore:
+                header = stripe.WebhookSignature.generate_signature_header(payload, settings.stripe_webhook_secret)
+                started = time.perf_counter()
+                res = await client.post("/api/payments/webhook/", content=payload, headers={"Stripe-Signature": header})
+                res.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send(payload) for payload in payloads))
+        acked = time.perf_counter() - started
+        while await pending_count():
+            await asyncio.sleep(0.01)
+        applied = time.perf_counter() - started
+    await webhook_worker.stop()
+    return latencies, acked, applied
+
+
+async def main(path, concurrency):
+    payloads = load(path)
+    events = [json.loads(payload) for payload in payloads]
+    unique = len({event["id"] for event in events})
+    reset(events)
+    print(f"{len(payloads)} deliveries ({unique} unique events), concurrency {concurrency}, batch size {webhook_worker.batch_size}")
+    latencies, acked, applied = await replay(payloads, concurrency)
+    report("webhook acks", len(payloads), acked, latencies)
+    report("events applied", unique, applied)
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("fixture")
+    parser.add_argument("--generate", type=int, metavar="N", help="write a fixture of N events first")
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    if args.generate:
+        generate(args.fixture, args.generate)
+    asyncio.run(main(args.fixture, args.concurrency))
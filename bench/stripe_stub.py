@@ -0,0 +1,75 @@
+"""Local stand-in for the Stripe API's checkout session endpoint.
+
+Usage: python -m bench.stripe_stub [--port 12111] [--latency 0.08]
+
+Then point the app at it with STRIPE_API_BASE=http://127.0.0.1:12111. Every
+POST /v1/checkout/sessions answers, after `latency` seconds, with a session
+whose metadata echoes the request. Set `fail_status` on the server to make it
+answer with that HTTP error instead.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # keep-alive, like the real API
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode()
+        params = {key: values[-1] for key, values in parse_qs(body).items()}
+        self.server.requests.append(params)
+        time.sleep(self.server.latency)
+        if self.server.fail_status:
+            self.respond(self.server.fail_status, {"error": {"type": "api_error", "message": "Stub failure"}})
+            return
+        session_id = f"cs_test_{uuid.uuid4().hex}"
+        self.respond(200, {
+            "id": session_id,
+            "object": "checkout.session",
+            "url": f"https://checkout.stripe.test/c/pay/{session_id}",
+            "expires_at": int(params.get("expires_at") or time.time() + 86400),
+            "metadata": {key[len("metadata["):-1]: value for key, value in params.items() if key.startswith("metadata[")},
+        })
+
+    def respond(self, status, payload):
+        content = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=0, latency=0.0):
+    """Start the stub on a background thread; returns the server, whose `url` is the API base to use"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.fail_status = None
+    server.requests = []
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=12111)
+    parser.add_argument("--latency", type=float, default=0.08, help="seconds before each response")
+    args = parser.parse_args()
+    server = serve(args.port, args.latency)
+    print(f"Stripe stub listening on {server.url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,26 @@
+"""Gunicorn settings shared by every way of starting the server (see Procfile).
+
+Workers are forked from this process, so the metrics directory set here is inherited by all
+of them: each worker writes its Prometheus values there and /metrics adds them up. The same
+goes for the earnings pub/sub backend chosen in on_starting.
+"""
+import os
+import shutil
+
+metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/dev/shm/paylinker-metrics")
+
+
+def on_starting(server):
+    # Files left by a previous run would be added to this one's totals
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+    # The in-memory hub only reaches sockets held by the worker that published the delta
+    if server.cfg.workers > 1:
+        backend = os.environ.setdefault("PUBSUB_BACKEND", "postgres")
+        if backend == "memory":
+            server.log.warning("PUBSUB_BACKEND=memory with %d workers: dashboard sockets miss deltas from other workers", server.cfg.workers)
+
+
+def child_exit(server, worker):
+    from app.services.metrics import mark_process_dead
+    mark_process_dead(worker.pid)
@@ -0,0 +1,33 @@
+"""Rebuild the rollup tables from the transactions table.
+
+Usage: python -m scripts.reconcile_rollups [LINK_ID ...]
+
+Rows are recomputed from scratch. link_stats is upserted for the given links,
+or every link with no arguments. daily_earnings is rebuilt for the users owning
+those links, or for everyone. Both tables are locked against writers until the
+run commits, so checkouts and webhook batches wait for it; a full run is best
+kept to a quiet period.
+"""
+import asyncio
+import sys
+from sqlalchemy import select
+from app import models
+from app.database import AsyncSessionLocal
+from app.services import rollups
+
+
+async def main(argv):
+    link_ids = [int(arg) for arg in argv] or None
+    async with AsyncSessionLocal() as db:
+        count = await rollups.reconcile_link_stats(db, link_ids)
+        user_ids = None
+        if link_ids is not None:
+            user_ids = (await db.scalars(select(models.PaymentLink.user_id).where(models.PaymentLink.id.in_(link_ids)).distinct())).all()
+        days = await rollups.reconcile_daily_earnings(db, user_ids)
+        await db.commit()
+    print(f"Reconciled link_stats for {count} payment links")
+    print(f"Rebuilt daily_earnings: {days} rows")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(sys.argv[1:]))
@@ -1,18 +1,27 @@
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
 from app.config import Settings
 from fastapi.testclient import TestClient
 from app.main import app
-from app.database import get_db, Base
+from app.database import get_db, get_session_factory, Base
 from app.router.oauth2 import create_access_token
 import pytest
 from app import models
+from app.services import dashboard_cache, instrumentation, link_cache
+from app.services.ids import link_codes
 import uuid
 
 settings = Settings()
 SQLALCHEMY_DATABASE_URL = f"postgresql://{settings.database_username}:{settings.database_password}@{settings.database_hostname}:{settings.database_port}/{settings.database_name}_test"
+ASYNC_SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://", 1)
 engine = create_engine(SQLALCHEMY_DATABASE_URL)
 TestingSessionLocal = sessionmaker(autocommit=False,autoflush=False, bind=engine)
+# TestClient runs every request on a fresh event loop, so async connections must not be pooled across requests
+async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, poolclass=NullPool)
+instrumentation.instrument(async_engine.sync_engine)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 @pytest.fixture
 def session():
@@ -27,12 +36,14 @@ def session():
 
 @pytest.fixture
 def client(session):
-    def override_get_db():
-        try:
-            yield session
-        finally:
-            session.close()
+    link_cache.backend.clear()
+    dashboard_cache.backend.clear()
+    link_codes.reset()
+    async def override_get_db():
+        async with TestingAsyncSessionLocal() as db:
+            yield db
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_session_factory] = lambda: TestingAsyncSessionLocal
     yield TestClient(app)
 
 @pytest.fixture
@@ -1,7 +1,11 @@
 import pytest
-from app import schemas
+from app import schemas, models
 from jose import jwt
+from passlib.context import CryptContext
 from app.config import settings
+from app.services.hashing import hashing_pool
+from app.router.oauth2 import token_cache
+from datetime import datetime, timedelta
 
 def test_root(client):
     res = client.get('/')
@@ -34,4 +38,38 @@ def test_login_user(client, test_user):
 ])
 def test_incorrect_login(test_user, client, email, password, status_code):
     res = client.post("/api/auth/login", data={"username": email, "password": password})
-    assert res.status_code == status_code
\ No newline at end of file
+    assert res.status_code == status_code
+def test_login_rehashes_password_with_current_cost(client, session):
+    old_hash = CryptContext(schemes=['bcrypt'], bcrypt__rounds=4).hash("t@123")
+    session.add(models.User(email="legacy@gmail.com", password=old_hash))
+    session.commit()
+
+    res = client.post("/api/auth/login", data={"username": "legacy@gmail.com", "password": "t@123"})
+    assert res.status_code == 200
+
+    session.expire_all()
+    user = session.query(models.User).filter(models.User.email == "legacy@gmail.com").first()
+    assert user.password != old_hash
+    assert user.password.startswith(f"$2b${settings.bcrypt_rounds:02d}$")
+
+def test_login_sheds_load_when_hashing_pool_is_full(client, test_user, monkeypatch):
+    monkeypatch.setattr(hashing_pool, "max_pending", 0)
+    res = client.post("/api/auth/login", data={"username": test_user['email'], "password": test_user["password"]})
+    assert res.status_code == 503
+    assert res.headers["Retry-After"] == "1"
+
+def test_verified_tokens_are_cached(authorized_client, token):
+    token_cache.clear()
+    token_cache.hits = token_cache.misses = 0
+    assert authorized_client.get("/api/payment-links/").status_code == 200
+    assert authorized_client.get("/api/dashboard/").status_code == 200
+    assert token_cache.get(token) is not None
+    stats = authorized_client.get("/internal/auth-cache").json()
+    assert stats["misses"] == 1
+    assert stats["hits"] >= 1
+
+def test_expired_token_is_rejected_and_not_cached(client, test_user):
+    expired = jwt.encode({"user_id": test_user['id'], "exp": datetime.utcnow() - timedelta(minutes=1)}, settings.secret_key, algorithm=settings.algorithm)
+    res = client.get("/api/payment-links/", headers={"Authorization": f"Bearer {expired}"})
+    assert res.status_code == 401
+    assert token_cache.get(expired) is None
@@ -0,0 +1,21 @@
+import time
+from app.services.cache import TTLCache
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("short", "value", ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get("short") is None
+    assert cache.stats()["size"] == 0
@@ -0,0 +1,313 @@
+import asyncio
+import pytest
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import event
+from app import models
+from app.config import settings
+from app.router import dashboard
+from app.services import dashboard_cache, rollups, webhooks
+from .conftest import TestingAsyncSessionLocal, async_engine
+from .test_webhooks import pending_transaction, session_event, signed
+
+
+def test_total_earnings_grouped_by_currency(authorized_client, create_payment_link):
+    usd_link = create_payment_link().json()
+    eur_link = authorized_client.post("/api/payment-links/", json={
+        "amount": 200.0,
+        "currency": "EUR",
+        "description": "Euro Link",
+        "expiration_date": "2024-12-31T23:59:59"
+    }).json()
+
+    for link_id in (usd_link["id"], usd_link["id"], eur_link["id"]):
+        res = authorized_client.post(f"/api/payments/{link_id}", params={"payment_method": "card"})
+        assert res.status_code == 201
+
+    response = authorized_client.get("/api/dashboard/")
+    assert response.status_code == 200
+    assert response.json()["total_earnings"] == {"USD": 200.0, "EUR": 200.0}
+
+
+def test_earnings_add_up_exactly(authorized_client):
+    link = authorized_client.post("/api/payment-links/", json={"amount": 0.1, "currency": "USD", "description": "Dime"}).json()
+    assert link["amount_minor"] == 10
+    for _ in range(3):
+        authorized_client.post(f"/api/payments/{link['id']}", params={"payment_method": "card"})
+
+    dashboard = authorized_client.get("/api/dashboard/").json()
+    # summed as floats this would be 0.30000000000000004
+    assert dashboard["total_earnings"] == {"USD": 0.3}
+    assert dashboard["transactions"][0]["USD"] == 0.3
+    assert dashboard["performance"][0]["total_amount"] == 0.3
+
+
+def test_total_earnings_empty(authorized_client):
+    response = authorized_client.get("/api/dashboard/")
+    assert response.status_code == 200
+    assert response.json()["total_earnings"] == {}
+
+
+def test_link_performance_from_rollup(authorized_client, create_payment_link, session):
+    link = create_payment_link().json()
+    for _ in range(2):
+        authorized_client.post(f"/api/payments/{link['id']}", params={"payment_method": "card"})
+
+    response = authorized_client.get("/api/dashboard/")
+    performance = response.json()["performance"]
+    assert performance == [{
+        "link_id": link["id"],
+        "description": "Test payment link",
+        "total_transactions": 2,
+        "successful_transactions": 2,
+        "failed_transactions": 0,
+        "total_amount": 200.0
+    }]
+
+
+def test_reconcile_link_stats_repairs_drift(authorized_client, create_payment_link, session):
+    link = create_payment_link().json()
+    authorized_client.post(f"/api/payments/{link['id']}", params={"payment_method": "card"})
+    session.query(models.LinkStats).delete()
+    session.commit()
+
+    async def reconcile():
+        async with TestingAsyncSessionLocal() as db:
+            await rollups.reconcile_link_stats(db)
+            await db.commit()
+    asyncio.run(reconcile())
+
+    stats = session.get(models.LinkStats, link["id"])
+    assert (stats.total_transactions, stats.successful_transactions, stats.success_amount_minor) == (1, 1, 10000)
+
+
+def test_reconcile_waits_for_writers(authorized_client, create_payment_link, session):
+    link = create_payment_link().json()
+    authorized_client.post(f"/api/payments/{link['id']}", params={"payment_method": "card"})
+
+    async def race():
+        async with TestingAsyncSessionLocal() as writer, TestingAsyncSessionLocal() as rebuilder:
+            payment_link = await writer.get(models.PaymentLink, link["id"])
+            writer.add(models.Transaction(payment_link_id=link["id"], user_id=link["user_id"], transaction_id="txn_race", status="success"))
+            await rollups.record_transition(writer, payment_link, None, "success")
+
+            async def reconcile():
+                await rollups.reconcile_link_stats(rebuilder)
+                await rebuilder.commit()
+            rebuild = asyncio.create_task(reconcile())
+            await asyncio.sleep(0.2)
+            assert not rebuild.done()
+            await writer.commit()
+            await rebuild
+    asyncio.run(race())
+
+    stats = session.get(models.LinkStats, link["id"])
+    assert (stats.successful_transactions, stats.success_amount_minor) == (2, 20000)
+
+
+def test_chart_sums_each_day(authorized_client, create_payment_link):
+    link = create_payment_link().json()
+    for _ in range(3):
+        authorized_client.post(f"/api/payments/{link['id']}", params={"payment_method": "card"})
+
+    response = authorized_client.get("/api/dashboard/")
+    today = datetime.now(timezone.utc).date().isoformat()
+    assert response.json()["transactions"] == [{"date": today, "USD": 300.0}]
+
+
+def test_chart_period(authorized_client, test_user, session):
+    today = datetime.now(timezone.utc).date()
+    for days_ago in (0, 3, 30, 400):
+        session.add(models.DailyEarnings(user_id=test_user["id"], day=today - timedelta(days=days_ago), currency="EUR", amount_minor=1000, transactions=1))
+    session.commit()
+
+    def chart_days(period):
+        response = authorized_client.get("/api/dashboard/", params={"period": period})
+        assert response.status_code == 200
+        return [(today - date.fromisoformat(point["date"])).days for point in response.json()["transactions"]]
+
+    assert chart_days("last_day") == [0]
+    assert chart_days("last_week") == [3, 0]
+    assert chart_days("last_year") == [30, 3, 0]
+    assert authorized_client.get("/api/dashboard/", params={"period": "last_decade"}).status_code == 422
+
+
+def test_webhook_success_lands_on_creation_day(client, session, create_payment_link):
+    link = create_payment_link().json()
+    transaction = pending_transaction(session, link)
+    created = datetime.now(timezone.utc) - timedelta(days=2)
+    transaction.created_at = created
+    session.commit()
+
+    client.post("/api/payments/webhook/", **signed(session_event("evt_daily", "txn_hook")))
+    asyncio.run(webhooks.process_pending(TestingAsyncSessionLocal))
+
+    rows = session.query(models.DailyEarnings).all()
+    assert [(row.day, row.currency, row.amount_minor, row.transactions) for row in rows] == [(created.date(), "USD", 10000, 1)]
+
+
+def test_reconcile_daily_earnings_repairs_drift(authorized_client, create_payment_link, test_user, session):
+    link = create_payment_link().json()
+    authorized_client.post(f"/api/payments/{link['id']}", params={"payment_method": "card"})
+    session.query(models.DailyEarnings).update({"amount_minor": 100})
+    session.add(models.DailyEarnings(user_id=test_user["id"], day=date(2020, 1, 1), currency="USD", amount_minor=500, transactions=1))
+    session.commit()
+
+    async def reconcile():
+        async with TestingAsyncSessionLocal() as db:
+            await rollups.reconcile_daily_earnings(db, [test_user["id"]])
+            await db.commit()
+    asyncio.run(reconcile())
+
+    session.expire_all()
+    rows = session.query(models.DailyEarnings).all()
+    assert [(row.currency, row.amount_minor, row.transactions) for row in rows] == [("USD", 10000, 1)]
+
+
+def test_link_edit_reprices_rollups(authorized_client, create_payment_link, session):
+    link = create_payment_link().json()
+    authorized_client.post(f"/api/payments/{link['id']}", params={"payment_method": "card"})
+    pending_transaction(session, link)
+    authorized_client.post("/api/payments/webhook/", **signed(session_event("evt_paid", "txn_hook")))
+    asyncio.run(webhooks.process_pending(TestingAsyncSessionLocal))
+
+    res = authorized_client.put(f"/api/payment-links/{link['id']}", json={"amount": 75.0, "currency": "EUR", "description": "Repriced", "expiration_date": None})
+    assert res.status_code == 200
+    dashboard = authorized_client.get("/api/dashboard/").json()
+    assert dashboard["total_earnings"] == {"EUR": 150.0}
+    assert [{key: point[key] for key in point if key != "date"} for point in dashboard["transactions"]] == [{"EUR": 150.0}]
+    assert dashboard["performance"][0]["total_amount"] == 150.0
+
+    # a later failure takes back the new amount, from the new currency
+    authorized_client.post("/api/payments/webhook/", **signed(session_event("evt_failed", "txn_hook", "checkout.session.async_payment_failed")))
+    asyncio.run(webhooks.process_pending(TestingAsyncSessionLocal))
+
+    def rollups_rows():
+        session.expire_all()
+        stats = session.get(models.LinkStats, link["id"])
+        earnings = session.query(models.DailyEarnings).order_by(models.DailyEarnings.currency).all()
+        return (stats.successful_transactions, stats.success_amount_minor), [(row.currency, row.amount_minor, row.transactions) for row in earnings]
+
+    assert rollups_rows() == ((1, 7500), [("EUR", 7500, 1), ("USD", 0, 0)])
+
+    async def reconcile():
+        async with TestingAsyncSessionLocal() as db:
+            await rollups.reconcile_link_stats(db)
+            await rollups.reconcile_daily_earnings(db)
+            await db.commit()
+    asyncio.run(reconcile())
+    assert rollups_rows() == ((1, 7500), [("EUR", 7500, 1)])
+
+
+def test_deleted_link_leaves_chart_and_totals_agreeing(authorized_client, create_payment_link):
+    kept, deleted = create_payment_link().json(), create_payment_link().json()
+    for link in (kept, deleted, deleted):
+        authorized_client.post(f"/api/payments/{link['id']}", params={"payment_method": "card"})
+
+    assert authorized_client.delete(f"/api/payment-links/{deleted['id']}").status_code == 204
+    dashboard = authorized_client.get("/api/dashboard/").json()
+    assert dashboard["total_earnings"] == {"USD": 100.0}
+    assert [point["USD"] for point in dashboard["transactions"]] == [100.0]
+
+
+def test_dashboard_snapshot_and_etag(authorized_client, create_payment_link):
+    link = create_payment_link().json()
+    first = authorized_client.get("/api/dashboard/")
+    etag = first.headers["etag"]
+
+    hits = dashboard_cache.backend.stats()["hits"]
+    again = authorized_client.get("/api/dashboard/")
+    assert again.json() == first.json() and again.headers["etag"] == etag
+    assert dashboard_cache.backend.stats()["hits"] == hits + 1
+
+    unchanged = authorized_client.get("/api/dashboard/", headers={"If-None-Match": etag})
+    assert unchanged.status_code == 304 and unchanged.content == b""
+
+    authorized_client.post(f"/api/payments/{link['id']}", params={"payment_method": "card"})
+    changed = authorized_client.get("/api/dashboard/", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+    assert changed.json()["total_earnings"] == {"USD": 100.0}
+
+
+def test_link_edits_and_webhooks_bump_the_version(authorized_client, create_payment_link, session):
+    link = create_payment_link().json()
+
+    def etag():
+        return authorized_client.get("/api/dashboard/").headers["etag"]
+
+    seen = [etag()]
+    res = authorized_client.put(f"/api/payment-links/{link['id']}", json={"amount": 100.0, "currency": "USD", "description": "Renamed", "expiration_date": None})
+    assert res.status_code == 200
+    seen.append(etag())
+    assert authorized_client.get("/api/dashboard/").json()["performance"][0]["description"] == "Renamed"
+
+    pending_transaction(session, link)
+    authorized_client.post("/api/payments/webhook/", **signed(session_event("evt_version", "txn_hook")))
+    asyncio.run(webhooks.process_pending(TestingAsyncSessionLocal))
+    seen.append(etag())
+
+    authorized_client.delete(f"/api/payment-links/{link['id']}")
+    seen.append(etag())
+    assert len(set(seen)) == 4
+
+
+def test_not_modified_costs_one_query(authorized_client, create_payment_link):
+    create_payment_link()
+    etag = authorized_client.get("/api/dashboard/").headers["etag"]
+    statements = []
+
+    def count(*args):
+        statements.append(args[2])
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count)
+    try:
+        assert authorized_client.get("/api/dashboard/", headers={"If-None-Match": etag}).status_code == 304
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", count)
+    assert len(statements) == 1 and "dashboard_versions" in statements[0]
+
+
+@pytest.mark.parametrize("parallel", [True, False])
+def test_sections_timed_in_server_timing(authorized_client, create_payment_link, monkeypatch, parallel):
+    monkeypatch.setattr(settings, "dashboard_parallel_sections", parallel)
+    link = create_payment_link().json()
+    authorized_client.post(f"/api/payments/{link['id']}", params={"payment_method": "card"})
+
+    response = authorized_client.get("/api/dashboard/")
+    timings = dict(metric.split(";dur=") for metric in response.headers["server-timing"].split(", "))
+    assert list(timings) == ["total_earnings", "transactions", "latest_transactions", "performance", "total"]
+    payload = response.json()
+    assert "unavailable" not in payload
+    assert payload["total_earnings"] == {"USD": 100.0} and len(payload["latest_transactions"]) == 1
+
+    assert "server-timing" not in authorized_client.get("/api/dashboard/").headers
+
+
+def test_slow_section_gives_partial_dashboard(authorized_client, create_payment_link, monkeypatch):
+    create_payment_link()
+
+    async def stalled(db, user_id, period):
+        await asyncio.sleep(1)
+    monkeypatch.setattr(settings, "dashboard_section_timeout", 0.2)
+    monkeypatch.setitem(dashboard.SECTIONS, "performance", stalled)
+
+    partial = authorized_client.get("/api/dashboard/")
+    assert partial.status_code == 200
+    assert partial.json()["performance"] is None and partial.json()["unavailable"] == ["performance"]
+    assert partial.json()["total_earnings"] == {}
+    assert "etag" not in partial.headers and partial.headers["cache-control"] == "no-store"
+
+    monkeypatch.undo()
+    complete = authorized_client.get("/api/dashboard/").json()
+    assert "unavailable" not in complete and len(complete["performance"]) == 1
+
+
+def test_failing_section_gives_partial_dashboard(authorized_client, create_payment_link, monkeypatch):
+    create_payment_link()
+
+    async def broken(db, user_id, period):
+        raise KeyError("currency")
+    monkeypatch.setitem(dashboard.SECTIONS, "transactions", broken)
+
+    partial = authorized_client.get("/api/dashboard/")
+    assert partial.status_code == 200
+    assert partial.json()["unavailable"] == ["transactions"]
+    assert len(partial.json()["performance"]) == 1
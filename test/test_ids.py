@@ -0,0 +1,33 @@
+import pytest
+from app.services import ids
+
+
+def test_transaction_ids_are_time_ordered_and_unique():
+    generated = [ids.new_transaction_id() for _ in range(10000)]
+    assert len(set(generated)) == len(generated)
+    # many of these share a millisecond; the per-process sequence keeps them increasing
+    assert generated == sorted(generated)
+    assert all(txn.startswith("txn_") and len(txn) == 30 for txn in generated)
+
+
+def test_ulid_sequence_overflow_moves_to_next_millisecond(monkeypatch):
+    generator = ids.UlidGenerator()
+    monkeypatch.setattr(ids.time, "time_ns", lambda: 5_000_000)
+    first = generator.new()
+    generator._sequence = (1 << 80) - 1
+    assert first < generator.new() < generator.new()
+
+
+def test_link_codes_are_a_permutation():
+    codes = [ids.encode_link_code(n) for n in range(50000)]
+    assert len(set(codes)) == len(codes)
+    assert all(len(code) == 7 and code.isalnum() for code in codes)
+    # consecutive sequence values are scattered over the keyspace
+    assert codes[:100] != sorted(codes[:100])
+    assert ids.encode_link_code(ids.LINK_CODE_SPACE - 1)
+
+
+def test_link_code_depends_on_key():
+    assert ids.encode_link_code(42, key="a") != ids.encode_link_code(42, key="b")
+    with pytest.raises(ValueError):
+        ids.encode_link_code(ids.LINK_CODE_SPACE)
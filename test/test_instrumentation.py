@@ -0,0 +1,75 @@
+import json
+import logging
+import pstats
+from app.config import settings
+from app.logger import JsonFormatter
+
+
+def access_records(caplog):
+    return [record for record in caplog.records if hasattr(record, "res") and "sql_count" in record.res]
+
+
+def test_request_timing_and_sql_counts(authorized_client, create_payment_link, caplog):
+    create_payment_link()
+    caplog.clear()
+    with caplog.at_level(logging.INFO):
+        res = authorized_client.get("/api/payment-links/", headers={"X-Request-ID": "req-123"})
+    assert res.status_code == 200
+    assert res.headers["X-Request-ID"] == "req-123"
+
+    [record] = access_records(caplog)
+    assert record.request_id == "req-123"
+    assert record.res["status_code"] == 200
+    assert record.res["sql_count"] == 1
+    assert record.res["duration_ms"] >= record.res["sql_ms"] > 0
+    # everything logged during the request carries the same correlation id
+    assert {r.request_id for r in caplog.records if r.getMessage().startswith("Fetching payment links")} == {"req-123"}
+
+
+def test_unsafe_request_ids_are_replaced(client):
+    res = client.get("/", headers={"X-Request-ID": "../../etc/passwd"})
+    assert len(res.headers["X-Request-ID"]) == 32
+
+
+def test_over_budget_requests_are_flagged(authorized_client, caplog, monkeypatch):
+    monkeypatch.setattr(settings, "request_query_budget", 0)
+    caplog.clear()
+    authorized_client.get("/api/payment-links/")
+
+    [record] = access_records(caplog)
+    assert record.levelno == logging.WARNING
+    assert record.res["over_budget"] == ["queries"]
+    assert "profile" not in record.res
+
+
+def test_slow_requests_are_profiled(client, tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(settings, "profile_sample_rate", 1.0)
+    monkeypatch.setattr(settings, "request_budget_ms", 0)
+    monkeypatch.setattr(settings, "profile_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "profile_keep", 2)
+
+    for _ in range(3):
+        assert client.get("/").status_code == 200
+
+    profiles = sorted(tmp_path.glob("*.prof"))
+    assert len(profiles) == 2
+    assert access_records(caplog)[-1].res["profile"] in map(str, profiles)
+    assert pstats.Stats(str(profiles[0])).total_calls > 0
+
+
+def test_instrumentation_can_be_disabled(client, monkeypatch):
+    monkeypatch.setattr(settings, "instrumentation_enabled", False)
+    assert "X-Request-ID" not in client.get("/").headers
+
+
+def test_streamed_responses_are_timed_to_the_last_byte(authorized_client, create_payment_link, caplog):
+    create_payment_link()
+    caplog.clear()
+    with caplog.at_level(logging.INFO):
+        res = authorized_client.get("/api/payments/transactions/export")
+    assert res.status_code == 200
+
+    [record] = access_records(caplog)
+    # the export's query runs while the body streams, after the response has started
+    assert record.res["sql_count"] == 1
+    assert json.loads(JsonFormatter().format(record)).keys() == {"message", "request_id", "req", "res"}
@@ -0,0 +1,32 @@
+import pytest
+from app.config import settings
+
+
+def test_pool_stats(client):
+    res = client.get("/internal/pool")
+    assert res.status_code == 200
+    stats = res.json()
+    assert {"status", "timeouts", "wait_seconds", "checkout_seconds"} <= stats.keys()
+    assert "+Inf" in stats["wait_seconds"]["buckets"]
+
+
+def test_internal_key_required_when_configured(client, monkeypatch):
+    monkeypatch.setattr(settings, "internal_api_key", "s3cret")
+    assert client.get("/internal/pool").status_code == 403
+    assert client.get("/internal/pool", headers={"X-Internal-Key": "s3cret"}).status_code == 200
+
+
+def test_internal_endpoints_closed_without_a_key_outside_local(client, monkeypatch):
+    monkeypatch.setattr(settings, "internal_api_key", None)
+    monkeypatch.setattr(settings, "env", "production")
+    assert client.get("/internal/pool").status_code == 404
+    assert client.get("/metrics").status_code == 404
+
+    monkeypatch.setattr(settings, "internal_api_key", "s3cret")
+    assert client.get("/internal/pool", headers={"X-Internal-Key": "s3cret"}).status_code == 200
+
+
+def test_logging_stats(client):
+    res = client.get("/internal/logging")
+    assert res.status_code == 200
+    assert {"queued", "capacity", "dropped"} <= res.json().keys()
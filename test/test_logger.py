@@ -0,0 +1,61 @@
+import json
+import logging
+import queue
+import sys
+import pytest
+from app.logger import DroppingQueueHandler, JsonFormatter, SamplingFilter
+
+
+def make_record(msg, *args, level=logging.INFO, **extra):
+    record = logging.LogRecord("test", level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_queue_handler_drops_when_full_and_reports_it():
+    handler = DroppingQueueHandler(queue.Queue(2))
+    for n in range(5):
+        handler.handle(make_record("record %d", n))
+    assert handler.stats() == {"queued": 2, "capacity": 2, "dropped": 3}
+
+    handler.queue.get_nowait()
+    handler.handle(make_record("after"))
+    messages = [handler.queue.get_nowait().getMessage() for _ in range(2)]
+    assert messages == ["record 1", "after"]
+    # no room was left for the notice, so it comes with the next record that fits
+    handler.handle(make_record("later"))
+    assert [r.getMessage() for r in list(handler.queue.queue)] == ["later", "Dropped 3 log records, the log queue was full"]
+
+
+def test_queued_records_keep_the_json_shape():
+    handler = DroppingQueueHandler(queue.Queue())
+    args = {"id": 1}
+    handler.handle(make_record("payload %s", args, request_id="abc", req={"method": "GET"}, res={"status_code": 200}))
+    args["id"] = 2
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        error = make_record("failed", level=logging.ERROR)
+        error.exc_info = sys.exc_info()
+        handler.handle(error)
+
+    formatter = JsonFormatter()
+    first, second = (json.loads(formatter.format(handler.queue.get_nowait())) for _ in range(2))
+    # interpolated on the caller's side, before the argument changed
+    assert first == {"message": "payload {'id': 1}", "request_id": "abc", "req": {"method": "GET"}, "res": {"status_code": 200}}
+    assert second["message"] == "failed" and "ValueError: boom" in second["err"]
+
+
+def test_orjson_encoder_matches_json():
+    pytest.importorskip("orjson")
+    record = make_record("hello %s", "world", req={"url": "http://x/?q=ü"}, res={"status_code": 200, "duration_ms": 1.5})
+    assert json.loads(JsonFormatter("orjson").format(record)) == json.loads(JsonFormatter().format(record))
+    with pytest.raises(ValueError):
+        JsonFormatter("yaml")
+
+
+def test_sampling_keeps_warnings(monkeypatch):
+    sampler = SamplingFilter(0.0)
+    assert not sampler.filter(make_record("info"))
+    assert sampler.filter(make_record("warning", level=logging.WARNING))
+    assert SamplingFilter(1.0).filter(make_record("info"))
@@ -0,0 +1,90 @@
+import asyncio
+import os
+import subprocess
+import sys
+from prometheus_client import REGISTRY, CollectorRegistry, multiprocess
+from app.config import settings
+from app.services import metrics, webhooks
+from .conftest import TestingAsyncSessionLocal
+from .test_webhooks import pending_transaction, session_event, signed
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_request_latency_by_route_template(client):
+    route = "/api/payment-links/{link_code}"
+    before = sample("paylinker_http_request_duration_seconds_count", method="GET", route=route, status="404")
+    unmatched = sample("paylinker_http_request_duration_seconds_count", method="GET", route="<unmatched>", status="404")
+
+    for code in ("nope1", "nope2"):
+        assert client.get(f"/api/payment-links/{code}").status_code == 404
+    client.get("/wp-login.php")
+
+    assert sample("paylinker_http_request_duration_seconds_count", method="GET", route=route, status="404") == before + 2
+    assert sample("paylinker_http_request_duration_seconds_count", method="GET", route="<unmatched>", status="404") == unmatched + 1
+
+
+def test_transaction_and_webhook_counters(client, session, create_payment_link):
+    payment_link = create_payment_link().json()
+    created = sample("paylinker_transactions_created_total", status="success")
+    assert client.post(f"/api/payments/{payment_link['id']}", params={"payment_method": "card"}).status_code == 201
+    assert sample("paylinker_transactions_created_total", status="success") == created + 1
+
+    pending_transaction(session, payment_link)
+    event_type = "checkout.session.completed"
+    applied = sample("paylinker_webhook_events_total", type=event_type, outcome="applied")
+    duplicate = sample("paylinker_webhook_events_total", type=event_type, outcome="duplicate")
+    for _ in range(2):
+        client.post("/api/payments/webhook/", **signed(session_event("evt_metrics", "txn_hook")))
+    asyncio.run(webhooks.process_pending(TestingAsyncSessionLocal))
+    assert sample("paylinker_webhook_events_total", type=event_type, outcome="applied") == applied + 1
+    assert sample("paylinker_webhook_events_total", type=event_type, outcome="duplicate") == duplicate + 1
+
+
+def test_metrics_endpoint(client):
+    res = client.get("/metrics")
+    assert res.status_code == 200
+    assert res.headers["content-type"].startswith("text/plain")
+    for name in ("paylinker_http_request_duration_seconds", "paylinker_stripe_request_duration_seconds", "paylinker_db_pool_checked_out"):
+        assert f"# TYPE {name}" in res.text
+
+
+WORKER = """
+from app.services import metrics
+metrics.transactions_created.labels("pending").inc(3)
+metrics.db_pool_checked_out.inc(2)
+"""
+
+
+def test_multiprocess_aggregation(tmp_path, monkeypatch):
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}
+    for _ in range(2):
+        subprocess.run([sys.executable, "-c", WORKER], env=env, cwd=os.path.dirname(os.path.dirname(__file__)), check=True)
+
+    def scrape():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=str(tmp_path))
+        return registry
+
+    registry = scrape()
+    assert registry.get_sample_value("paylinker_transactions_created_total", {"status": "pending"}) == 6
+    assert registry.get_sample_value("paylinker_db_pool_checked_out") == 4
+
+    # once gunicorn reports a worker gone, its live gauges drop out but its counts stay
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    for gauge_file in tmp_path.glob("gauge_livesum_*.db"):
+        metrics.mark_process_dead(int(gauge_file.stem.rsplit("_", 1)[1]))
+    registry = scrape()
+    assert registry.get_sample_value("paylinker_transactions_created_total", {"status": "pending"}) == 6
+    assert not registry.get_sample_value("paylinker_db_pool_checked_out")
+
+
+def test_metrics_disabled(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "metrics_enabled", False)
+    assert client.get("/metrics").status_code == 404
+
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path), "METRICS_ENABLED": "false"}
+    subprocess.run([sys.executable, "-c", WORKER], env=env, cwd=os.path.dirname(os.path.dirname(__file__)), check=True)
+    assert not list(tmp_path.iterdir())
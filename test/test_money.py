@@ -0,0 +1,27 @@
+from decimal import Decimal
+import pytest
+from app import models
+from app.money import exponent, to_major, to_minor
+
+
+def test_minor_units_follow_the_currency_exponent():
+    assert (exponent("USD"), exponent("jpy"), exponent("KWD")) == (2, 0, 3)
+    assert to_minor(19.99, "USD") == 1999
+    assert to_minor("500", "JPY") == 500
+    assert to_minor(Decimal("1.234"), "KWD") == 1234
+    assert (to_major(1999, "USD"), to_major(500, "JPY"), to_major(1234, "KWD")) == (19.99, 500.0, 1.234)
+
+
+def test_to_minor_rejects_amounts_finer_than_the_currency():
+    assert to_minor(12.50, "USD") == 1250 and to_minor("13.0", "JPY") == 13
+    for amount, currency in ((0.005, "USD"), (12.5, "JPY"), ("1.2345", "KWD")):
+        with pytest.raises(ValueError):
+            to_minor(amount, currency)
+
+
+def test_payment_link_amount_converts_whatever_the_argument_order():
+    link = models.PaymentLink(amount=1250, currency="JPY", user_id=1)
+    assert link.amount_minor == 1250
+    link.currency = "USD"
+    link.amount = 12.5
+    assert (link.amount_minor, link.amount) == (1250, 12.5)
@@ -1,8 +1,10 @@
+import json
 import pytest
-from app import schemas
+from app import models, schemas
 from sqlalchemy.orm import Session
 from jose import jwt
 from app.config import settings
+from app.services import link_cache
 
 def test_create_payment_link(authorized_client):
     response = authorized_client.post("/api/payment-links/", json={
@@ -71,3 +73,100 @@ def test_filter_payment_links_by_currency(authorized_client, create_payment_link
     for link in usd_links:
         assert link["currency"] == "USD"
 
+
+def test_get_payment_link_by_code_is_served_from_cache(authorized_client, create_payment_link):
+    created_link = create_payment_link().json()
+    first = authorized_client.get(f"/api/payment-links/{created_link['link_code']}")
+    hits = link_cache.backend.stats()["hits"]
+    second = authorized_client.get(f"/api/payment-links/{created_link['link_code']}")
+    assert second.json() == first.json()
+    assert link_cache.backend.stats()["hits"] == hits + 1
+
+def test_update_and_delete_invalidate_cached_link(authorized_client, create_payment_link):
+    created_link = create_payment_link().json()
+    code = created_link['link_code']
+    assert authorized_client.get(f"/api/payment-links/{code}").json()["amount"] == 100.0
+
+    authorized_client.put(f"/api/payment-links/{created_link['id']}", json={"amount": 75.0, "currency": "USD", "description": "Test payment link", "expiration_date": None})
+    assert authorized_client.get(f"/api/payment-links/{code}").json()["amount"] == 75.0
+
+    authorized_client.delete(f"/api/payment-links/{created_link['id']}")
+    assert authorized_client.get(f"/api/payment-links/{code}").status_code == 404
+
+
+def test_link_codes_are_unique_and_disjoint_from_legacy(authorized_client, create_payment_link):
+    codes = {create_payment_link().json()["link_code"] for _ in range(5)}
+    assert len(codes) == 5
+    # legacy codes were 6 random characters
+    assert all(len(code) == 7 and code.isalnum() for code in codes)
+
+def test_bulk_create_payment_links(authorized_client, session):
+    items = [{"amount": 10.0 + n, "currency": "USD", "description": f"Item {n}"} for n in range(5)]
+    items[2] = {"amount": "lots", "currency": "USD"}
+    items.append("not a link")
+
+    response = authorized_client.post("/api/payment-links/bulk", json=items)
+    assert response.status_code == 201
+    body = response.json()
+    assert [created["index"] for created in body["created"]] == [0, 1, 3, 4]
+    assert [created["link"]["amount"] for created in body["created"]] == [10.0, 11.0, 13.0, 14.0]
+    assert [error["index"] for error in body["errors"]] == [2, 5]
+    assert body["errors"][0]["errors"][0]["loc"] == ["amount"]
+
+    codes = {created["link"]["link_code"] for created in body["created"]}
+    assert len(codes) == 4 and all(len(code) == 7 for code in codes)
+    assert session.query(models.PaymentLink).count() == 4
+
+def test_bulk_create_payment_links_streams_large_batches(authorized_client, session, monkeypatch):
+    monkeypatch.setattr(settings, "payment_links_bulk_chunk", 3)
+    items = [{"amount": 5.0, "currency": "EUR"} for _ in range(7)] + [{"currency": "EUR"}]
+
+    response = authorized_client.post("/api/payment-links/bulk", json=items)
+    assert response.status_code == 201
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[0]["index"] == 7 and "errors" in lines[0]
+    assert [line["index"] for line in lines[1:]] == list(range(7))
+    assert session.query(models.PaymentLink).count() == 7
+
+def test_bulk_create_rejects_bad_currency_and_amount(authorized_client, session):
+    items = [
+        {"amount": 10.0, "currency": "USDX"},
+        {"amount": 10.0, "currency": "US"},
+        {"amount": -5.0, "currency": "USD"},
+        {"amount": 0, "currency": "USD"},
+        {"amount": float("inf"), "currency": "USD"},
+        {"amount": 10.0, "currency": "usd"},
+    ]
+    response = authorized_client.post("/api/payment-links/bulk", json=items)
+    assert response.status_code == 201
+    body = response.json()
+    assert [created["index"] for created in body["created"]] == [5]
+    assert [(error["index"], error["errors"][0]["loc"]) for error in body["errors"]] == [
+        (0, ["currency"]), (1, ["currency"]), (2, ["amount"]), (3, ["amount"]), (4, ["amount"]),
+    ]
+    assert session.query(models.PaymentLink).count() == 1
+
+def test_amount_finer_than_the_currency_is_rejected(authorized_client, create_payment_link):
+    res = authorized_client.post("/api/payment-links/", json={"amount": 12.5, "currency": "JPY"})
+    assert res.status_code == 422
+    assert "JPY amounts must be whole numbers" in res.json()["detail"][0]["msg"]
+
+    link = create_payment_link().json()
+    res = authorized_client.put(f"/api/payment-links/{link['id']}", json={"amount": 10.005, "currency": "USD", "description": None, "expiration_date": None})
+    assert res.status_code == 422
+    assert authorized_client.get(f"/api/payment-links/get-by-id/{link['id']}").json()["amount_minor"] == link["amount_minor"]
+
+def test_update_rejects_null_amount_or_currency(authorized_client, create_payment_link):
+    link = create_payment_link().json()
+    for amount, currency in ((None, "USD"), (10.0, None)):
+        res = authorized_client.put(f"/api/payment-links/{link['id']}", json={"amount": amount, "currency": currency, "description": None, "expiration_date": None})
+        assert res.status_code == 422
+    assert authorized_client.get(f"/api/payment-links/get-by-id/{link['id']}").json()["amount_minor"] == link["amount_minor"]
+
+def test_bulk_create_payment_links_limits(authorized_client, monkeypatch):
+    monkeypatch.setattr(settings, "payment_links_bulk_max", 2)
+    assert authorized_client.post("/api/payment-links/bulk", json=[{"amount": 1, "currency": "USD"}] * 3).status_code == 413
+    response = authorized_client.post("/api/payment-links/bulk", json=[{"currency": "USD"}])
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["index"] == 0
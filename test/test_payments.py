@@ -1,8 +1,12 @@
+import csv
+import io
+import json
 import pytest
 from app import schemas
 from sqlalchemy.orm import Session
 from jose import jwt
 from app.config import settings
+from app.router.oauth2 import create_access_token
 
 
 def test_create_transaction(authorized_client, create_payment_link, create_transaction):
@@ -35,3 +39,73 @@ def test_filter_transactions_by_status(authorized_client, create_payment_link, c
     
     for transaction in transactions["transactions"]:
         assert transaction["status"] == "success"
+
+
+def test_transactions_keyset_pages(authorized_client, create_payment_link):
+    payment_link = create_payment_link().json()
+    created = [
+        authorized_client.post(f"/api/payments/{payment_link['id']}?payment_method=card").json()["id"]
+        for _ in range(5)
+    ]
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        page = authorized_client.get("/api/payments/transactions", params=params).json()
+        assert len(page["transactions"]) <= 2
+        assert all(t["amount"] == 100.0 and t["currency"] == "USD" for t in page["transactions"])
+        seen += [t["id"] for t in page["transactions"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    # newest first, every row exactly once
+    assert seen == sorted(created, reverse=True)
+
+
+def test_transactions_scoped_to_user(authorized_client, create_payment_link, test_user2):
+    payment_link = create_payment_link().json()
+    authorized_client.post(f"/api/payments/{payment_link['id']}?payment_method=card")
+
+    other_headers = {"Authorization": f"Bearer {create_access_token({'user_id': test_user2['id']})}"}
+    response = authorized_client.get("/api/payments/transactions", headers=other_headers)
+    assert response.status_code == 200
+    assert response.json() == {"transactions": [], "next_cursor": None}
+
+
+def test_transactions_rejects_bad_paging(authorized_client):
+    assert authorized_client.get("/api/payments/transactions?cursor=not-a-cursor").status_code == 400
+    assert authorized_client.get(f"/api/payments/transactions?limit={settings.transactions_page_max + 1}").status_code == 422
+
+
+def test_export_transactions_ndjson(authorized_client, create_payment_link):
+    payment_link = create_payment_link().json()
+    created = [
+        authorized_client.post(f"/api/payments/{payment_link['id']}?payment_method=card").json()["id"]
+        for _ in range(3)
+    ]
+
+    response = authorized_client.get("/api/payments/transactions/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["id"] for row in rows] == created
+    assert rows[0]["amount"] == 100.0 and rows[0]["currency"] == "USD" and rows[0]["status"] == "success"
+
+
+def test_export_transactions_csv_filtered(authorized_client, create_payment_link):
+    payment_link = create_payment_link().json()
+    authorized_client.post(f"/api/payments/{payment_link['id']}?payment_method=card")
+
+    response = authorized_client.get("/api/payments/transactions/export?format=csv&currency=USD")
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert response.headers["content-type"].startswith("text/csv")
+    assert len(rows) == 1 and rows[0]["payment_method"] == "card"
+
+    response = authorized_client.get("/api/payments/transactions/export?format=csv&transaction_status=failure")
+    assert response.text.splitlines() == ["id,transaction_id,payment_method,amount,currency,status,created_at,updated_at"]
+
+    assert authorized_client.get("/api/payments/transactions/export?date=yesterday").status_code == 400
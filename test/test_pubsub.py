@@ -0,0 +1,120 @@
+import asyncio
+import os
+import runpy
+from types import SimpleNamespace
+import pytest
+from app.database import async_engine
+from app.router import dashboard
+from app.services.pubsub import EarningsHub, InMemoryBroker, PostgresBroker, SUBSCRIBER_QUEUE_SIZE, earnings_hub
+
+
+def run_hub(broker, scenario):
+    async def _run():
+        hub = EarningsHub(broker)
+        await hub.start()
+        try:
+            await scenario(hub)
+        finally:
+            await hub.stop()
+    asyncio.run(_run())
+
+
+def test_hub_delivers_only_to_subscribed_user():
+    async def scenario(hub):
+        queue = hub.subscribe(1)
+        other = hub.subscribe(2)
+        await hub.publish(1, "USD", 10000, 3)
+        message = await asyncio.wait_for(queue.get(), timeout=1)
+        assert message == {"user_id": 1, "currency": "USD", "amount_minor": 10000, "version": 3}
+        assert other.empty()
+    run_hub(InMemoryBroker(), scenario)
+
+
+def test_slow_subscriber_gets_resync():
+    async def scenario(hub):
+        queue = hub.subscribe(1)
+        for _ in range(SUBSCRIBER_QUEUE_SIZE + 1):
+            await hub.publish(1, "USD", 100, 1)
+        await asyncio.sleep(0)
+        assert queue.qsize() == 1
+        assert queue.get_nowait() == {"resync": True}
+    run_hub(InMemoryBroker(), scenario)
+
+
+def test_postgres_broker_round_trip():
+    async def scenario(hub):
+        queue = hub.subscribe(7)
+        await hub.publish(7, "EUR", -500, 2)
+        message = await asyncio.wait_for(queue.get(), timeout=5)
+        assert message == {"user_id": 7, "currency": "EUR", "amount_minor": -500, "version": 2}
+        # pooled connections belong to this test's event loop
+        await async_engine.dispose()
+    run_hub(PostgresBroker(channel="earnings_test"), scenario)
+
+
+def test_websocket_sends_initial_snapshot(authorized_client, create_payment_link, test_user):
+    link = create_payment_link().json()
+    authorized_client.post(f"/api/payments/{link['id']}", params={"payment_method": "card"})
+
+    with authorized_client.websocket_connect(f"/api/dashboard/ws/{test_user['id']}") as websocket:
+        assert websocket.receive_json()["total_earnings"] == {"USD": 100.0}
+
+
+def test_websocket_skips_deltas_already_in_snapshot(authorized_client, create_payment_link, test_user, monkeypatch):
+    link = create_payment_link().json()
+    authorized_client.post(f"/api/payments/{link['id']}", params={"payment_method": "card"})
+
+    queues = []
+    subscribe, load = earnings_hub.subscribe, dashboard.load_total_earnings
+    monkeypatch.setattr(earnings_hub, "subscribe", lambda user_id: queues.append(subscribe(user_id)) or queues[-1])
+
+    async def racing_load(db, user_id):
+        totals, version = await load(db, user_id)
+        # the payment already in the snapshot is published only now, followed by one committed after it
+        queues[0].put_nowait({"user_id": user_id, "currency": "USD", "amount_minor": 10000, "version": version})
+        queues[0].put_nowait({"user_id": user_id, "currency": "USD", "amount_minor": 2500, "version": version + 1})
+        return totals, version
+    monkeypatch.setattr(dashboard, "load_total_earnings", racing_load)
+
+    with authorized_client.websocket_connect(f"/api/dashboard/ws/{test_user['id']}") as websocket:
+        assert websocket.receive_json()["total_earnings"] == {"USD": 100.0}
+        assert websocket.receive_json()["total_earnings"] == {"USD": 125.0}
+
+
+def test_websocket_resyncs_after_link_edit_and_delete(authorized_client, create_payment_link, test_user, monkeypatch):
+    link = create_payment_link().json()
+    authorized_client.post(f"/api/payments/{link['id']}", params={"payment_method": "card"})
+
+    # the app's lifespan does not run here: start a fresh hub broker on the socket's event loop
+    monkeypatch.setattr(earnings_hub, "broker", InMemoryBroker())
+    load, started = dashboard.load_total_earnings, []
+
+    async def load_on_started_hub(db, user_id):
+        if not started:
+            await earnings_hub.start()
+            started.append(True)
+        return await load(db, user_id)
+    monkeypatch.setattr(dashboard, "load_total_earnings", load_on_started_hub)
+
+    with authorized_client.websocket_connect(f"/api/dashboard/ws/{test_user['id']}") as websocket:
+        assert websocket.receive_json()["total_earnings"] == {"USD": 100.0}
+        authorized_client.put(f"/api/payment-links/{link['id']}", json={"amount": 75.0, "currency": "EUR", "description": None, "expiration_date": None})
+        assert websocket.receive_json()["total_earnings"] == {"EUR": 75.0}
+        authorized_client.delete(f"/api/payment-links/{link['id']}")
+        assert websocket.receive_json()["total_earnings"] == {}
+
+
+@pytest.mark.parametrize("workers, configured, expected", [(1, None, None), (2, None, "postgres"), (2, "memory", "memory")])
+def test_gunicorn_picks_postgres_backend_for_several_workers(tmp_path, monkeypatch, workers, configured, expected):
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    if configured:
+        monkeypatch.setenv("PUBSUB_BACKEND", configured)
+    else:
+        monkeypatch.delenv("PUBSUB_BACKEND", raising=False)
+    config = runpy.run_path(os.path.join(os.path.dirname(os.path.dirname(__file__)), "gunicorn.conf.py"))
+    warnings = []
+    server = SimpleNamespace(cfg=SimpleNamespace(workers=workers), log=SimpleNamespace(warning=lambda *args: warnings.append(args)))
+
+    config["on_starting"](server)
+    assert os.environ.get("PUBSUB_BACKEND") == expected
+    assert bool(warnings) == (configured == "memory")
@@ -0,0 +1,117 @@
+import asyncio
+import pytest
+from sqlalchemy import event, text
+from app.services import rollups
+from .conftest import TestingAsyncSessionLocal, async_engine
+
+# Tables large enough here that reading them whole would be a regression
+HOT_TABLES = {"payment_links", "transactions", "link_stats", "daily_earnings"}
+
+
+@pytest.fixture
+def seeded(session, test_user):
+    """The test user and 1000 other merchants, each with 10 links and 100 transactions spread over a year"""
+    session.execute(text("""
+        INSERT INTO users (email, password)
+        SELECT 'merchant' || n || '@plans.local', 'x' FROM generate_series(1, 1000) AS n
+    """))
+    session.execute(text("""
+        INSERT INTO payment_links (user_id, amount_minor, currency, link_code, link_url)
+        SELECT u.id, 1000 + 100 * n, (ARRAY['USD', 'EUR', 'GBP'])[1 + n % 3], 'plan' || u.id || '-' || n, 'http://plans'
+        FROM users AS u, generate_series(1, 10) AS n
+    """))
+    session.execute(text("""
+        INSERT INTO transactions (payment_link_id, user_id, transaction_id, status, payment_method, created_at)
+        SELECT pl.id, pl.user_id, 'plan_' || pl.id || '_' || n,
+               (ARRAY['success', 'success', 'success', 'pending', 'failure'])[1 + n % 5], 'card',
+               now() - (n * 17 % 365) * interval '1 day'
+        FROM payment_links AS pl, generate_series(1, 10) AS n
+    """))
+    session.commit()
+
+    async def rebuild_rollups():
+        async with TestingAsyncSessionLocal() as db:
+            await rollups.reconcile_link_stats(db)
+            await rollups.reconcile_daily_earnings(db)
+            await db.commit()
+    asyncio.run(rebuild_rollups())
+    session.execute(text("ANALYZE"))
+    session.commit()
+    return test_user
+
+
+def captured_selects(client, path, **kwargs):
+    """Every SELECT the route sends, with its parameters"""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+    event.listen(async_engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        assert client.get(path, **kwargs).status_code == 200
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", capture)
+    return statements
+
+
+def explain(statements):
+    async def run():
+        async with async_engine.connect() as conn:
+            return [
+                (await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)).scalar()[0]["Plan"]
+                for statement, parameters in statements
+            ]
+    return asyncio.run(run())
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def scans(plans):
+    """(node type, table, index) of every scan in the plans"""
+    return {
+        (node["Node Type"], node.get("Relation Name"), node.get("Index Name"))
+        for plan in plans for node in plan_nodes(plan) if "Relation Name" in node or "Index Name" in node
+    }
+
+
+def assert_no_seq_scans(plans):
+    sequential = {table for node_type, table, _ in scans(plans) if node_type == "Seq Scan" and table in HOT_TABLES}
+    assert not sequential, f"sequential scans on {sorted(sequential)}"
+
+
+def indexes_used(plans):
+    return {index for _, _, index in scans(plans) if index}
+
+
+def test_dashboard_plans(authorized_client, seeded):
+    plans = explain(captured_selects(authorized_client, "/api/dashboard/", params={"period": "last_year"}))
+    assert_no_seq_scans(plans)
+    assert {
+        "ix_transactions_success_payment_link_id",
+        "ix_transactions_user_id_created_at_id",
+        "daily_earnings_pkey",
+    } <= indexes_used(plans)
+
+
+@pytest.mark.parametrize("params, index", [
+    ({}, "ix_transactions_user_id_created_at_id"),
+    ({"transaction_status": "failure"}, "ix_transactions_user_id_status_created_at_id"),
+])
+def test_transaction_listing_plans(authorized_client, seeded, params, index):
+    plans = explain(captured_selects(authorized_client, "/api/payments/transactions", params=params))
+    assert_no_seq_scans(plans)
+    assert index in indexes_used(plans)
+
+
+def test_payment_link_plans(authorized_client, seeded):
+    plans = explain(captured_selects(authorized_client, "/api/payment-links/", params={"currency": "EUR"}))
+    assert_no_seq_scans(plans)
+    assert "ix_payment_links_user_id_currency" in indexes_used(plans)
+
+    plans = explain(captured_selects(authorized_client, "/api/payment-links/plan1-1"))
+    assert "ix_payment_links_link_code" in indexes_used(plans)
@@ -0,0 +1,168 @@
+import asyncio
+from types import SimpleNamespace
+import pytest
+from app import models
+from app.router import payments
+from app.services.stripe_checkout import CheckoutClient, CircuitBreaker
+from bench.stripe_stub import serve
+
+
+@pytest.fixture
+def stripe_stub():
+    server = serve()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def checkout(stripe_stub, monkeypatch):
+    client = CheckoutClient(api_base=stripe_stub.url, timeout=0.5, breaker=CircuitBreaker(2, 60))
+    monkeypatch.setattr(payments, "stripe_checkout", client)
+    return client
+
+
+def test_create_transaction_against_stub(client, session, create_payment_link, stripe_stub, checkout):
+    payment_link = create_payment_link().json()
+
+    res = client.post(f"/api/payments/create-transaction/{payment_link['id']}")
+    assert res.status_code == 201
+    body = res.json()
+    assert body["url"].startswith("https://checkout.stripe.test/")
+
+    [sent] = stripe_stub.requests
+    assert sent["metadata[transaction_id]"] == body["transaction_id"]
+    assert sent["line_items[0][price_data][unit_amount]"] == "10000"
+    assert session.query(models.Transaction).one().status == "pending"
+
+
+def test_stripe_failures_open_the_breaker(client, create_payment_link, stripe_stub, checkout):
+    payment_link = create_payment_link().json()
+    stripe_stub.fail_status = 500
+
+    for _ in range(2):
+        res = client.post(f"/api/payments/create-transaction/{payment_link['id']}")
+        assert res.status_code == 503
+        assert res.headers["Retry-After"]
+    assert checkout.breaker.state == "open"
+
+    # while open, requests fail fast without reaching Stripe
+    assert client.post(f"/api/payments/create-transaction/{payment_link['id']}").status_code == 503
+    assert len(stripe_stub.requests) == 2
+
+
+def test_stripe_timeout_is_unavailable(client, create_payment_link, stripe_stub, checkout):
+    payment_link = create_payment_link().json()
+    stripe_stub.latency = 2
+
+    assert client.post(f"/api/payments/create-transaction/{payment_link['id']}").status_code == 503
+    assert checkout.breaker.failures == 1
+
+
+def test_breaker_half_open_trial():
+    breaker = CircuitBreaker(1, 0)
+    breaker.record_failure()
+    assert breaker.state == "open"
+    # the reset timeout has passed: one trial call, then fail fast until it reports back
+    assert breaker.allow() and breaker.state == "half_open"
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_half_open_trial_settles_on_any_error(monkeypatch):
+    import stripe
+    link = SimpleNamespace(id=1, amount_minor=10000, currency="USD", description="Test payment link")
+    checkout = CheckoutClient(breaker=CircuitBreaker(1, 0))
+    checkout.breaker.record_failure()
+
+    async def refused(params):
+        raise stripe.InvalidRequestError("No such price", "currency")
+
+    async def hangs(params):
+        await asyncio.sleep(10)
+
+    async def trial(send):
+        monkeypatch.setattr(checkout, "_send", send)
+        return await asyncio.wait_for(checkout._create(link, "txn_trial"), 0.1)
+
+    # Stripe answered, so the trial closes the breaker even though the call failed
+    with pytest.raises(stripe.InvalidRequestError):
+        asyncio.run(trial(refused))
+    assert checkout.breaker.state == "closed"
+
+    # a trial given up on counts as a failure and reopens it
+    checkout.breaker.record_failure()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(trial(hangs))
+    assert checkout.breaker.state == "open"
+    assert checkout.breaker.allow()
+
+
+def test_send_works_without_the_v1_namespace(monkeypatch):
+    sent = []
+
+    async def create_async(params):
+        sent.append(params)
+        return SimpleNamespace(url="https://checkout.stripe.test/legacy")
+    # StripeClient before the services moved under .v1
+    legacy = SimpleNamespace(checkout=SimpleNamespace(sessions=SimpleNamespace(create_async=create_async)))
+    checkout = CheckoutClient()
+    monkeypatch.setattr(checkout, "_stripe", lambda: legacy)
+    link = SimpleNamespace(id=1, amount_minor=500, currency="JPY", description="Legacy")
+
+    assert asyncio.run(checkout.create_session(link, "txn_legacy")) == "https://checkout.stripe.test/legacy"
+    assert sent[0]["line_items"][0]["price_data"]["unit_amount"] == 500
+
+
+def test_prefetched_sessions(stripe_stub):
+    link = SimpleNamespace(id=1, amount_minor=10000, currency="USD", description="Test payment link")
+    ids = iter(f"txn_pre_{n}" for n in range(10))
+
+    async def prefetch():
+        checkout = CheckoutClient(api_base=stripe_stub.url, prefetch=2)
+        checkout.refill(link, lambda: next(ids))
+        await asyncio.gather(*checkout._refills.values())
+        assert checkout.stats()["spares"] == 2
+
+        spare = checkout.take_spare(link)
+        assert spare.transaction_id == "txn_pre_0"
+        assert stripe_stub.requests[0]["metadata[transaction_id]"] == "txn_pre_0"
+        assert int(stripe_stub.requests[0]["expires_at"]) == spare.expires_at
+
+        # a spare made before the link's amount changed is never handed out
+        link.amount_minor = 25000
+        assert checkout.take_spare(link) is None
+        await checkout.close()
+
+    asyncio.run(prefetch())
+
+
+def test_refill_stops_for_a_link_stripe_refuses(monkeypatch):
+    import stripe
+    link = SimpleNamespace(id=1, amount_minor=10000, currency="XXX", description="Refused")
+    ids = iter(f"txn_refused_{n}" for n in range(10))
+    calls = []
+
+    async def refused(params):
+        calls.append(params)
+        raise stripe.InvalidRequestError("Invalid currency: xxx", "currency")
+
+    async def refill_twice():
+        checkout = CheckoutClient(prefetch=2)
+        monkeypatch.setattr(checkout, "_send", refused)
+        for _ in range(2):
+            checkout.refill(link, lambda: next(ids))
+            await asyncio.gather(*checkout._refills.values())
+        assert len(calls) == 1
+
+        # once the link changes, it is tried again
+        link.currency = "USD"
+        checkout.refill(link, lambda: next(ids))
+        await asyncio.gather(*checkout._refills.values())
+        assert len(calls) == 2
+
+    asyncio.run(refill_twice())
@@ -0,0 +1,137 @@
+import asyncio
+import json
+import stripe
+from app import models
+from app.config import settings
+from app.services import webhooks
+from .conftest import TestingAsyncSessionLocal
+
+
+def signed(event):
+    payload = json.dumps(event)
+    header = stripe.WebhookSignature.generate_signature_header(payload, settings.stripe_webhook_secret)
+    return {"content": payload, "headers": {"Stripe-Signature": header, "Content-Type": "application/json"}}
+
+
+def session_event(event_id, transaction_id, event_type="checkout.session.completed"):
+    return {
+        "id": event_id,
+        "object": "event",
+        "type": event_type,
+        "data": {"object": {"object": "checkout.session", "metadata": {"transaction_id": transaction_id}}},
+    }
+
+
+def pending_transaction(session, payment_link, transaction_id="txn_hook"):
+    transaction = models.Transaction(
+        payment_link_id=payment_link["id"], user_id=payment_link["user_id"], transaction_id=transaction_id, status="pending"
+    )
+    session.add(transaction)
+    session.commit()
+    return transaction
+
+
+def test_webhook_acks_then_worker_applies(client, session, create_payment_link):
+    payment_link = create_payment_link().json()
+    pending_transaction(session, payment_link)
+
+    res = client.post("/api/payments/webhook/", **signed(session_event("evt_1", "txn_hook")))
+    assert res.status_code == 200
+    # acked but not applied yet
+    assert session.query(models.Transaction).one().status == "pending"
+
+    assert asyncio.run(webhooks.process_pending(TestingAsyncSessionLocal)) == 1
+    session.expire_all()
+    transaction = session.query(models.Transaction).one()
+    assert transaction.status == "success" and transaction.payment_method == "credit_card"
+    assert session.get(models.LinkStats, payment_link["id"]).successful_transactions == 1
+    assert session.get(models.StripeEvent, "evt_1").processed_at is not None
+    assert asyncio.run(webhooks.process_pending(TestingAsyncSessionLocal)) == 0
+
+
+def test_webhook_deduplicates_redeliveries(client, session, create_payment_link):
+    payment_link = create_payment_link().json()
+    pending_transaction(session, payment_link)
+
+    for _ in range(3):
+        assert client.post("/api/payments/webhook/", **signed(session_event("evt_1", "txn_hook"))).status_code == 200
+    assert session.query(models.StripeEvent).count() == 1
+
+    asyncio.run(webhooks.process_pending(TestingAsyncSessionLocal))
+    # a redelivery after processing is still ignored
+    assert client.post("/api/payments/webhook/", **signed(session_event("evt_1", "txn_hook"))).status_code == 200
+    assert asyncio.run(webhooks.process_pending(TestingAsyncSessionLocal)) == 0
+    assert session.get(models.LinkStats, payment_link["id"]).successful_transactions == 1
+
+
+def test_webhook_batch_keeps_last_event_per_transaction(client, session, create_payment_link):
+    payment_link = create_payment_link().json()
+    pending_transaction(session, payment_link)
+
+    client.post("/api/payments/webhook/", **signed(session_event("evt_1", "txn_hook")))
+    client.post("/api/payments/webhook/", **signed(session_event("evt_2", "txn_hook", "checkout.session.async_payment_failed")))
+    client.post("/api/payments/webhook/", **signed(session_event("evt_3", "txn_missing")))
+
+    assert asyncio.run(webhooks.process_pending(TestingAsyncSessionLocal)) == 3
+    session.expire_all()
+    assert session.query(models.Transaction).one().status == "failure"
+    stats = session.get(models.LinkStats, payment_link["id"])
+    assert (stats.successful_transactions, stats.failed_transactions) == (0, 1)
+    outcomes = dict(session.query(models.StripeEvent.id, models.StripeEvent.outcome))
+    assert outcomes == {"evt_1": "superseded", "evt_2": "applied", "evt_3": "not_found"}
+
+
+def test_webhook_outcomes_for_repeats_and_other_events(client, session, create_payment_link):
+    payment_link = create_payment_link().json()
+    pending_transaction(session, payment_link)
+
+    client.post("/api/payments/webhook/", **signed(session_event("evt_1", "txn_hook")))
+    asyncio.run(webhooks.process_pending(TestingAsyncSessionLocal))
+    # a distinct event settling the transaction to the status it already has
+    client.post("/api/payments/webhook/", **signed(session_event("evt_2", "txn_hook")))
+    client.post("/api/payments/webhook/", **signed(session_event("evt_3", "txn_hook", "charge.refund.updated")))
+    asyncio.run(webhooks.process_pending(TestingAsyncSessionLocal))
+
+    outcomes = dict(session.query(models.StripeEvent.id, models.StripeEvent.outcome))
+    assert outcomes == {"evt_1": "applied", "evt_2": "unchanged", "evt_3": "ignored"}
+    # the repeat did not count the payment twice
+    assert session.get(models.LinkStats, payment_link["id"]).successful_transactions == 1
+
+
+def test_worker_collects_a_burst_into_one_batch(client, session, create_payment_link, monkeypatch):
+    payment_link = create_payment_link().json()
+    for n in range(3):
+        pending_transaction(session, payment_link, f"txn_{n}")
+
+    taken = []
+    process_pending = webhooks.process_pending
+
+    async def recording_process_pending(session_factory, limit):
+        taken.append(await process_pending(session_factory, limit))
+        return taken[-1]
+    monkeypatch.setattr(webhooks, "process_pending", recording_process_pending)
+
+    async def burst():
+        # a long window, so only a full batch can end it within the test
+        worker = webhooks.WebhookWorker(TestingAsyncSessionLocal, batch_size=3, poll_interval=60, batch_window=60)
+        await worker.start()
+        await asyncio.sleep(0.1)
+        for n in range(3):
+            async with TestingAsyncSessionLocal() as db:
+                await webhooks.ingest(db, session_event(f"evt_{n}", f"txn_{n}"))
+            worker.wake()
+        await asyncio.sleep(0.2)
+        await worker.stop()
+
+    asyncio.run(burst())
+    assert taken[:2] == [0, 3]
+
+
+def test_webhook_rejects_bad_signature(client, session):
+    request = signed(session_event("evt_1", "txn_hook"))
+    request["headers"]["Stripe-Signature"] = "t=1,v1=deadbeef"
+    assert client.post("/api/payments/webhook/", **request).status_code == 400
+
+    del request["headers"]["Stripe-Signature"]
+    assert client.post("/api/payments/webhook/", **request).status_code == 400
+    assert session.query(models.StripeEvent).count() == 0